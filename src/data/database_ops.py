@@ -11,14 +11,20 @@ def get_matches_by_id(match_ids, path):
     """
     Returns match data for each match_id in the list match_ids
     """
+    return list(iter_matches_by_id(match_ids, path))
+
+def iter_matches_by_id(match_ids, path):
+    """
+    Generator version of get_matches_by_id(). Match data is read from the database one match at a time as it is requested,
+    so only the matches currently in use are held in memory.
+    """
     conn = sqlite3.connect(path)
     cur = conn.cursor()
-    match_data = []
-    for match_id in match_ids:
-        match = get_match_data(cur, match_id)
-        match_data.append(match)
-    conn.close()
-    return match_data
+    try:
+        for match_id in match_ids:
+            yield get_match_data(cur, match_id)
+    finally:
+        conn.close()
 
 def get_game_ids_by_tournament(cursor, tournament, patch=None):
     """
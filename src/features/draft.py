@@ -1,3 +1,9 @@
+import itertools
+import json
+from math import factorial
+
+import numpy as np
+
 class Draft(object):
     BLUE_TEAM = 0
     RED_TEAM = 1
@@ -51,7 +57,12 @@ class Draft(object):
                         'no_bans': no_bans,
     }
 
+    # Labels used for teams and phases in draft structure files
+    TEAM_LABELS = {"blue":BLUE_TEAM, "red":RED_TEAM}
+    PHASE_LABELS = {"ban":BAN, "pick":PICK}
+
     def __init__(self, draft_type = 'default'):
+        self.draft_type = draft_type
         self._draft_structure = None
         try:
             self._draft_structure = Draft.draft_structures[draft_type]
@@ -77,6 +88,7 @@ class Draft(object):
         self.PHASE_LENGTHS[current_phase].append(phase_length) # don't forget last phase
         self.NUM_BANS = sum(self.PHASE_LENGTHS[Draft.BAN]) # Total number of bans in draft
         self.NUM_PICKS = sum(self.PHASE_LENGTHS[Draft.PICK]) # Total number of picks in draft
+        self.num_submissions = len(self._draft_structure)
 
         # submission_dist[k] gives tuple of counts for pick types just before kth submission is made (last element will hold final submission distribution for draft)
         self.submission_dist = [(0,0,0)]
@@ -90,6 +102,126 @@ class Draft(object):
                 next_dist = (cur_ban, cur_blue, cur_red+1)
             self.submission_dist += [next_dist]
 
+        self._compile()
+
+    def _compile(self):
+        """
+        Compiles the draft structure into lookup tables indexed by submission count k (0 <= k <= num_submissions):
+            team_table[k] -> team making submission k (-1 once the draft is complete)
+            phase_table[k] -> phase of submission k (0 once the draft is complete)
+            ban_index_table[k] -> index of submission k in the submitting team's list of bans (-1 for picks)
+            pick_index_table[k] -> index of submission k in the submitting team's list of picks (-1 for bans)
+            submission_dist_table[k] -> (ban, blue pick, red pick) counts just before submission k is made
+            augment_group_table[k] -> id of the group of interchangeable submissions that submission k belongs to (k < num_submissions)
+        Submissions are interchangeable if reordering them does not affect the draft as a whole. These are bans by the same team in
+        the same ban phase and runs of consecutive picks by the same team.
+        The tuples _active_teams and _active_phases hold the same information as team_table and phase_table (with None once the draft is complete)
+        for fast scalar lookups.
+        """
+        n = self.num_submissions
+        team_table = np.full(n+1, -1, dtype=np.int64)
+        phase_table = np.zeros(n+1, dtype=np.int64)
+        ban_index_table = np.full(n+1, -1, dtype=np.int64)
+        pick_index_table = np.full(n+1, -1, dtype=np.int64)
+        augment_group_table = np.zeros(n, dtype=np.int64)
+        counts = {(team, phase):0 for team in Draft.TEAM_LABELS.values() for phase in Draft.PHASES}
+        groups = {}
+        phase_block = 0
+        for (k, (team, phase)) in enumerate(self._draft_structure):
+            team_table[k] = team
+            phase_table[k] = phase
+            index_table = ban_index_table if phase == Draft.BAN else pick_index_table
+            index_table[k] = counts[(team, phase)]
+            counts[(team, phase)] += 1
+
+            if k > 0 and phase != phase_table[k-1]:
+                phase_block += 1
+            if phase == Draft.BAN:
+                augment_group_table[k] = groups.setdefault((phase_block, team), len(groups))
+            elif k > 0 and phase_table[k-1] == Draft.PICK and team_table[k-1] == team:
+                augment_group_table[k] = augment_group_table[k-1]
+            else:
+                augment_group_table[k] = groups.setdefault((phase_block, team, k), len(groups))
+
+        self.team_table = team_table
+        self.phase_table = phase_table
+        self.ban_index_table = ban_index_table
+        self.pick_index_table = pick_index_table
+        self.submission_dist_table = np.array(self.submission_dist, dtype=np.int64)
+        self.augment_group_table = augment_group_table
+        for table in [self.team_table, self.phase_table, self.ban_index_table, self.pick_index_table, self.submission_dist_table,
+                      self.augment_group_table]:
+            table.flags.writeable = False
+
+        # Every reordering of the interchangeable submissions is given an augmentation id (see augment_table)
+        group_sizes = np.bincount(augment_group_table)
+        self.num_augmentations = int(np.prod([factorial(size) for size in group_sizes]))
+        self._augment_table = None
+
+        self._active_teams = tuple(team for (team, phase) in self._draft_structure) + (None,)
+        self._active_phases = tuple(phase for (team, phase) in self._draft_structure) + (None,)
+
+    @property
+    def augment_table(self):
+        """
+        (num_augmentations, num_submissions) array enumerating every reordering of the interchangeable submissions in the draft.
+        Row a is the order for augmentation id a: augment_table[a,k] is the submission of the original draft which is made at step k.
+        Augmentation id 0 is the original order. The table is built the first time it is requested.
+        """
+        if self._augment_table is None:
+            table = np.arange(self.num_submissions)[None,:]
+            for group in range(self.augment_group_table.max()+1 if self.num_submissions else 0):
+                group_steps = np.nonzero(self.augment_group_table == group)[0]
+                orders = np.array(list(itertools.permutations(group_steps)), dtype=np.int64)
+                # Augmentation ids count through the orders of the last group fastest
+                table = np.repeat(table, len(orders), axis=0)
+                table[:, group_steps] = np.tile(orders, (len(table)//len(orders), 1))
+            table.flags.writeable = False
+            self._augment_table = table
+        return self._augment_table
+
+    @classmethod
+    def register_draft_structure(cls, draft_type, structure):
+        """
+        Adds a draft structure to the set of structures Drafts can be built from.
+        Args:
+            draft_type (string): label for the draft structure
+            structure (list(tuple)): ordered list of (team, phase) submissions. team may be given as Draft.BLUE_TEAM/Draft.RED_TEAM
+                or "blue"/"red" and phase may be given as Draft.BAN/Draft.PICK or "ban"/"pick".
+        Returns:
+            None
+        """
+        compiled = []
+        for (team, phase) in structure:
+            team = Draft.TEAM_LABELS.get(team, team)
+            phase = Draft.PHASE_LABELS.get(phase, phase)
+            if team not in Draft.TEAM_LABELS.values() or phase not in Draft.PHASES:
+                raise ValueError("In draft.py: Invalid submission ({}, {}) in draft structure {}".format(team, phase, draft_type))
+            compiled.append((team, phase))
+        cls.draft_structures[draft_type] = compiled
+
+    @classmethod
+    def load_draft_structures(cls, path):
+        """
+        Loads draft structures from a JSON or YAML file and registers them (see register_draft_structure()). The file should contain
+        a mapping from draft labels to ordered lists of [team, phase] submissions, for example:
+            {"blind_bans": [["blue", "ban"], ["red", "ban"], ["blue", "pick"], ["red", "pick"]]}
+        YAML files (.yaml or .yml) require PyYAML to be installed.
+        Args:
+            path (string): path to draft structure file
+        Returns:
+            draft_types (list(string)): labels of the loaded draft structures
+        """
+        with open(path, 'r') as infile:
+            if path.endswith((".yaml", ".yml")):
+                import yaml
+                data = yaml.safe_load(infile)
+            else:
+                data = json.load(infile)
+        for (draft_type, structure) in data.items():
+            cls.register_draft_structure(draft_type, structure)
+        return list(data.keys())
+
     def get_active_team(self, submission_count):
         """
         Gets the active team in the draft based on the number of submissions currently present
@@ -98,27 +230,21 @@ class Draft(object):
         Returns:
             Draft.BLUE_TEAM if blue is active, else Draft.RED_TEAM
         """
-        if submission_count > len(self._draft_structure):
-            raise
-        elif submission_count == len(self._draft_structure):
-            return None
-        (team, sub_type) = self._draft_structure[submission_count]
-        return team
+        if submission_count > self.num_submissions:
+            raise IndexError("In draft.py: submission count {} exceeds draft length".format(submission_count))
+        return self._active_teams[submission_count]
 
     def get_active_phase(self, submission_count):
         """
         Returns phase identifier for current phase of the draft based on the number of submissions made.
         Args:
-            None
+            submission_count (int): number of submissions currently submitted to draft
         Returns:
             Draft.BAN if state is in banning phase, otherwise Draft.PICK
         """
-        if submission_count > len(self._draft_structure):
-            raise
-        elif submission_count == len(self._draft_structure):
-            return None
-        (team, sub_type) = self._draft_structure[submission_count]
-        return sub_type
+        if submission_count > self.num_submissions:
+            raise IndexError("In draft.py: submission count {} exceeds draft length".format(submission_count))
+        return self._active_phases[submission_count]
 
 if __name__ == "__main__":
     draft = Draft("default")
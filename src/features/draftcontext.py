@@ -0,0 +1,177 @@
+from types import MappingProxyType
+
+import numpy as np
+from .draft import Draft
+
+class DraftContext(object):
+    """
+    Args:
+        champ_ids (list(int)) : list of valid championids which are available for drafting.
+        draft_type (string) : label of the draft structure used (see Draft.draft_structures)
+        num_positions (int) : number of available positions to draft for.
+
+    DraftContext holds the static lookup tables that describe how a draft is laid out: the mapping between champion ids and
+    state indices, the mapping between position labels and state columns and the Draft structure itself.
+    These never change over the course of a draft, so rather than have each DraftState build (and copy) its own versions,
+    a single immutable DraftContext is shared by every state with the same (champ_ids, draft_type, num_positions).
+
+    DraftContexts should be obtained through DraftContext.get() which caches one instance per key. Copying or pickling a context
+    returns the cached instance rather than a duplicate.
+
+    Tables (all arrays are read-only):
+        champ_ids[i] -> champion id for state index i
+        champ_id_to_state_index_table[cid] -> state index for champion id cid (-1 if cid is not draftable)
+        positions[k] -> position label for position index k
+        pos_to_pos_index_table[pos+1] -> position index into the state matrix for position label pos
+        pos_index_to_pos_table[k] -> position label for column k of the state matrix
+        phase_table[n] -> active phase (Draft.BAN or Draft.PICK) after n submissions
+        submission_dist_table[n] -> (ban, blue pick, red pick) counts after n submissions
+        action_champ_ids[a], action_positions[a] -> (champion id, position) submission for action a
+        position_to_action_column[pos+1] -> column of the actionable state for position label pos
+        zobrist_keys[i,k,team] -> hash key for state index i occupying column k when drafting for team
+    """
+    _cache = {}
+    ZOBRIST_SEED = 20180417
+
+    @classmethod
+    def get(cls, champ_ids, draft_type="default", num_positions=5):
+        """
+        Returns the shared DraftContext for the given champion ids, draft type and number of positions, building it if needed.
+        Args:
+            champ_ids (list(int)): list of valid championids which are available for drafting.
+            draft_type (string): label of the draft structure used
+            num_positions (int): number of available positions to draft for
+        Returns:
+            context (DraftContext): cached context
+        """
+        key = (tuple(champ_ids), draft_type, num_positions)
+        context = cls._cache.get(key)
+        if context is None:
+            context = cls(*key)
+            cls._cache[key] = context
+        return context
+
+    def __init__(self, champ_ids, draft_type="default", num_positions=5):
+        champ_ids = tuple(champ_ids)
+        self.key = (champ_ids, draft_type, num_positions)
+        self.num_champions = len(champ_ids)
+        self.num_positions = num_positions
+        self.num_columns = num_positions+2
+        self.num_actions = (num_positions+1)*self.num_champions
+        self.draft = Draft(draft_type)
+
+        # Champion id <-> state index mappings. The dicts are kept for fast scalar lookups, the arrays for vectorized lookups.
+        self.state_index_to_champ_id = MappingProxyType({i:k for i,k in enumerate(champ_ids)})
+        self.champ_id_to_state_index = MappingProxyType({k:i for i,k in enumerate(champ_ids)})
+        self.champ_ids = self._freeze(np.array(champ_ids, dtype=np.int64))
+        table = np.full(max(champ_ids, default=-1)+1, -1, dtype=np.int64)
+        table[self.champ_ids] = np.arange(self.num_champions)
+        self.champ_id_to_state_index_table = self._freeze(table)
+
+        # Mapping from position labels to indices to the state matrix and vice versa.
+        # Note that enemy picks (position 0) occupy the first column of the state matrix so that
+        # the 'actionable state' (the columns we can submit to) is the contiguous block state[:,1:].
+        self.positions = self._freeze(np.arange(-1, num_positions+1))
+        pos_indices = [1,0]
+        pos_indices.extend(range(2,num_positions+2))
+        self.pos_indices = self._freeze(np.array(pos_indices, dtype=np.int64))
+        self.pos_to_pos_index = MappingProxyType(dict(zip(self.positions.tolist(), pos_indices)))
+        self.pos_index_to_pos = MappingProxyType(dict(zip(pos_indices, self.positions.tolist())))
+        # Since positions start at -1, the position index for label pos is pos_to_pos_index_table[pos+1]
+        self.pos_to_pos_index_table = self.pos_indices
+        table = np.empty(self.num_columns, dtype=np.int64)
+        table[self.pos_indices] = self.positions
+        self.pos_index_to_pos_table = self._freeze(table)
+
+        # Active phase and submission distribution indexed by submission count (compiled by Draft). The phase after the final submission is 0.
+        self.num_steps = self.draft.num_submissions
+        self.phase_table = self.draft.phase_table
+        self.submission_dist_table = self.draft.submission_dist_table
+
+        # Action decode/encode tables. Actions index the flattened 'actionable state' matrix, which is the state matrix with the
+        # enemy picks column removed (ie state[:,1:]), so action a corresponds to state index a // (num_positions+1)
+        # and actionable column a % (num_positions+1).
+        self.action_champ_ids = self._freeze(np.repeat(self.champ_ids, num_positions+1))
+        self.action_positions = self._freeze(np.tile(self.pos_index_to_pos_table[1:], self.num_champions))
+        # Actionable column for position label pos is position_to_action_column[pos+1] (-1 for enemy picks, which are not actionable)
+        table = self.pos_to_pos_index_table - 1
+        table[1] = -1
+        self.position_to_action_column = self._freeze(table)
+
+        # Zobrist keys used to hash draft states. A state's hash is the XOR of the key for its team perspective, the key for each
+        # (state index, state column, team) that it has submitted and a key for each NULL ban. The keys are drawn from a fixed seed
+        # so that hashes are reproducible between runs and processes.
+        rng = np.random.RandomState(DraftContext.ZOBRIST_SEED)
+        def random_keys(shape):
+            return np.frombuffer(rng.bytes(8*int(np.prod(shape))), dtype=np.uint64).reshape(shape).copy()
+        self.zobrist_keys = self._freeze(random_keys((self.num_champions, self.num_columns, 2)))
+        self.zobrist_team_keys = self._freeze(random_keys((2,)))
+        self.zobrist_null_ban_keys = self._freeze(random_keys((self.draft.NUM_BANS+1,)))
+        # zobrist_null_ban_prefix[m] is the combined key for m NULL bans (m <= NUM_BANS+1)
+        self.zobrist_null_ban_prefix = self._freeze(np.concatenate([np.zeros(1, dtype=np.uint64), np.bitwise_xor.accumulate(self.zobrist_null_ban_keys)]))
+
+        # Sparse state encodings list the flattened state indices of each submission, padded to a fixed length with pad_index
+        self.state_size = self.num_champions*self.num_columns
+        self.sparse_state_size = self.num_steps
+        self.pad_index = self.state_size
+
+    def as_champion_ids(self, champion_ids):
+        """
+        Converts a sequence of champion ids, which may include None for NULL submissions, into an integer array with NULL submissions given as -1.
+        """
+        champion_ids = np.asarray(champion_ids)
+        if(champion_ids.dtype == object):
+            champion_ids = np.where(champion_ids == None, -1, champion_ids)
+        return champion_ids.astype(np.int64)
+
+    def get_state_indices(self, champion_ids):
+        """
+        Vectorized lookup of the state index for each champion id. Ids which are not draftable give -1.
+        """
+        champion_ids = self.as_champion_ids(champion_ids)
+        table = self.champ_id_to_state_index_table
+        in_table = (champion_ids >= 0) & (champion_ids < len(table))
+        return np.where(in_table, table[np.where(in_table, champion_ids, 0)], -1)
+
+    def decode_actions(self, action_ids):
+        """
+        Vectorized translation of actions into the (champion_id, position) submissions they describe.
+        Args:
+            action_ids (array(int)): indices of the flattened 'actionable state' matrix
+        Returns:
+            (champion_ids, positions) (tuple of arrays): submission for each action. Positions are never 0 (enemy picks are not actionable).
+        """
+        action_ids = np.asarray(action_ids, dtype=np.int64)
+        if(np.any((action_ids < 0) | (action_ids >= self.num_actions))):
+            raise ValueError("Invalid action to decode_actions()!")
+        return (self.action_champ_ids[action_ids], self.action_positions[action_ids])
+
+    def encode_actions(self, champion_ids, positions):
+        """
+        Vectorized translation of (champion_id, position) submissions into actions.
+        Args:
+            champion_ids (array(int)): ids of submitted champions
+            positions (array(int)): positions of submitted champions (-1 for bans)
+        Returns:
+            action_ids (array(int)): index of each submission in the flattened 'actionable state' matrix, or -1 if no such action exists
+        """
+        state_indices = self.get_state_indices(champion_ids)
+        positions = np.asarray(positions, dtype=np.int64)
+        in_range = (positions >= -1) & (positions <= self.num_positions)
+        columns = np.where(in_range, self.position_to_action_column[np.where(in_range, positions+1, 0)], -1)
+        actions = state_indices*(self.num_positions+1) + columns
+        return np.where((state_indices >= 0) & (columns >= 0), actions, -1)
+
+    @staticmethod
+    def _freeze(array):
+        array.flags.writeable = False
+        return array
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (DraftContext.get, self.key)
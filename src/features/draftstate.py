@@ -1,6 +1,7 @@
 import numpy as np
-from data.champion_info import champion_name_from_id, valid_champion_id, get_champion_ids
+from data.champion_info import champion_name_from_id, get_champion_ids
 from .draft import Draft
+from .draftcontext import DraftContext
 
 class InvalidDraftState(Exception):
     pass
@@ -18,11 +19,16 @@ class DraftState:
         - c is selected as part of the opponent's team.
         - c is selected as one of our team's position.
 
-     The state of the draft will be stored as a (numChampions) x (numRoles+2) numPy array. If state(c,k) = 1 then:
+     The state of the draft is presented to the network as a (numChampions) x (numRoles+2) numPy array. If state(c,k) = 1 then:
         - k = 0 -> champion c is banned from selection.
         - k = 1 -> champion c is selected as part of the enemy team.
         - 2 <= k = num_positions+1 -> champion c is selected as position k-1 in our draft.
 
+    Internally the draft is not stored in this dense form. Instead each column of the state is kept as a packed integer bitset
+    (bit c is set if state index c occupies that column) along with running submission counters which are maintained by update().
+    This makes evaluate(), can_pick() and can_ban() constant time. The dense array is only built when it is requested
+    through the state property or format_state().
+
     Default draft positions are interpreted as:
         Position 1 -> ADC/Marksman (Primary farm)
         Position 2 -> Middle (Secondary farm)
@@ -48,29 +54,64 @@ class DraftState:
 
     def __init__(self, team, champ_ids = get_champion_ids(), num_positions = 5, draft = Draft('default')):
         #TODO (Devin): This should make sure that numChampions >= num_positions
-        self.num_champions = len(champ_ids)
-        self.num_positions = num_positions
-        self.num_actions = (self.num_positions+1)*self.num_champions
-        self.state_index_to_champ_id = {i:k for i,k in zip(range(self.num_champions),champ_ids)}
-        self.champ_id_to_state_index = {k:i for i,k in zip(range(self.num_champions),champ_ids)}
-        self.state = np.zeros((self.num_champions, self.num_positions+2), dtype=bool)
+        # All static lookup tables live in a DraftContext which is shared between every state with the same
+        # champion pool, draft structure and number of positions. The state itself only holds submission data.
+        self.context = DraftContext.get(champ_ids, draft.draft_type, num_positions)
         self.picks = []
         self.bans = []
         self.selected_pos = []
 
         self.team = team
-        self.draft_structure = draft
-        # Get phase information from draft
-        self.BAN_PHASE_LENGTHS = self.draft_structure.PHASE_LENGTHS[DraftState.BAN_PHASE]
-        self.PICK_PHASE_LENGTHS = self.draft_structure.PHASE_LENGTHS[DraftState.PICK_PHASE]
-
-        # The dicts pos_to_pos_index and pos_index_to_pos contain the mapping
-        # from position labels to indices to the state matrix and vice versa.
-        self.positions = [i-1 for i in range(num_positions+2)]
-        self.pos_indices = [1,0]
-        self.pos_indices.extend(range(2,num_positions+2))
-        self.pos_to_pos_index = dict(zip(self.positions,self.pos_indices))
-        self.pos_index_to_pos = dict(zip(self.pos_indices,self.positions))
+
+        self._reset_bitboards()
+
+    @property
+    def num_champions(self):
+        return self.context.num_champions
+
+    @property
+    def num_positions(self):
+        return self.context.num_positions
+
+    @property
+    def num_actions(self):
+        return self.context.num_actions
+
+    @property
+    def draft_structure(self):
+        return self.context.draft
+
+    @property
+    def BAN_PHASE_LENGTHS(self):
+        return self.draft_structure.PHASE_LENGTHS[DraftState.BAN_PHASE]
+
+    @property
+    def PICK_PHASE_LENGTHS(self):
+        return self.draft_structure.PHASE_LENGTHS[DraftState.PICK_PHASE]
+
+    @property
+    def state_index_to_champ_id(self):
+        return self.context.state_index_to_champ_id
+
+    @property
+    def champ_id_to_state_index(self):
+        return self.context.champ_id_to_state_index
+
+    @property
+    def positions(self):
+        return self.context.positions
+
+    @property
+    def pos_indices(self):
+        return self.context.pos_indices
+
+    @property
+    def pos_to_pos_index(self):
+        return self.context.pos_to_pos_index
+
+    @property
+    def pos_index_to_pos(self):
+        return self.context.pos_index_to_pos
 
     def reset(self):
         """
@@ -80,16 +121,110 @@ class DraftState:
         Returns:
             None
         """
-        self.state[:] = False
         self.picks = []
         self.bans = []
         self.selected_pos = []
+        self._reset_bitboards()
+
+    def _reset_bitboards(self):
+        """
+        Clears the packed bitsets, submission counters and validity flags used to track the draft.
+        """
+        # Bitsets over state indices for each column of the state matrix
+        self._ban_bits = 0
+        self._enemy_bits = 0
+        self._role_bits = [0]*self.num_positions
+        # Union of all picked champions (either team), used by can_pick()
+        self._pick_bits = 0
+
+        # Running submission counters
+        self._num_bans = 0
+        self._num_picks = 0
+        self._num_enemy_picks = 0
+        self._num_null_bans = 0
+
+        # Incremental Zobrist hash of the state (see zobrist_hash)
+        self._hash = int(self.context.zobrist_team_keys[self.team])
+
+        # Sticky flags for invalid submissions, these are checked by evaluate() in order of precedence
+        self._duplicate_submission = False
+        self._ban_and_submission = False
+        self._duplicate_role = False
+
+        # Flattened (state_index, pos_index) locations of each submission. Used to build the dense state on demand.
+        self._cells = []
+
+        # Actionable mask (the state matrix with the enemy picks column removed) which is kept up to date by update().
+        # Rows are cleared as champions are submitted and columns are flipped as the draft changes phase.
+        self._champ_available = np.ones(self.num_champions, dtype=bool)
+        self._valid_actions = np.zeros((self.num_champions, self.num_positions+1), dtype=bool)
+        self._active_phase = None
+        self._update_active_phase()
+
+        # Flag indicating that the mutable containers above may be shared with a snapshot (see snapshot())
+        self._shared = False
+
+    def snapshot(self):
+        """
+        Returns a persistent snapshot of the current state. The snapshot shares its submission lists and
+        actionable mask with this state rather than copying them. Whichever of the two states is updated next
+        makes a private copy of these before modifying them (copy-on-write), so neither
+        state is affected by updates to the other. This is much cheaper than deepcopy(state).
+        Args:
+            None
+        Returns:
+            snapshot (DraftState): copy of the current state
+        """
+        snapshot = object.__new__(DraftState)
+        snapshot.__dict__.update(self.__dict__)
+        self._shared = True
+        snapshot._shared = True
+        return snapshot
+
+    def with_submission(self, champion_id, position):
+        """
+        Returns a snapshot of the current state with the submission (champion_id, position) applied to it. The current state is unchanged.
+        If the submission is rejected by update() the returned state is an unmodified snapshot.
+        Args:
+            champion_id (int): Id of champion to submit.
+            position (int): Position of submission (see update())
+        Returns:
+            next_state (DraftState): updated snapshot
+        """
+        next_state = self.snapshot()
+        next_state.update(champion_id, position)
+        return next_state
+
+    def _own_buffers(self):
+        """
+        Makes private copies of any mutable containers that are shared with a snapshot before they are modified.
+        """
+        if not self._shared:
+            return
+        self.picks = self.picks[:]
+        self.bans = self.bans[:]
+        self.selected_pos = self.selected_pos[:]
+        self._role_bits = self._role_bits[:]
+        self._cells = self._cells[:]
+        self._champ_available = self._champ_available.copy()
+        self._valid_actions = self._valid_actions.copy()
+        self._shared = False
+
+    @property
+    def state(self):
+        """
+        Dense (num_champions, num_positions+2) boolean representation of the draft. This is built from the
+        recorded submissions each time it is accessed, so modifying the returned array has no effect on the draft.
+        """
+        state = np.zeros(self.num_champions*(self.num_positions+2), dtype=bool)
+        state[self._cells] = True
+        return state.reshape(self.num_champions, self.num_positions+2)
 
     def get_valid_actions(self, form="mask"):
         """
         Returns a valid actions for the current state.
         Input:
-            self.state
+            self.valid_actions
             form (string): default returns actions as a mask. "list" returns actions as a list of ids
         Returns:
             action_ids (list[bool/int]): valid actions that can be taken from state. If form = "list" ids are returned as a list of action_ids,
@@ -102,25 +237,78 @@ class DraftState:
             if(form == "list"):
                 return np.array([])
             else:
-                return np.zeros_like(self.state[:,1:].reshape(-1))
+                return np.zeros(self.num_actions, dtype=bool)
 
-        sub_count = len(self.bans)+len(self.picks)
-        phase = self.draft_structure.get_active_phase(sub_count)
-        champ_available = np.logical_not(np.amax(self.state[:,:],axis=1))
-        pos_available = [pos for pos in range(1, self.num_positions+1) if pos not in self.selected_pos]
-        valid_actions = np.zeros_like(self.state[:,1:])
-        if(phase == Draft.BAN):
-            # only bans are (potentially) valid during ban phase
-            valid_actions[:,0] = champ_available
+        valid_actions = self._valid_actions.reshape(-1).copy()
+        if(form == "list"):
+            return np.nonzero(valid_actions)
         else:
-            # only picks are (potentially) valid during pick phase
-            for pos in pos_available:
-                valid_actions[:,pos] = champ_available
+            return valid_actions
 
-        if(form == "list"):
-            return np.nonzero(valid_actions.reshape(-1))
+    @property
+    def valid_actions(self):
+        """
+        Read-only view of the actionable mask maintained by update(). The mask is flattened in the same order as
+        the actions produced by get_action(). Unlike get_valid_actions() this does not check if the draft is complete or invalid,
+        and since it is a view rather than a copy its contents change as later submissions are made with update().
+        """
+        valid_actions = self._valid_actions.reshape(-1)
+        valid_actions.flags.writeable = False
+        return valid_actions
+
+    def iter_legal_actions(self, order=None):
+        """
+        Lazily generates the legal actions for the current state without building the full actionable mask. Each action is
+        checked against the packed bitsets in constant time as it is reached, so a caller which only wants the first few candidates
+        (eg. the top actions of a beam search or rollout) stops after examining only as many actions as it consumes.
+        The state should not be updated while the generator is in use.
+        Args:
+            order (iterable(int)): optional priority order in which to consider actions, eg. np.argsort(-Q) to yield the
+                legal actions in descending order of Q value. Ids outside of [0, num_actions) are skipped. Default is ascending action id.
+        Yields:
+            (action_id, champion_id, position) (tuple(int)): legal action along with the submission it describes
+
+        If the draft is complete or in an invalid state no actions are generated.
+        """
+        if(self.evaluate()):
+            return
+        num_columns = self.num_positions+1
+        if(self._active_phase == DraftState.BAN_PHASE):
+            legal_columns = {0}
         else:
-            return valid_actions.reshape(-1)
+            legal_columns = {pos for pos in range(1, num_columns) if not self._role_bits[pos-1]}
+        occupied = self._ban_bits | self._pick_bits
+        champ_ids = self.state_index_to_champ_id
+
+        if order is None:
+            order = range(self.num_actions)
+        elif hasattr(order, "tolist"):
+            order = order.tolist()
+        for action in order:
+            if(action < 0 or action >= self.num_actions):
+                continue
+            (index, column) = divmod(int(action), num_columns)
+            if(column in legal_columns and not (occupied >> index) & 1):
+                yield (action, champ_ids[index], column if column else -1)
+
+    def _update_active_phase(self):
+        """
+        Checks if the submission count has moved the draft into a new phase and, if so, flips the columns of the actionable mask.
+        During a ban phase only the ban column is (potentially) valid, and during a pick phase only
+        the columns for positions that have not yet been filled are (potentially) valid.
+        """
+        phase = self.draft_structure.get_active_phase(min(self._num_bans+self._num_picks, self.draft_structure.num_submissions))
+        if(phase == self._active_phase):
+            return
+        self._active_phase = phase
+
+        self._valid_actions[:] = False
+        if(phase == Draft.BAN):
+            self._valid_actions[:,0] = self._champ_available
+        elif(phase == Draft.PICK):
+            for pos in range(1, self.num_positions+1):
+                if not self._role_bits[pos-1]:
+                    self._valid_actions[:,pos] = self._champ_available
 
     def is_submission_legal(self, champion_id, position):
         """
@@ -130,17 +318,25 @@ class DraftState:
         """
         if(not self.can_ban(champion_id) or not self.can_pick(champion_id)):
             return False
-        sub_count = len(self.bans)+len(self.picks)
+        sub_count = self._num_bans+self._num_picks
         phase = self.draft_structure.get_active_phase(sub_count)
         if phase == DraftState.BAN_PHASE and position != -1:
             return False
         if phase == DraftState.PICK_PHASE:
-            pos_index = self.get_position_index(position)
-            is_pos_filled = np.amax(self.state[:,pos_index])
-            if(is_pos_filled):
+            if(self._column_bits(position)):
                 return False
         return True
 
+    def _column_bits(self, position):
+        """
+        Returns the packed bitset of state indices occupying the state column for the given position label.
+        """
+        if position == -1:
+            return self._ban_bits
+        if position == 0:
+            return self._enemy_bits
+        return self._role_bits[position-1]
+
     def get_champ_id(self,index):
         """
         get_champ_id returns the valid champion ID corresponding to the given state index. Since champion IDs are not contiguously defined or even necessarily ordered,
@@ -176,7 +372,7 @@ class DraftState:
         Returns:
             index (int): index into the state matrix corresponding to this position
         """
-        if position not in self.positions:
+        if position not in self.pos_to_pos_index:
             return False
         return self.pos_to_pos_index[position]
 
@@ -189,7 +385,7 @@ class DraftState:
         Returns:
             position (int): position label corresponding to this position index
         """
-        if pos_index not in self.pos_indices:
+        if pos_index not in self.pos_index_to_pos:
             return False
         return self.pos_index_to_pos[pos_index]
 
@@ -199,13 +395,30 @@ class DraftState:
         Args:
             None
         Returns:
-            A copy of self.state
+            A flattened copy of self.state
         """
         if(self.evaluate() in DraftState.invalid_states):
             raise InvalidDraftState("Attempting to format an invalid draft state for network input with code {}".format(self.evaluate()))
 
         return self.state.reshape(-1)
 
+    def format_sparse_state(self):
+        """
+        Format the state as a list of submission indices so that a Q-network built with input_mode = "sparse" can process it.
+        Each entry is the index of a non-zero element of the flattened state (ie format_state()). The list is padded
+        to a fixed length (the number of submissions in the draft) with the index state_size, which the network treats as empty.
+        Args:
+            None
+        Returns:
+            Numpy vector of padded submission indices
+        """
+        if(self.evaluate() in DraftState.invalid_states):
+            raise InvalidDraftState("Attempting to format an invalid draft state for network input with code {}".format(self.evaluate()))
+
+        sparse_state = np.full(self.context.sparse_state_size, self.context.pad_index, dtype=np.int32)
+        sparse_state[:len(self._cells)] = self._cells
+        return sparse_state
+
     def format_secondary_inputs(self):
         """
         Produces secondary input information (information about filled positions and draft phase)
@@ -219,16 +432,14 @@ class DraftState:
             raise InvalidDraftState("Attempting to format an invalid draft state for network input with code {}".format(self.evaluate()))
 
         # First segment of information checks whether each position has been or not filled in the state
-        # This is done by looking at columns in the subarray corresponding to positions 1 thru 5
-        start = self.get_position_index(1)
-        end = self.get_position_index(5)
-        secondary_inputs = np.amax(self.state[:,start:end+1],axis=0)
+        # This is done by looking at the bitsets for the columns corresponding to positions 1 thru num_positions
+        secondary_inputs = np.array([role_bits != 0 for role_bits in self._role_bits], dtype=bool)
 
         # Second segment checks if the phase corresponding to this state is a pick phase
-        # This is done by counting the number of bans currently submitted. Note that this assumes
+        # This is done by counting the number of submissions currently made. Note that this assumes
         # that state is currently a valid state. If this is not necessarily the case a check can be made using
         # evaluate().
-        submission_count = len(self.bans)+len(self.picks)
+        submission_count = self._num_bans+self._num_picks
         phase = self.draft_structure.get_active_phase(submission_count)
         is_pick_phase = phase == DraftState.PICK_PHASE
         secondary_inputs = np.append(secondary_inputs, is_pick_phase)
@@ -250,17 +461,30 @@ class DraftState:
         never output pos = 0.
         """
         # 'actionable state' is the sub-state of the state matrix with 'enemy picks' column removed.
-        actionable_state = self.state[:,1:]
-        if(action not in range(actionable_state.size)):
-            raise "Invalid action to format_action()!"
-        (state_index, position_index) = np.unravel_index(action,actionable_state.shape)
-        # Action corresponds to a submission that we are allowed to make, ie. a pick or a ban.
-        # We can't make submissions to the enemy team, so the indicies corresponding to these actions are removed.
-        # position_index needs to be shifted by 1 in order to correctly index into full state array
-        position_index += 1
-        position = self.get_position(position_index)
-        champ_id = self.get_champ_id(state_index)
-        return (champ_id,position)
+        # The decoding is done by lookup into precomputed tables (see DraftContext.decode_actions()).
+        (champ_ids, positions) = self.decode_actions([action])
+        return (int(champ_ids[0]), int(positions[0]))
+
+    def decode_actions(self, action_ids):
+        """
+        Vectorized format_action(). Formats each input action into the (champ_id, position) submission it describes.
+        Args:
+            action_ids (array(int)): actions to be interpreted as indices of the flattened 'actionable state' matrix
+        Returns:
+            (champ_ids, positions) (tuple of arrays): champion id and position of each submission
+        """
+        return self.context.decode_actions(action_ids)
+
+    def encode_actions(self, champion_ids, positions):
+        """
+        Vectorized get_action(). Returns the action index in the flattened actionable state array for each (champion_id, position) submission.
+        Args:
+            champion_ids (array(int)): ids of champions to be picked/banned.
+            positions (array(int)): positions of submissions (see get_action())
+        Returns:
+            action_ids (array(int)): action for each submission, or -1 if no such action can be found
+        """
+        return self.context.encode_actions(champion_ids, positions)
 
     def get_action(self, champion_id, position):
         """
@@ -277,17 +501,7 @@ class DraftState:
         matrix corresponding to opponent team submission. In practice this means that a = format_action(cid,pos) will
         produce an invalid action for pos = 0.
         """
-        state_index = self.get_state_index(champion_id)
-        pos_index = self.get_position_index(position)
-        if ((state_index==-1) or (pos_index not in range(1,self.state.shape[1]))):
-            print("Invalid state index or position out of range!")
-            print("cid = {}".format(champion_id))
-            print("pos = {}".format(position))
-            return -1
-        # Convert position index for full state matrix into index for actionable state
-        pos_index -= 1
-        action = np.ravel_multi_index((state_index,pos_index),self.state[:,1:].shape)
-        return action
+        return int(self.encode_actions([champion_id], [position])[0])
 
     def update(self, champion_id, position):
         """
@@ -302,27 +516,105 @@ class DraftState:
         """
         # Special case for NULL ban submitted.
         if (champion_id is None and position == -1):
-            # Only append NULL bans to ban list (nothing done to state matrix)
+            # Only append NULL bans to ban list (nothing done to state bitsets)
+            self._own_buffers()
             self.bans.append(champion_id)
+            self._hash ^= int(self.context.zobrist_null_ban_keys[min(self._num_null_bans, self.draft_structure.NUM_BANS)])
+            self._num_null_bans += 1
+            self._num_bans += 1
+            self._update_active_phase()
             return True
 
         # Submitted picks of the form (champ_id, pos) correspond with the selection champion = champion_id in position = pos.
         # Bans are given pos = -1 and enemy picks pos = 0. However, this is not how they are stored in the state array.
         # Finally this doesn't match indexing used for state array and action vector indexing (which follow state indexing).
-        if((position < -1) or (position > self.num_positions) or (not valid_champion_id(champion_id))):
+        if((position < -1) or (position > self.num_positions) or (champion_id not in self.champ_id_to_state_index)):
             return False
 
         index = self.champ_id_to_state_index[champion_id]
-        pos_index = self.get_position_index(position)
+        self._own_buffers()
         if(position == -1):
             self.bans.append(champion_id)
         else:
             self.picks.append(champion_id)
             self.selected_pos.append(position)
-
-        self.state[index,pos_index] = True
+        self._submit(index, position)
         return True
 
+    def _submit(self, index, position):
+        """
+        Records the submission of the champion at state index in the given position into the packed bitsets,
+        updating the running counters and invalid submission flags.
+        Args:
+            index (int): state index of submitted champion
+            position (int): position label of submission (-1 for bans, 0 for enemy picks)
+        Returns:
+            None
+        """
+        bit = 1 << index
+        if(position == -1):
+            if(self._ban_bits & bit):
+                self._duplicate_submission = True
+            if(self._pick_bits & bit):
+                self._ban_and_submission = True
+            self._ban_bits |= bit
+            self._num_bans += 1
+        else:
+            if(self._pick_bits & bit):
+                self._duplicate_submission = True
+            if(self._ban_bits & bit):
+                self._ban_and_submission = True
+            self._pick_bits |= bit
+            self._num_picks += 1
+            if(position == 0):
+                self._enemy_bits |= bit
+                self._num_enemy_picks += 1
+            else:
+                if(self._role_bits[position-1] & ~bit):
+                    self._duplicate_role = True
+                self._role_bits[position-1] |= bit
+                self._valid_actions[:,position] = False
+
+        pos_index = self.get_position_index(position)
+        self._cells.append(index*(self.num_positions+2)+pos_index)
+        self._hash ^= int(self.context.zobrist_keys[index, pos_index, self.team])
+        self._champ_available[index] = False
+        self._valid_actions[index,:] = False
+        self._update_active_phase()
+
+    @property
+    def zobrist_hash(self):
+        """
+        64-bit Zobrist hash of the state. The hash is maintained incrementally by update() and only depends on the set of submissions
+        made (and the team perspective), not on the order they were made in. Identical states reached through different
+        submission orders, matches or search branches therefore share the same hash, which makes it suitable as a key for caches and
+        transposition tables. Distinct states may (very rarely) collide, so use == to confirm equality.
+        """
+        return self._hash
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        """
+        Two DraftStates are equal if they describe the same draft from the same perspective: the same submissions in each column
+        of the state and the same number of bans (including NULL bans) and picks.
+        """
+        if not isinstance(other, DraftState):
+            return NotImplemented
+        return (self._hash == other._hash and
+                self.context is other.context and
+                self.team == other.team and
+                self._ban_bits == other._ban_bits and
+                self._enemy_bits == other._enemy_bits and
+                self._role_bits == other._role_bits and
+                self._num_bans == other._num_bans and
+                self._num_picks == other._num_picks and
+                self._num_enemy_picks == other._num_enemy_picks and
+                self._duplicate_submission == other._duplicate_submission and
+                self._ban_and_submission == other._ban_and_submission and
+                self._duplicate_role == other._duplicate_role)
+
     def display(self):
         #TODO (Devin): Clean up display to make it prettier.
         print("=== Begin Draft State ===")
@@ -330,13 +622,14 @@ class DraftState:
 
         print("Banned Champions: {0}".format(list(map(champion_name_from_id, self.bans))))
         print("Picked Champions: {0}".format(list(map(champion_name_from_id, self.picks))))
+        state = self.state
         pos_index = self.get_position_index(0)
-        enemy_draft_ids = list(map(self.get_champ_id, list(np.where(self.state[:,pos_index])[0])))
+        enemy_draft_ids = list(map(self.get_champ_id, list(np.where(state[:,pos_index])[0])))
         print("Enemy Draft: {0}".format(list(map(champion_name_from_id,enemy_draft_ids))))
 
         print("Ally Draft:")
-        for pos_index in range(2,len(self.state[0,:])): # Iterate through each position columns in state
-            champ_index = np.where(self.state[:,pos_index])[0] # Find non-zero index
+        for pos_index in range(2,len(state[0,:])): # Iterate through each position columns in state
+            champ_index = np.where(state[:,pos_index])[0] # Find non-zero index
             if not champ_index.size: # No pick is found for this position, create a filler string
                 draft_name = "--"
             else:
@@ -351,7 +644,9 @@ class DraftState:
         Args:
             champion_id (int): Id of champion to check for valid selection.
         """
-        return ((champion_id not in self.picks) and valid_champion_id(champion_id))
+        if champion_id not in self.champ_id_to_state_index:
+            return False
+        return not (self._pick_bits >> self.champ_id_to_state_index[champion_id]) & 1
 
     def can_ban(self, champion_id):
         """
@@ -360,7 +655,9 @@ class DraftState:
         Args:
             champion_id (int): Id of champion to check for valid ban.
         """
-        return ((champion_id not in self.bans) and valid_champion_id(champion_id))
+        if champion_id not in self.champ_id_to_state_index:
+            return False
+        return not (self._ban_bits >> self.champ_id_to_state_index[champion_id]) & 1
 
     def add_pick(self, champion_id, position):
         """
@@ -370,13 +667,12 @@ class DraftState:
             champion_id (int): Id of champion to add to pick list.
             position (int): Position of champion to be selected. If position = 0 this is interpreted as a selection submitted by the opposing team.
         """
-        if((position < 0) or (position > self.num_positions) or (not valid_champion_id(champion_id))):
+        if((position < 0) or (position > self.num_positions) or (champion_id not in self.champ_id_to_state_index)):
             return False
+        self._own_buffers()
         self.picks.append(champion_id)
         self.selected_pos.append(position)
-        index = self.get_state_index(champion_id)
-        pos_index = self.get_position_index(position)
-        self.state[index,pos_index] = True
+        self._submit(self.get_state_index(champion_id), position)
         return True
 
     def add_ban(self, champion_id):
@@ -386,11 +682,11 @@ class DraftState:
         Args:
             champion_id (int): Id of champion to add to bans.
         """
-        if(not valid_champion_id(champion_id)):
+        if(champion_id not in self.champ_id_to_state_index):
             return False
+        self._own_buffers()
         self.bans.append(champion_id)
-        index = self.get_state_index(champion_id)
-        self.state[index,self.get_position_index(-1)] = True
+        self._submit(self.get_state_index(champion_id), -1)
         return True
 
     def evaluate(self):
@@ -406,28 +702,20 @@ class DraftState:
                 value = DUPLICATE_ROLE -> state has multiple champions selected for a single role
                 value = INVALID_SUBMISSION -> state has a submission that was included out of the draft phase order (ex pick during ban phase / ban during pick phase)
         """
-        # Check for duplicate submissions appearing in picks or bans
-        duplicate_picks = set([cid for cid in self.picks if self.picks.count(cid)>1])
-        # Need to remove possible NULL bans as duplicates (since these may be legitimate)
-        duplicate_bans = set([cid for cid in self.bans if self.bans.count(cid)>1]).difference(set([None]))
-        if(len(duplicate_picks)>0 or len(duplicate_bans)>0):
+        # Invalid submissions are flagged as they are made in update(), so we only need to check
+        # the flags here (in order of precedence).
+        if(self._duplicate_submission):
             return DraftState.DUPLICATE_SUBMISSION
-
-        # Check for submissions appearing in both picks and bans
-        if(len(set(self.picks).intersection(set(self.bans)))>0):
+        if(self._ban_and_submission):
             # Invalid state includes an already banned champion
             return DraftState.BAN_AND_SUBMISSION
-
-        # Check for different champions that have been submitted for the same role
-        for pos in range(2,self.num_positions+2):
-            loc = np.argwhere(self.state[:,pos])
-            if(len(loc)>1):
-                # Invalid state includes multiple champions intended for the same role.
-                return DraftState.DUPLICATE_ROLE
+        if(self._duplicate_role):
+            # Invalid state includes multiple champions intended for the same role.
+            return DraftState.DUPLICATE_ROLE
 
         # Check for out of phase submissions
-        num_bans = len(self.bans)
-        num_picks = len(self.picks)
+        num_bans = self._num_bans
+        num_picks = self._num_picks
         sub_count = num_bans+num_picks
 
         if(num_bans > self.draft_structure.NUM_BANS):
@@ -437,7 +725,7 @@ class DraftState:
 
         # validation is tuple of form (target_ban_count, target_blue_pick_count, target_red_pick_count)
         validation = self.draft_structure.submission_dist[sub_count]
-        num_opponent_sub = np.count_nonzero(self.state[:,self.get_position_index(0)])
+        num_opponent_sub = self._num_enemy_picks
         num_ally_sub = num_picks - num_opponent_sub
         if self.team == DraftState.BLUE_TEAM:
             dist = (num_bans, num_ally_sub, num_opponent_sub)
@@ -479,9 +767,9 @@ if __name__=="__main__":
     new_actions = state.get_valid_actions()
     print(new_actions)
     print("")
-    for aid in range(len(new_actions)):
-        if(new_actions[aid]):
-            print(state.format_action(aid))
+    (cids, positions) = state.decode_actions(np.nonzero(new_actions)[0])
+    for (cid, pos) in zip(cids, positions):
+        print((cid, pos))
 
     state.update(10,2)
     state.update(11,3)
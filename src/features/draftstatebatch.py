@@ -0,0 +1,327 @@
+import numpy as np
+from data.champion_info import get_champion_ids
+from .draft import Draft
+from .draftcontext import DraftContext
+from .draftstate import DraftState, InvalidDraftState
+
+class DraftStateBatch:
+    """
+    Args:
+        teams (list(int)) : team each draft is being drafted for (RED_TEAM or BLUE_TEAM). The batch holds len(teams) drafts.
+        champ_ids (list(int)) : list of valid championids which are available for drafting.
+        num_positions (int) : number of available positions to draft for. Default is 5 for a standard 5x5 draft.
+        draft (Draft) : draft structure used by every draft in the batch.
+
+    DraftStateBatch holds N drafts as stacked numPy arrays so that they can be updated, evaluated and formatted for
+    network input without any per-state Python work. The states are stored in the same (numChampions) x (numRoles+2) layout that
+    DraftState.state uses, with a leading batch dimension, along with per-draft submission counters and invalid submission flags.
+
+    Each method mirrors the corresponding DraftState method, but operates on every draft in the batch at once:
+        update(cids, positions) -> DraftState.update()
+        evaluate() -> DraftState.evaluate()
+        valid_action_masks() -> DraftState.get_valid_actions()
+        format_states() -> DraftState.format_state()
+        format_actions(action_ids) -> DraftState.format_action()
+        hashes -> DraftState.zobrist_hash
+    """
+    def __init__(self, teams, champ_ids = get_champion_ids(), num_positions = 5, draft = Draft('default')):
+        self.context = DraftContext.get(champ_ids, draft.draft_type, num_positions)
+        self.teams = np.array(teams, dtype=np.int64)
+        self.size = len(self.teams)
+
+        context = self.context
+        self.state = np.zeros((self.size, context.num_champions, context.num_columns), dtype=bool)
+        # Number of champions occupying each column of the state
+        self.column_counts = np.zeros((self.size, context.num_columns), dtype=np.int64)
+        self.num_bans = np.zeros(self.size, dtype=np.int64)
+        self.num_picks = np.zeros(self.size, dtype=np.int64)
+        self.num_null_bans = np.zeros(self.size, dtype=np.int64)
+        # Zobrist hash of each draft (see DraftState.zobrist_hash)
+        self.hashes = context.zobrist_team_keys[self.teams]
+
+        # Sticky flags for invalid submissions (see DraftState.evaluate())
+        self.duplicate_submission = np.zeros(self.size, dtype=bool)
+        self.ban_and_submission = np.zeros(self.size, dtype=bool)
+        self.duplicate_role = np.zeros(self.size, dtype=bool)
+
+    @classmethod
+    def from_states(cls, states):
+        """
+        Stacks a list of DraftStates (which must share the same DraftContext) into a DraftStateBatch.
+        If states is already a DraftStateBatch it is returned unchanged.
+        Args:
+            states (list(DraftState) or DraftStateBatch): states to stack
+        Returns:
+            batch (DraftStateBatch): batch holding a copy of each state
+        """
+        if isinstance(states, DraftStateBatch):
+            return states
+        context = states[0].context
+        (champ_ids, draft_type, num_positions) = context.key
+        batch = cls([state.team for state in states], champ_ids, num_positions, context.draft)
+
+        # Every submission is recorded as a flattened (state_index, pos_index) cell of the state
+        rows = np.repeat(np.arange(batch.size), [len(state._cells) for state in states])
+        cells = np.array([cell for state in states for cell in state._cells], dtype=np.int64)
+        batch.state.reshape(batch.size, -1)[rows, cells] = True
+        batch.column_counts = batch.state.sum(axis=1)
+
+        batch.num_bans = np.array([state._num_bans for state in states], dtype=np.int64)
+        batch.num_picks = np.array([state._num_picks for state in states], dtype=np.int64)
+        batch.num_null_bans = np.array([state._num_null_bans for state in states], dtype=np.int64)
+        batch.hashes = np.array([state.zobrist_hash for state in states], dtype=np.uint64)
+        batch.duplicate_submission = np.array([state._duplicate_submission for state in states], dtype=bool)
+        batch.ban_and_submission = np.array([state._ban_and_submission for state in states], dtype=bool)
+        batch.duplicate_role = np.array([state._duplicate_role for state in states], dtype=bool)
+        return batch
+
+    @classmethod
+    def from_encodings(cls, teams, sparse_states, steps, champ_ids = get_champion_ids(), num_positions = 5, draft = Draft('default')):
+        """
+        Rebuilds a DraftStateBatch from sparse state encodings (see DraftState.format_sparse_state()) and submission counts.
+        Since NULL bans leave no trace in the state matrix, the number of submissions made in each draft is needed to recover the
+        ban count and active phase. Invalid submission flags are recovered from the encoded state.
+        Args:
+            teams (array(int)): team each draft is being drafted for
+            sparse_states (array(int)): (N, n_ids) array of padded submission indices
+            steps (array(int)): number of submissions (including NULL bans) made in each draft
+            champ_ids, num_positions, draft: as in DraftStateBatch()
+        Returns:
+            batch (DraftStateBatch): decoded drafts
+        """
+        batch = cls(teams, champ_ids, num_positions, draft)
+        context = batch.context
+        sparse_states = np.asarray(sparse_states, dtype=np.int64)
+        (rows, slots) = np.nonzero(sparse_states < context.pad_index)
+        cells = sparse_states[rows, slots]
+        batch.state.reshape(batch.size, -1)[rows, cells] = True
+        (indices, pos_indices) = np.divmod(cells, context.num_columns)
+        batch.column_counts = np.bincount(rows*context.num_columns + pos_indices, minlength=batch.size*context.num_columns).reshape(batch.size, -1)
+
+        ban_column = context.pos_to_pos_index[-1]
+        num_listed_bans = batch.column_counts[:, ban_column]
+        batch.num_picks = batch.column_counts.sum(axis=1) - num_listed_bans
+        batch.num_bans = np.asarray(steps, dtype=np.int64) - batch.num_picks
+        batch.num_null_bans = batch.num_bans - num_listed_bans
+
+        np.bitwise_xor.at(batch.hashes, rows, context.zobrist_keys[indices, pos_indices, batch.teams[rows]])
+        batch.hashes ^= context.zobrist_null_ban_prefix[np.clip(batch.num_null_bans, 0, len(context.zobrist_null_ban_prefix)-1)]
+
+        submitted_twice = np.bincount(rows*context.num_champions + indices, minlength=batch.size*context.num_champions).reshape(batch.size, -1) > 1
+        banned = batch.state[:, :, ban_column]
+        batch.duplicate_submission = np.any(submitted_twice & ~banned, axis=1)
+        batch.ban_and_submission = np.any(submitted_twice & banned, axis=1)
+        batch.duplicate_role = np.any(batch.column_counts[:, 2:] > 1, axis=1)
+        return batch
+
+    def __len__(self):
+        return self.size
+
+    def take(self, indices):
+        """
+        Returns a new DraftStateBatch holding copies of the drafts at the given indices.
+        Args:
+            indices (array(int)): indices of drafts to select
+        Returns:
+            batch (DraftStateBatch): selected drafts
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        batch = object.__new__(DraftStateBatch)
+        batch.context = self.context
+        batch.size = len(indices)
+        for attr in ["teams", "state", "column_counts", "num_bans", "num_picks", "num_null_bans", "hashes",
+                     "duplicate_submission", "ban_and_submission", "duplicate_role"]:
+            setattr(batch, attr, getattr(self, attr)[indices])
+        return batch
+
+    def update(self, champion_ids, positions):
+        """
+        Attempt to update every draft in the batch with a single submission each. Submission k is applied to draft k.
+        Args:
+            champion_ids (array(int)): ids of submitted champions. NULL bans may be given as None or -1.
+            positions (array(int)): positions of submitted champions, interpreted as in DraftState.update()
+        Returns:
+            success (array(bool)): success[k] is True if submission k was applied, False otherwise
+        """
+        context = self.context
+        champion_ids = context.as_champion_ids(champion_ids)
+        positions = np.asarray(positions, dtype=np.int64)
+
+        # Special case for NULL bans submitted. These only increment the ban count.
+        null_bans = (champion_ids == -1) & (positions == -1)
+        null_rows = np.nonzero(null_bans)[0]
+        null_keys = context.zobrist_null_ban_keys[np.minimum(self.num_null_bans[null_rows], context.draft.NUM_BANS)]
+        self.hashes[null_rows] ^= null_keys
+        self.num_null_bans += null_bans
+        self.num_bans += null_bans
+
+        indices = context.get_state_indices(champion_ids)
+        valid = (indices >= 0) & (positions >= -1) & (positions <= context.num_positions)
+
+        rows = np.nonzero(valid)[0]
+        indices = indices[rows]
+        positions = positions[rows]
+        pos_indices = context.pos_to_pos_index_table[positions+1]
+
+        ban_column = context.pos_to_pos_index[-1]
+        champ_rows = self.state[rows, indices, :]
+        was_banned = champ_rows[:, ban_column]
+        was_picked = np.any(np.delete(champ_rows, ban_column, axis=1), axis=1)
+        was_set = champ_rows[np.arange(len(rows)), pos_indices]
+        is_ban = positions == -1
+        is_ally_pick = positions > 0
+
+        self.duplicate_submission[rows] |= np.where(is_ban, was_banned, was_picked)
+        self.ban_and_submission[rows] |= np.where(is_ban, was_picked, was_banned)
+        self.duplicate_role[rows] |= is_ally_pick & ~was_set & (self.column_counts[rows, pos_indices] > 0)
+
+        self.state[rows, indices, pos_indices] = True
+        self.hashes[rows] ^= context.zobrist_keys[indices, pos_indices, self.teams[rows]]
+        self.column_counts[rows, pos_indices] += ~was_set
+        self.num_bans[rows] += is_ban
+        self.num_picks[rows] += ~is_ban
+        return valid | null_bans
+
+    def evaluate(self):
+        """
+        Vectorized DraftState.evaluate().
+        Returns:
+            values (array(int)): code indicating the validity of each draft in the batch
+        """
+        context = self.context
+        draft = context.draft
+        enemy_column = context.pos_to_pos_index[0]
+        num_opponent_sub = self.column_counts[:, enemy_column]
+        num_ally_sub = self.num_picks - num_opponent_sub
+        sub_count = self.num_bans + self.num_picks
+
+        validation = context.submission_dist_table[np.minimum(sub_count, context.num_steps)]
+        is_blue = self.teams == DraftState.BLUE_TEAM
+        dist = np.stack([self.num_bans,
+                         np.where(is_blue, num_ally_sub, num_opponent_sub),
+                         np.where(is_blue, num_opponent_sub, num_ally_sub)], axis=1)
+        out_of_phase = np.any(dist != validation, axis=1)
+        complete = (num_ally_sub == context.num_positions) & (num_opponent_sub == context.num_positions)
+
+        conditions = [self.duplicate_submission,
+                      self.ban_and_submission,
+                      self.duplicate_role,
+                      self.num_bans > draft.NUM_BANS,
+                      self.num_picks > draft.NUM_PICKS,
+                      out_of_phase,
+                      complete]
+        choices = [DraftState.DUPLICATE_SUBMISSION,
+                   DraftState.BAN_AND_SUBMISSION,
+                   DraftState.DUPLICATE_ROLE,
+                   DraftState.TOO_MANY_BANS,
+                   DraftState.TOO_MANY_PICKS,
+                   DraftState.INVALID_SUBMISSION,
+                   DraftState.DRAFT_COMPLETE]
+        return np.select(conditions, choices, default=0)
+
+    def active_phases(self):
+        """
+        Returns the active phase (Draft.BAN or Draft.PICK) of each draft in the batch, or 0 if the draft has no more submissions.
+        """
+        sub_count = self.num_bans + self.num_picks
+        return self.context.phase_table[np.minimum(sub_count, self.context.num_steps)]
+
+    def valid_action_masks(self):
+        """
+        Vectorized DraftState.get_valid_actions().
+        Returns:
+            valid_actions (array(bool)): (N, num_actions) array where row k is the valid action mask for draft k.
+                Drafts that are complete or invalid have no valid actions.
+        """
+        context = self.context
+        phases = self.active_phases()
+        active = self.evaluate() == 0
+        champ_available = ~self._occupied() & active[:,None]
+        pos_available = self.column_counts[:, 2:] == 0
+
+        valid_actions = np.zeros((self.size, context.num_champions, context.num_positions+1), dtype=bool)
+        # only bans are (potentially) valid during ban phase
+        valid_actions[:,:,0] = champ_available & (phases == Draft.BAN)[:,None]
+        # only picks are (potentially) valid during pick phase
+        valid_actions[:,:,1:] = champ_available[:,:,None] & (pos_available & (phases == Draft.PICK)[:,None])[:,None,:]
+        return valid_actions.reshape(self.size, self.context.num_actions)
+
+    def _occupied(self):
+        """
+        Returns an (N, num_champions) array indicating which champions have been submitted in each draft.
+        """
+        # OR-ing the columns together is considerably faster than np.any() over the short last axis of the state
+        occupied = self.state[:,:,0].copy()
+        for column in range(1, self.context.num_columns):
+            occupied |= self.state[:,:,column]
+        return occupied
+
+    def _check_valid(self):
+        codes = self.evaluate()
+        invalid = np.isin(codes, DraftState.invalid_states)
+        if np.any(invalid):
+            raise InvalidDraftState("Attempting to format an invalid draft state for network input with codes {}".format(np.unique(codes[invalid])))
+
+    def format_states(self):
+        """
+        Vectorized DraftState.format_state().
+        Returns:
+            states (array(bool)): (N, num_champions*(num_positions+2)) array of flattened states
+        """
+        self._check_valid()
+        return self.state.reshape(self.size, self.context.state_size)
+
+    def format_sparse_states(self):
+        """
+        Vectorized DraftState.format_sparse_state().
+        Returns:
+            states (array(int)): (N, sparse_state_size) array of padded submission indices
+        """
+        self._check_valid()
+        (rows, cells) = np.nonzero(self.state.reshape(self.size, self.context.state_size))
+        # Offset of each non-zero cell within its row
+        counts = np.bincount(rows, minlength=self.size)
+        offsets = np.arange(len(rows)) - np.repeat(np.cumsum(counts)-counts, counts)
+        sparse_states = np.full((self.size, self.context.sparse_state_size), self.context.pad_index, dtype=np.int32)
+        sparse_states[rows, offsets] = cells
+        return sparse_states
+
+    def format_inputs(self, input_mode="dense"):
+        """
+        Formats the states for a network built with the given input_mode ("dense" or "sparse").
+        """
+        if(input_mode == "sparse"):
+            return self.format_sparse_states()
+        return self.format_states()
+
+    def format_secondary_inputs(self):
+        """
+        Vectorized DraftState.format_secondary_inputs().
+        Returns:
+            secondary_inputs (array(bool)): (N, num_positions+1) array of secondary inputs
+        """
+        self._check_valid()
+        filled = self.column_counts[:, 2:] > 0
+        is_pick_phase = self.active_phases() == DraftState.PICK_PHASE
+        return np.concatenate([filled, is_pick_phase[:,None]], axis=1)
+
+    def format_actions(self, action_ids):
+        """
+        Vectorized DraftState.format_action().
+        Args:
+            action_ids (array(int)): actions to be interpreted as indices of the flattened 'actionable state'
+        Returns:
+            (champion_ids, positions) (tuple of arrays): decoded submission for each action
+        """
+        return self.context.decode_actions(action_ids)
+
+    def get_actions(self, champion_ids, positions):
+        """
+        Vectorized DraftState.get_action().
+        Args:
+            champion_ids (array(int)): ids of submitted champions
+            positions (array(int)): positions of submitted champions
+        Returns:
+            action_ids (array(int)): index of each submission in the flattened 'actionable state'
+        """
+        return self.context.encode_actions(champion_ids, positions)
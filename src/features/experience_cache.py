@@ -0,0 +1,242 @@
+import os
+import json
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+from data.champion_info import get_champion_ids
+from .draftcontext import DraftContext
+from .draftstatebatch import DraftStateBatch
+from . import match_processing as mp
+
+class ExperienceCache():
+    """
+    ExperienceCache stores the experiences produced by match_processing.process_matches() on disk so that each match only has to be
+    processed once across epochs, training runs and hyperparameter sweeps. Experiences are keyed by (match id, team perspective, augmentation id).
+    Since every match has num_augmentations possible augmentations, training draws the augmentation of each match from a fixed set of
+    augmentations_per_match ids for that match (see sample_augment_ids()) so that entries are reused across epochs.
+
+    Each entry records a hash of the match data and the draft context (champion set, draft structure and number of positions) it was
+    generated with. Entries whose hash no longer matches are treated as stale and regenerated.
+
+    The cache is kept as a sequence of .npz shard files in the cache directory. Each call which adds entries writes them to a new shard
+    holding their experience arrays along with an index of the rows belonging to each key, so existing shards are never rewritten.
+    Shards are read once when the cache is first used, with entries in later shards replacing those in earlier ones. Once the cache holds
+    more than max_entries entries the least recently used entries are evicted. Shards left with no live entries are deleted, and once
+    more than MAX_SHARDS shards exist or most of the cached rows belong to evicted or stale entries, the live entries are compacted into a single shard.
+    Valid action masks are not stored since they are rebuilt cheaply from the cached state encodings when experiences are read.
+    Args:
+        cache_dir (string): directory to store cached experiences in. Created if it does not exist.
+        context (DraftContext): context used to process matches. Defaults to the context used by DraftState(team).
+        max_entries (int): maximum number of (match, team, augmentation) entries held. If None the cache is unbounded.
+        augmentations_per_match (int): number of augmentation ids each match is drawn with during training
+    """
+    FIELDS = ["match_ids", "augment_ids", "teams", "steps", "states", "actions", "rewards", "next_steps", "next_states", "terminal"]
+    SHARD_PREFIX = "experiences_"
+    MAX_SHARDS = 16
+
+    def __init__(self, cache_dir, context = None, max_entries = 100000, augmentations_per_match = 8):
+        if context is None:
+            context = DraftContext.get(get_champion_ids(), mp.DEFAULT_DRAFT.draft_type, 5)
+        self.cache_dir = cache_dir
+        self.context = context
+        self.max_entries = max_entries
+        self.augmentations_per_match = augmentations_per_match
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # In memory copy of the cache. _index maps (match_id, team, augment_id) -> (match_hash, shard, start, stop) where
+        # rows start:stop of each array in _data hold the experiences for that key, ordered from least to most recently used.
+        # _shards maps each shard id to its number of live entries.
+        self._data = None
+        self._index = None
+        self._shards = None
+
+    def match_hash(self, match):
+        """
+        Returns a hash identifying the contents of match along with the draft context used to process it.
+        """
+        key = json.dumps(match, sort_keys=True, default=str) + repr(self.context.key)
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+    def sample_augment_ids(self, matches, rng = np.random):
+        """
+        Draws an augmentation id for each match uniformly from a fixed set of augmentations_per_match ids determined by the match id.
+        """
+        num_augmentations = self.context.draft.num_augmentations
+        n = min(self.augmentations_per_match, num_augmentations)
+        choices = rng.randint(n, size=len(matches))
+        return np.array([np.random.RandomState(match["id"] % (2**32)).permutation(num_augmentations)[k] for (match, k) in zip(matches, choices.tolist())], dtype=np.int64)
+
+    def _shard_path(self, shard):
+        return os.path.join(self.cache_dir, "{}{:06d}.npz".format(ExperienceCache.SHARD_PREFIX, shard))
+
+    def _list_shards(self):
+        names = [name for name in os.listdir(self.cache_dir) if name.startswith(ExperienceCache.SHARD_PREFIX) and name.endswith(".npz")]
+        return sorted(int(name[len(ExperienceCache.SHARD_PREFIX):-len(".npz")]) for name in names)
+
+    def _load(self):
+        """
+        Reads the cache shards into memory (if they have not already been read).
+        """
+        if self._data is not None:
+            return
+        self._data = {}
+        self._index = OrderedDict()
+        self._shards = {}
+        for shard in self._list_shards():
+            with np.load(self._shard_path(shard)) as data:
+                offset = len(self._data["actions"]) if self._data else 0
+                self._append_data({field:data[field] for field in ExperienceCache.FIELDS})
+                keys = zip(data["index_match_ids"].tolist(), data["index_teams"].tolist(), data["index_augment_ids"].tolist())
+                values = zip(data["index_hashes"].tolist(), data["index_starts"].tolist(), data["index_stops"].tolist())
+                self._shards[shard] = 0
+                for (key, (match_hash, start, stop)) in zip(keys, values):
+                    self._set_entry(key, (match_hash, shard, offset+start, offset+stop))
+        self._evict()
+
+    def _append_data(self, data):
+        if self._data:
+            self._data = {field:np.concatenate([self._data[field], data[field]]) for field in ExperienceCache.FIELDS}
+        else:
+            self._data = {field:data[field] for field in ExperienceCache.FIELDS}
+
+    def _set_entry(self, key, entry):
+        """
+        Adds (or replaces) the entry for key as the most recently used entry.
+        """
+        self._drop_entry(key)
+        self._index[key] = entry
+        self._shards[entry[1]] += 1
+
+    def _drop_entry(self, key):
+        entry = self._index.pop(key, None)
+        if entry is not None:
+            self._shards[entry[1]] -= 1
+
+    def _evict(self):
+        """
+        Evicts the least recently used entries beyond max_entries and deletes or compacts shards as needed.
+        """
+        if self.max_entries is not None:
+            while len(self._index) > self.max_entries:
+                self._drop_entry(next(iter(self._index)))
+        for shard in [shard for (shard, live) in self._shards.items() if live == 0]:
+            del self._shards[shard]
+            if os.path.exists(self._shard_path(shard)):
+                os.remove(self._shard_path(shard))
+        live_rows = sum(stop-start for (_, _, start, stop) in self._index.values())
+        num_rows = len(self._data["actions"]) if self._data else 0
+        if len(self._shards) > ExperienceCache.MAX_SHARDS or num_rows > 2*live_rows:
+            self._compact()
+
+    def _write_shard(self, shard, keys, entries):
+        """
+        Writes the rows of the given entries to a new shard file. The file is written under a temporary name and then moved into place
+        so that readers never see a partially written file.
+        """
+        (hashes, starts, stops) = (np.array(values) for values in zip(*[(entry[0], entry[2], entry[3]) for entry in entries]))
+        rows = _ranges(starts, stops)
+        new_stops = np.cumsum(stops-starts)
+        new_starts = new_stops-(stops-starts)
+        (match_ids, teams, augment_ids) = (np.array(values) for values in zip(*keys))
+        tmp_path = "{}.{}.tmp.npz".format(self._shard_path(shard)[:-len(".npz")], os.getpid())
+        np.savez(tmp_path, index_match_ids=match_ids, index_teams=teams, index_augment_ids=augment_ids,
+                 index_hashes=hashes, index_starts=new_starts, index_stops=new_stops, **{field:self._data[field][rows] for field in ExperienceCache.FIELDS})
+        os.replace(tmp_path, self._shard_path(shard))
+        return (rows, new_starts, new_stops)
+
+    def _compact(self):
+        """
+        Rewrites the live entries into a single shard, dropping the rows of evicted and stale entries, and deletes the other shards.
+        """
+        old_shards = list(self._shards.keys())
+        shard = max(old_shards, default=-1)+1
+        keys = list(self._index.keys())
+        if keys:
+            (rows, starts, stops) = self._write_shard(shard, keys, list(self._index.values()))
+            self._data = {field:self._data[field][rows] for field in ExperienceCache.FIELDS}
+            self._index = OrderedDict((key, (entry[0], shard, start, stop)) for (key, entry, start, stop) in zip(keys, self._index.values(), starts.tolist(), stops.tolist()))
+            self._shards = {shard:len(keys)}
+        else:
+            self._data = {}
+            self._shards = {}
+        for old_shard in old_shards:
+            if os.path.exists(self._shard_path(old_shard)):
+                os.remove(self._shard_path(old_shard))
+
+    def get(self, matches, teams, augment_ids = 0, num_workers = 1):
+        """
+        Returns the experiences for each (match, team, augmentation id), generating and caching any that are missing.
+        Args:
+            matches (list(dict)): list of match dictionaries
+            teams (int or list(int)): team perspective to process each match from
+            augment_ids (int or list(int)): augmentation id to process each match with (see Draft.augment_table)
+            num_workers (int): number of processes used to generate missing experiences
+        Returns:
+            experiences (dict): dictionary of experience arrays in the same format as match_processing.process_matches()
+        """
+        self._load()
+        num_matches = len(matches)
+        teams = np.broadcast_to(np.asarray(teams, dtype=np.int64), (num_matches,))
+        augment_ids = np.broadcast_to(np.asarray(augment_ids, dtype=np.int64), (num_matches,))
+        keys = list(zip([match["id"] for match in matches], teams.tolist(), augment_ids.tolist()))
+        hashes = [self.match_hash(match) for match in matches]
+
+        missing = {}
+        for (m, key) in enumerate(keys):
+            entry = self._index.get(key)
+            if entry is None or entry[0] != hashes[m]:
+                missing.setdefault(key, m)
+                self.misses += 1
+            else:
+                self._index.move_to_end(key)
+                self.hits += 1
+
+        # Requested entries are collected before eviction, which may drop some of them when more are requested than the cache holds
+        new_experiences = None
+        if missing:
+            todo = np.array(list(missing.values()))
+            new_experiences = mp.process_matches_parallel([matches[m] for m in todo], teams[todo], augment_ids=augment_ids[todo],
+                                                          num_workers=num_workers, context=self.context)
+            # process_matches returns the experiences of each match as a contiguous block of rows
+            new_keys = zip(new_experiences["match_ids"].tolist(), new_experiences["teams"].tolist(), new_experiences["augment_ids"].tolist())
+            offset = len(self._data["actions"]) if self._data else 0
+            shard = max(self._list_shards() + list(self._shards.keys()), default=-1)+1
+            bounds = {}
+            for (row, key) in enumerate(new_keys):
+                bounds[key] = (bounds.get(key, (row,))[0], row+1)
+            self._append_data(new_experiences)
+            self._shards[shard] = 0
+            for (key, m) in missing.items():
+                (start, stop) = bounds.get(key, (0, 0))
+                self._set_entry(key, (hashes[m], shard, offset+start, offset+stop))
+            self._write_shard(shard, list(missing.keys()), [self._index[key] for key in missing])
+
+        # Collect the requested experiences in match order
+        bounds = np.array([self._index[key][2:] for key in keys], dtype=np.int64).reshape(-1, 2)
+        rows = _ranges(bounds[:,0], bounds[:,1])
+        experiences = {field:self._data[field][rows] for field in ExperienceCache.FIELDS}
+        if missing:
+            self._evict()
+
+        (champ_ids, draft_type, num_positions) = self.context.key
+        start_states = DraftStateBatch.from_encodings(experiences["teams"], experiences["states"], experiences["steps"], champ_ids, num_positions, self.context.draft)
+        experiences["valid_actions"] = start_states.valid_action_masks()
+        return experiences
+
+    def get_hit_rate(self):
+        """
+        Returns the fraction of requested (match, team, augmentation) entries that were read from the cache.
+        """
+        total = self.hits+self.misses
+        return self.hits/total if total else 0.
+
+def _ranges(starts, stops):
+    """
+    Returns the concatenation of np.arange(start, stop) for each (start, stop) pair.
+    """
+    lengths = stops-starts
+    offsets = np.cumsum(lengths)-lengths
+    return np.arange(lengths.sum()) - np.repeat(offsets, lengths) + np.repeat(starts, lengths)
@@ -0,0 +1,129 @@
+"""
+Streaming experience pipeline. Each stage is a generator which pulls from the stage before it only when its own output is requested,
+so work is done lazily, memory is bounded by the size of the shuffle windows and a slow consumer naturally applies backpressure
+to every stage upstream of it. A typical training pipeline is
+
+    matches = shuffle_window(dbo.iter_matches_by_id(match_ids, path_to_db), match_window)
+    experiences = iter_experiences(matches, teams=None, chunk_size=64)
+    batches = iter_batches(shuffle_experiences(experiences, experience_window), batch_size)
+
+Experiences are passed between stages as chunks in the dictionary-of-arrays format produced by match_processing.process_matches().
+"""
+import random
+import itertools
+
+import numpy as np
+from .draftstate import DraftState
+from . import match_processing as mp
+
+TEAMS = [DraftState.BLUE_TEAM, DraftState.RED_TEAM]
+
+def shuffle_window(items, window_size, rng=random):
+    """
+    Approximately shuffles a stream of items using a window of window_size items. Once the window is full each new item replaces a
+    randomly chosen item of the window, which is yielded. Larger windows give a closer approximation to a full shuffle.
+    Args:
+        items (iterable): stream of items (eg. match dictionaries)
+        window_size (int): number of items held in the window
+        rng (optional): random number generator with a randrange() method
+    Yields:
+        item from items
+    """
+    window = []
+    for item in items:
+        if len(window) < window_size:
+            window.append(item)
+            continue
+        k = rng.randrange(window_size)
+        yield window[k]
+        window[k] = item
+    rng.shuffle(window)
+    for item in window:
+        yield item
+
+def iter_experiences(matches, teams=None, chunk_size=64, augment_data=True, num_workers=1):
+    """
+    Processes a stream of matches into chunks of experiences. Matches are read chunk_size at a time and each chunk is processed with
+    match_processing.process_matches() (or process_matches_parallel() if num_workers > 1, with the chunk split evenly between the workers),
+    sampling a uniform augmentation for each match.
+    Args:
+        matches (iterable(dict)): stream of match dictionaries
+        teams (optional) (int): team perspective to process matches from. If None each match is processed from both perspectives.
+        chunk_size (optional) (int): number of matches processed at a time
+        augment_data (optional) (bool): flag controlling augmentation of the matches
+        num_workers (optional) (int): number of processes used to process each chunk
+    Yields:
+        experiences (dict): dictionary of experience arrays for a chunk of matches
+    """
+    matches = iter(matches)
+    while True:
+        chunk = list(itertools.islice(matches, chunk_size))
+        if not chunk:
+            return
+        if teams is None:
+            chunk_teams = np.tile(TEAMS, len(chunk))
+            chunk = [match for match in chunk for team in TEAMS]
+        else:
+            chunk_teams = teams
+        if num_workers > 1:
+            # Split the chunk evenly between the workers, otherwise the whole chunk fits in a single job
+            worker_chunk_size = -(-len(chunk)//num_workers)
+            experiences = mp.process_matches_parallel(chunk, chunk_teams, augment_data=augment_data, num_workers=num_workers, chunk_size=worker_chunk_size)
+        else:
+            experiences = mp.process_matches(chunk, chunk_teams, augment_data=augment_data)
+        if num_experiences(experiences):
+            yield experiences
+
+def shuffle_experiences(chunks, window_size, rng=np.random):
+    """
+    Shuffles a stream of experience chunks using a window of (at least) window_size experiences. Once the window holds more than
+    window_size experiences, the excess is drawn at random from the window and yielded.
+    Args:
+        chunks (iterable(dict)): stream of experience chunks
+        window_size (int): number of experiences held in the window
+        rng (optional): numPy random number generator
+    Yields:
+        experiences (dict): shuffled chunk of experiences
+    """
+    window = None
+    for chunk in chunks:
+        window = chunk if window is None else mp.concatenate_experiences([window, chunk])
+        excess = num_experiences(window) - window_size
+        if excess > 0:
+            order = rng.permutation(num_experiences(window))
+            yield take_experiences(window, order[:excess])
+            window = take_experiences(window, order[excess:])
+    if window is not None and num_experiences(window):
+        yield take_experiences(window, rng.permutation(num_experiences(window)))
+
+def iter_batches(chunks, batch_size, drop_remainder=False):
+    """
+    Regroups a stream of experience chunks into minibatches of batch_size experiences.
+    Args:
+        chunks (iterable(dict)): stream of experience chunks
+        batch_size (int): number of experiences per batch
+        drop_remainder (optional) (bool): if set, a final batch with fewer than batch_size experiences is dropped
+    Yields:
+        batch (dict): dictionary of experience arrays holding batch_size experiences
+    """
+    pending = None
+    for chunk in chunks:
+        pending = chunk if pending is None else mp.concatenate_experiences([pending, chunk])
+        count = num_experiences(pending)
+        for start in range(0, count - count % batch_size, batch_size):
+            yield take_experiences(pending, slice(start, start+batch_size))
+        pending = take_experiences(pending, slice(count - count % batch_size, count))
+    if pending is not None and num_experiences(pending) and not drop_remainder:
+        yield pending
+
+def num_experiences(experiences):
+    """
+    Returns the number of experiences held in a dictionary of experience arrays.
+    """
+    return len(experiences["actions"])
+
+def take_experiences(experiences, rows):
+    """
+    Selects the given rows (an index array or slice) from each array in a dictionary of experience arrays.
+    """
+    return {key:value[rows] for (key, value) in experiences.items()}
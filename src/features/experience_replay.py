@@ -1,4 +1,14 @@
-import random
+import os
+import fcntl
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+from data.champion_info import get_champion_ids
+from .draft import Draft
+from .draftcontext import DraftContext
+from .draftstate import DraftState
+from .samplers import patch_code
 
 class ExperienceBuffer():
     """
@@ -8,48 +18,450 @@ class ExperienceBuffer():
         a  = action taken from state s
         r  = reward obtained for taking action a
         s' = ending state after taking action a
+
+    Experiences are held in preallocated NumPy columns (one row per experience) in the packed format produced by match_processing.process_matches():
+    states are stored as sparse state encodings (see DraftState.format_sparse_state()) along with the team they are drafted for and their submission count,
+    and actions are stored as action ids. Memory use is fixed at max_buffer_size rows (see nbytes) and sampling draws a vector of row indices,
+    so its cost depends only on the sample size.
+
+    If compressed is set, each experience is instead stored as the sequence of submissions leading to its ending state s' along with the number of
+    those submissions which were already made in s. Since s is always a prefix of s', both states are recovered from the one sequence when
+    experiences are read. This uses under a third of the memory of the uncompressed format (51 vs 174 bytes per experience for the default draft).
+
+    Stores and samples are serialized by a lock held by the buffer, so experiences can be sampled on one thread (eg. by a Prefetcher)
+    while they are stored on another.
     Args:
         max_buffer_size (int): maximum number of experiences to store in the buffer, default value is 300.
+        sparse_state_size (int): length of the stored sparse state encodings. Defaults to the number of submissions in the default draft.
+        compressed (bool): flag to store experiences as compressed submission sequences
+        pad_index (int): index used to pad sparse state encodings (see DraftContext.pad_index), needed to decode compressed experiences.
+            Defaults to the pad index of the default draft context.
+        sampler (UniformSampler): sampler used to draw experiences (see features/samplers.py). Defaults to uniform sampling.
     """
-    def __init__(self, max_buffer_size = 300):
-        self.buffer = []
+    def __init__(self, max_buffer_size = 300, sparse_state_size = None, compressed = False, pad_index = None, sampler = None):
+        if sparse_state_size is None:
+            sparse_state_size = Draft("default").num_submissions
+        if pad_index is None:
+            pad_index = DraftContext.get(get_champion_ids()).pad_index
         self.buffer_size = max_buffer_size
+        self.sparse_state_size = sparse_state_size
+        self.compressed = compressed
+        self.pad_index = pad_index
+        self.sampler = sampler
+        self.lock = threading.RLock()
         self.oldest_experience = 0
+        self.count = 0
+
+        self.buffer = {key:np.zeros((max_buffer_size,)+shape, dtype=dtype) for (key, dtype, shape) in self.column_specs(sparse_state_size, compressed)}
+
+    @staticmethod
+    def column_specs(sparse_state_size, compressed = False):
+        """
+        Returns the (name, dtype, row shape) of each column held by the buffer.
+        """
+        if compressed:
+            return [("teams", np.int8, ()),
+                    ("steps", np.int8, ()),
+                    ("next_steps", np.int8, ()),
+                    ("num_cells", np.int8, ()),
+                    ("sequences", np.uint16, (sparse_state_size,)),
+                    ("actions", np.int16, ()),
+                    ("rewards", np.float32, ()),
+                    ("terminal", np.bool_, ()),
+                    ("patches", np.int16, ())]
+        return [("teams", np.int8, ()),
+                ("steps", np.int16, ()),
+                ("states", np.int32, (sparse_state_size,)),
+                ("actions", np.int32, ()),
+                ("rewards", np.float32, ()),
+                ("next_steps", np.int16, ()),
+                ("next_states", np.int32, (sparse_state_size,)),
+                ("terminal", np.bool_, ()),
+                ("patches", np.int16, ())]
 
-    def store(self, experiences):
+    def store(self, experiences, patch = None):
         """
-        ExperienceBuffer.store stores the input list of experience tuples into the buffer. The expereince is stored in one of two ways:
-        1) If the buffer has space remaining, the experience is appended to the end
+        ExperienceBuffer.store stores the input experiences into the buffer. The expereince is stored in one of two ways:
+        1) If the buffer has space remaining, the experience is written to the next empty row
         2) If the buffer is full, the input experience replaces the oldest experience in the buffer
 
         Args:
-            experiences ( list(tuple) ): each experience is a tuple of the form (s, a, r, s')
+            experiences ( list(tuple) or dict ): each experience is a tuple of the form (s, a, r, s') where s and s' are DraftStates and a = (champion_id, position).
+                Alternatively a dictionary of experience arrays as returned by match_processing.process_matches(), which may include a "patches" array of patch codes.
+            patch (string): patch the experiences were drawn from (eg. "8.13"), used by samplers which weight experiences by patch recency
         Returns:
             None
         """
-        for experience in experiences:
-            if len(self.buffer) < self.buffer_size:
-                self.buffer.append(experience)
-            else:
-                self.buffer[self.oldest_experience] = experience
-                self.oldest_experience += 1
-                self.oldest_experience = self.oldest_experience % self.buffer_size
+        with self.lock:
+            self._write(experiences, patch)
         return None
 
-    def sample(self, sample_size):
+    def _write(self, experiences, patch = None):
+        """
+        Writes experiences into the buffer by ring index. Returns the rows written to.
+        """
+        if not isinstance(experiences, dict):
+            experiences = self.encode_experiences(experiences)
+        if "patches" not in experiences or patch is not None:
+            experiences = dict(experiences, patches=np.full(len(experiences["actions"]), patch_code(patch), dtype=np.int16))
+        if self.compressed:
+            experiences = self.compress(experiences)
+        n_exp = len(experiences["actions"])
+        if n_exp == 0:
+            return np.zeros(0, dtype=np.int64)
+        # Only the newest buffer_size experiences would survive the write
+        first = max(0, n_exp-self.buffer_size)
+        start = (self.oldest_experience + self.count) % self.buffer_size
+        rows = (start + np.arange(first, n_exp)) % self.buffer_size
+        for (key, column) in self.buffer.items():
+            column[rows] = experiences[key][first:]
+        if self.count+n_exp >= self.buffer_size:
+            self.oldest_experience = (start + n_exp) % self.buffer_size
+        self.count = min(self.count+n_exp, self.buffer_size)
+        if self.sampler is not None:
+            self.sampler.update(self, rows)
+        return rows
+
+    def encode_experiences(self, experiences):
         """
-        ExperienceBuffer.sample samples the current buffer using random.sample to return a collection of sample_size experiences from the replay buffer.
-        random.sample samples without replacement, so sample_size must be no larger than the length of the current buffer.
+        Packs a list of (s, a, r, s') experience tuples into a dictionary of experience arrays.
+        """
+        n_exp = len(experiences)
+        encoded = {key:np.zeros((n_exp,)+shape, dtype=dtype) for (key, dtype, shape) in self.column_specs(self.sparse_state_size)}
+        for (n, (state, (cid, pos), reward, next_state)) in enumerate(experiences):
+            encoded["teams"][n] = state.team
+            encoded["steps"][n] = state._num_bans+state._num_picks
+            encoded["states"][n] = self.encode_state(state)
+            encoded["actions"][n] = state.get_action(cid, pos)
+            encoded["rewards"][n] = reward
+            encoded["next_steps"][n] = next_state._num_bans+next_state._num_picks
+            encoded["next_states"][n] = self.encode_state(next_state)
+            # Experiences ending in an illegal submission are terminal
+            status = next_state.evaluate()
+            encoded["terminal"][n] = (status == DraftState.DRAFT_COMPLETE) or (status in DraftState.invalid_states)
+        return encoded
+
+    def encode_state(self, state):
+        """
+        Returns the sparse encoding of state (see DraftState.format_sparse_state()). Unlike format_sparse_state() invalid states are also
+        encoded, since the learner's illegal submissions are stored as experiences. The submissions of an invalid state still encode it exactly:
+        its invalid flags are recovered when the encoding is decoded by DraftStateBatch.from_encodings().
+        """
+        encoding = np.full(self.sparse_state_size, self.pad_index, dtype=np.int32)
+        cells = state._cells[:self.sparse_state_size]
+        encoding[:len(cells)] = cells
+        return encoding
+
+    def sample(self, sample_size, replace = True):
+        """
+        ExperienceBuffer.sample draws a random collection of sample_size experiences from the replay buffer. By default rows are drawn with replacement
+        (using the buffer's sampler if it has one), which keeps the cost of sampling proportional to sample_size. Sampling without replacement is always uniform
+        and requires sample_size to be no larger than the current buffer.
 
         Args:
             sample_size (int): number of samples to take from buffer
+            replace (bool): flag to sample with replacement
         Returns:
-            sample (list(tuples)): list of experience replay samples. len(sample) = sample_size.
+            sample (dict): dictionary of experience arrays holding sample_size experiences
         """
-        return random.sample(self.buffer,sample_size)
+        with self.lock:
+            if self.sampler is not None and replace:
+                rows = self.sampler.sample(self, sample_size)
+            elif replace:
+                rows = np.random.randint(self.count, size=sample_size)
+            else:
+                rows = np.random.choice(self.count, size=sample_size, replace=False)
+            return self.take(rows)
+
+    def take(self, rows):
+        """
+        Returns a dictionary of experience arrays holding the experiences stored in the given rows (an index array or slice) of the buffer.
+        """
+        with self.lock:
+            experiences = {key:column[rows] for (key, column) in self.buffer.items()}
+        if self.compressed:
+            experiences = self.decompress(experiences)
+        return experiences
+
+    def compress(self, experiences):
+        """
+        Converts a dictionary of experience arrays into the compressed storage format. The submission sequence of each experience is the sparse
+        encoding of its ending state, and num_cells counts the leading entries of the sequence which belong to its starting state.
+        """
+        compressed = {key:experiences[key] for key in ["teams", "steps", "next_steps", "actions", "rewards", "terminal", "patches"]}
+        compressed["num_cells"] = (np.asarray(experiences["states"]) != self.pad_index).sum(axis=1)
+        compressed["sequences"] = experiences["next_states"]
+        return compressed
+
+    def decompress(self, experiences):
+        """
+        Vectorized decode of compressed experiences back into sparse state encodings (the inverse of compress()).
+        """
+        sequences = experiences.pop("sequences").astype(np.int32)
+        num_cells = experiences.pop("num_cells")
+        experiences["states"] = np.where(np.arange(self.sparse_state_size) < num_cells[:,None], sequences, self.pad_index).astype(np.int32)
+        experiences["next_states"] = sequences
+        return experiences
+
+    def get_experiences(self):
+        """
+        Returns a dictionary of experience arrays holding every experience currently in the buffer.
+        """
+        return self.take(slice(0, self.count))
 
     def get_buffer_size(self):
         """
-        Returns length of the buffer.
+        Returns number of experiences currently held in the buffer.
+        """
+        return self.count
+
+    @property
+    def nbytes(self):
+        """
+        Memory (in bytes) held by the buffer's columns.
+        """
+        return sum(column.nbytes for column in self.buffer.values())
+
+class MappedExperienceBuffer(ExperienceBuffer):
+    """
+    MappedExperienceBuffer is an ExperienceBuffer whose columns live in a memory-mapped file rather than in process memory. The buffer
+    persists between runs (a restarted run reopening the same file resumes with its buffer warm) and can be shared by several processes,
+    eg. actors storing experiences and a learner sampling them, each of which opens the same path.
+
+    The file begins with a small header (see HEADER_DTYPE) recording the buffer dimensions along with the write position (oldest_experience)
+    and number of stored experiences (count), followed by each column in turn. Stores are serialized between processes by an exclusive
+    lock on the file and the header is only updated once the rows have been written, so readers never see rows which have not been filled.
+    Readers in other processes do not take the file lock, so a sample may include a row which another process is overwriting at the same time.
+    Args:
+        path (string): path to the buffer file. Created if it does not exist.
+        max_buffer_size (int): maximum number of experiences to store in the buffer. If None the size is read from an existing file.
+        sparse_state_size (int): length of the stored sparse state encodings. If None the size is read from an existing file,
+            otherwise it defaults to the number of submissions in the default draft.
+        compressed (bool): flag to store compressed experiences (see ExperienceBuffer). If None the storage format is read from an existing file.
+        pad_index (int): index used to pad sparse state encodings. If None the index is read from an existing file,
+            otherwise it defaults to the pad index of the default draft context.
+        sampler (UniformSampler): sampler used to draw experiences. Defaults to uniform sampling. Stateful samplers (eg. StratifiedSampler)
+            are not supported since they would not see the rows stored by other processes.
+    """
+    MAGIC = b"SWAINER2"
+    HEADER_DTYPE = np.dtype([("magic", "S8"), ("buffer_size", "<i8"), ("sparse_state_size", "<i8"), ("count", "<i8"), ("oldest_experience", "<i8"),
+                             ("compressed", "<i8"), ("pad_index", "<i8")])
+    HEADER_SIZE = 64
+
+    def __init__(self, path, max_buffer_size = None, sparse_state_size = None, compressed = None, pad_index = None, sampler = None):
+        if sampler is not None and sampler.stateful:
+            raise ValueError("{} is not supported with a memory-mapped buffer, since rows stored by other processes are not indexed".format(type(sampler).__name__))
+        self.path = path
+        self.sampler = sampler
+        self.lock = threading.RLock()
+        if not os.path.exists(path):
+            if max_buffer_size is None:
+                raise ValueError("max_buffer_size is required to create a new buffer file {}".format(path))
+            if sparse_state_size is None:
+                sparse_state_size = Draft("default").num_submissions
+            if pad_index is None:
+                pad_index = DraftContext.get(get_champion_ids()).pad_index
+            self._create(path, max_buffer_size, sparse_state_size, bool(compressed), pad_index)
+
+        self._header = np.memmap(path, dtype=MappedExperienceBuffer.HEADER_DTYPE, mode="r+", shape=(1,))
+        header = self._header[0]
+        if header["magic"] != MappedExperienceBuffer.MAGIC:
+            raise ValueError("{} is not an experience buffer file".format(path))
+        if (max_buffer_size not in (None, header["buffer_size"])) or (sparse_state_size not in (None, header["sparse_state_size"])):
+            raise ValueError("Buffer file {} has size {} x {}, not {} x {}".format(path, header["buffer_size"], header["sparse_state_size"], max_buffer_size, sparse_state_size))
+        if (compressed not in (None, bool(header["compressed"]))) or (pad_index not in (None, header["pad_index"])):
+            raise ValueError("Buffer file {} has storage format (compressed={}, pad_index={}), not ({}, {})".format(path, bool(header["compressed"]), header["pad_index"], compressed, pad_index))
+        self.buffer_size = int(header["buffer_size"])
+        self.sparse_state_size = int(header["sparse_state_size"])
+        self.compressed = bool(header["compressed"])
+        self.pad_index = int(header["pad_index"])
+
+        self.buffer = {}
+        offset = MappedExperienceBuffer.HEADER_SIZE
+        for (key, dtype, shape) in self.column_specs(self.sparse_state_size, self.compressed):
+            self.buffer[key] = np.memmap(path, dtype=dtype, mode="r+", offset=offset, shape=(self.buffer_size,)+shape)
+            offset += self.buffer[key].nbytes
+
+    @classmethod
+    def _create(cls, path, max_buffer_size, sparse_state_size, compressed, pad_index):
+        """
+        Writes an empty buffer file. The file is written under a temporary name and then moved into place so that
+        processes opening the buffer at the same time never see a partially written file.
+        """
+        num_bytes = cls.HEADER_SIZE + sum(max_buffer_size*int(np.prod(shape, dtype=np.int64))*np.dtype(dtype).itemsize for (_, dtype, shape) in cls.column_specs(sparse_state_size, compressed))
+        header = np.zeros(1, dtype=cls.HEADER_DTYPE)
+        header[0] = (cls.MAGIC, max_buffer_size, sparse_state_size, 0, 0, compressed, pad_index)
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        with open(tmp_path, "wb") as f:
+            f.write(header.tobytes())
+            f.truncate(num_bytes)
+        if not os.path.exists(path):
+            os.replace(tmp_path, path)
+        else:
+            os.remove(tmp_path)
+
+    @property
+    def count(self):
+        return int(self._header["count"][0])
+
+    @count.setter
+    def count(self, value):
+        self._header["count"][0] = value
+
+    @property
+    def oldest_experience(self):
+        return int(self._header["oldest_experience"][0])
+
+    @oldest_experience.setter
+    def oldest_experience(self, value):
+        self._header["oldest_experience"][0] = value
+
+    @contextmanager
+    def _lock(self):
+        """
+        Holds an exclusive lock on the buffer file, shared by every process which has the buffer open.
+        """
+        with open(self.path, "rb") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _write(self, experiences, patch = None):
+        with self._lock():
+            return super()._write(experiences, patch)
+
+    def __reduce__(self):
+        # Other processes reopen the file rather than receiving a copy of the buffer
+        return (MappedExperienceBuffer, (self.path,))
+
+    def flush(self):
+        """
+        Flushes buffered writes to disk.
+        """
+        for column in self.buffer.values():
+            column.flush()
+        self._header.flush()
+
+class PrioritizedExperienceBuffer(ExperienceBuffer):
+    """
+    PrioritizedExperienceBuffer is an ExperienceBuffer which samples experiences in proportion to their priority rather than uniformly
+    (see https://arxiv.org/abs/1511.05952). Priorities are given by
+        p = (|delta| + epsilon)^alpha
+    where delta is the most recent TD error computed for the experience. New experiences are given the largest priority seen so far
+    so that each is sampled at least once. Sampled experiences include importance sampling weights
+        w = (N*P(i))^(-beta) / max_j w_j
+    which correct the bias introduced by prioritized sampling when used to weight the loss.
+    Priorities are kept in a SumTree so that sampling and priority updates are O(log n).
+    Args:
+        max_buffer_size (int): maximum number of experiences to store in the buffer
+        alpha (float): how strongly sampling is prioritized (alpha = 0 -> uniform sampling)
+        beta (float): strength of importance sampling correction (beta = 1 -> full correction). Usually annealed towards 1 over training.
+        epsilon (float): small constant ensuring every experience has a non-zero chance of being sampled
+        sparse_state_size (int): length of the stored sparse state encodings
+        compressed (bool): flag to store compressed experiences (see ExperienceBuffer)
+    """
+    def __init__(self, max_buffer_size = 300, alpha = 0.6, beta = 0.4, epsilon = 1.e-3, sparse_state_size = None, compressed = False):
+        super().__init__(max_buffer_size, sparse_state_size, compressed)
+        self.alpha = alpha
+        self.beta = beta
+        self.epsilon = epsilon
+        self.max_priority = 1.
+        self.tree = SumTree(max_buffer_size)
+
+    def store(self, experiences, patch = None):
+        """
+        Stores the input experiences (see ExperienceBuffer.store) with the largest priority seen so far.
+        """
+        with self.lock:
+            rows = self._write(experiences, patch)
+            self.tree.update(rows, np.full(len(rows), self.max_priority))
+        return None
+
+    def sample(self, sample_size, replace = True):
+        """
+        Draws sample_size experiences with probability proportional to their priority. The range of total priority is divided into
+        sample_size equal segments and one experience is drawn from each (stratified sampling).
+        Args:
+            sample_size (int): number of samples to take from buffer
+            replace (bool): unused, experiences are always drawn with replacement
+        Returns:
+            sample (dict): dictionary of experience arrays holding sample_size experiences. sample["rows"] gives the buffer row of each experience
+                (to be passed to update_priorities()) and sample["weights"] gives its importance sampling weight.
+        """
+        with self.lock:
+            total = self.tree.total()
+            values = (np.arange(sample_size) + np.random.random_sample(sample_size))*(total/sample_size)
+            rows = np.minimum(self.tree.find(values), self.count-1)
+            probabilities = self.tree.get(rows)/total
+            weights = (self.count*probabilities)**(-self.beta)
+            sample = self.take(rows)
+        sample["rows"] = rows
+        sample["weights"] = (weights/weights.max()).astype(np.float32)
+        return sample
+
+    def update_priorities(self, rows, td_errors):
+        """
+        Updates the priorities of the experiences in the given buffer rows from their TD errors.
+        Args:
+            rows (array(int)): buffer rows (as returned in sample["rows"])
+            td_errors (array(float)): TD error computed for each experience
+        Returns:
+            None
+        """
+        priorities = (np.abs(td_errors) + self.epsilon)**self.alpha
+        with self.lock:
+            self.tree.update(rows, priorities)
+            if len(priorities):
+                self.max_priority = max(self.max_priority, float(priorities.max()))
+        return None
+
+class SumTree():
+    """
+    SumTree is a binary tree whose leaves hold non-negative values and whose internal nodes hold the sum of their children, so that
+    the root holds the total. Leaves can be updated and located by cumulative sum in O(log n). The tree is stored as a flat array
+    (node k has children 2k and 2k+1) and every operation acts on a vector of leaves at once, processing one level of the tree at a time.
+    Args:
+        capacity (int): number of leaves
+    """
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.depth = max(0, int(capacity-1).bit_length())
+        self.num_leaves = 1 << self.depth
+        self.nodes = np.zeros(2*self.num_leaves, dtype=np.float64)
+
+    def total(self):
+        """
+        Returns the sum of all leaf values.
+        """
+        return self.nodes[1]
+
+    def get(self, leaves):
+        """
+        Returns the values held by the given leaves.
+        """
+        return self.nodes[self.num_leaves + np.asarray(leaves)]
+
+    def update(self, leaves, values):
+        """
+        Sets the value of each of the given leaves and updates the sums above them. If a leaf is repeated the last value given is kept.
+        """
+        nodes = self.num_leaves + np.asarray(leaves, dtype=np.int64)
+        self.nodes[nodes] = values
+        for level in range(self.depth):
+            nodes = np.unique(nodes >> 1)
+            self.nodes[nodes] = self.nodes[2*nodes] + self.nodes[2*nodes+1]
+
+    def find(self, values):
+        """
+        Returns, for each value v, the first leaf whose cumulative sum (including itself) exceeds v.
         """
-        return len(self.buffer)
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for level in range(self.depth):
+            left = 2*nodes
+            go_right = values >= self.nodes[left]
+            values -= np.where(go_right, self.nodes[left], 0.)
+            nodes = left + go_right
+        return nodes - self.num_leaves
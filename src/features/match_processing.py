@@ -1,12 +1,18 @@
 from collections import deque
+import numpy as np
+from data.champion_info import get_champion_ids
+from .draft import Draft
+from .draftcontext import DraftContext
 from .draftstate import DraftState
-from .rewards import get_reward
-from copy import deepcopy
+from .draftstatebatch import DraftStateBatch
+from .rewards import get_reward, get_rewards, get_winning_teams
 
 import random
-import json
+import multiprocessing
 
-def process_match(match, team, augment_data=True):
+DEFAULT_DRAFT = Draft("default")
+
+def process_match(match, team, augment_data=True, augment_id=None):
     """
     process_match takes an input match and breaks each incremental pick and ban down the draft into experiences (aka "memories").
 
@@ -16,6 +22,8 @@ def process_match(match, team, augment_data=True):
             The selected team has the positions for each pick explicitly included with the experience while the
             "opposing" team has the assigned positions for its champion picks masked.
         augment_data (optional) (bool): flag controlling the randomized ordering of submissions that do not affect the draft as a whole
+        augment_id (optional) (int): augmentation id to process the match with (see Draft.augment_table). If not given and augment_data
+            is set, an augmentation id is sampled uniformly.
     Returns:
         experiences ( list(tuple) ): list of experience tuples. Each experience is of the form (s, a, r, s') where:
             - s and s' are DraftState states before and after a single action
@@ -26,8 +34,6 @@ def process_match(match, team, augment_data=True):
     process_match() can take the vantage from both sides of the draft to parse for memories. This means we can ultimately sample from
     both winning drafts (positive reinforcement) and losing drafts (negative reinforcement) when training.
     """
-    experiences = []
-
     # This section controls data agumentation of the match. Certain submissions in the draft are
     # submitted consecutively by the same team during the same phase (ie team1 pick0 -> team1 pick1).
     # Although these submissions were produced in a particular order, from a draft perspective
@@ -40,127 +46,338 @@ def process_match(match, team, augment_data=True):
     # fall outside of the conditions listed above, in practice bans made in the same phase are
     # interchangable in order.
 
-    # Build queue of actions from match reference (augmenting if desired)
-    augments_list = [
-        ("blue","bans",slice(0,3)), # Blue bans 0,1,2 are augmentable
-        ("blue","bans",slice(3,5)), # Blue bans 3,4 are augmentable
-        ("red","bans",slice(0,3)),
-        ("red","bans",slice(3,5)),
-        ("blue","picks",slice(1,3)), # Blue picks 1,2 are augmentable
-        ("blue","picks",slice(3,5)), # Blue picks 3,4 are augmentable
-        ("red","picks",slice(0,2)) # Red picks 0,1 are augmentable
-    ]
-    if(augment_data):
-        augmented_match = deepcopy(match) # Deepcopy match to avoid side effects
-        for aug in augments_list:
-            (k1,k2,aug_range) = aug
-            count = len(augmented_match[k1][k2][aug_range])
-            augmented_match[k1][k2][aug_range] = random.sample(augmented_match[k1][k2][aug_range],count)
-
-        action_queue = build_action_queue(augmented_match)
-    else:
-        action_queue = build_action_queue(match)
+    # Every such reordering is enumerated once by the draft structure (see Draft.augment_table), so augmenting a match
+    # only requires choosing an augmentation id.
+    if augment_id is None:
+        augment_id = random.randrange(DEFAULT_DRAFT.num_augmentations) if augment_data else 0
+    action_queue = build_action_queue(match, augment_id=augment_id)
+
+    return _replay_action_queue(match, action_queue, [team])[team]
+
+def process_match_both_sides(match, augment_data=True, augment_id=None):
+    """
+    Processes a match from both team perspectives in a single pass. The action queue is built (and augmented) once and each submission
+    is applied to a DraftState for each perspective in lockstep, so
+        process_match_both_sides(match, augment_id=a)[team] == process_match(match, team, augment_id=a)
+    Both perspectives see the same augmented ordering of the match.
+    Args:
+        match (dict): match dictionary with pick and ban data for a single game.
+        augment_data (optional) (bool): flag controlling the randomized ordering of submissions that do not affect the draft as a whole
+        augment_id (optional) (int): augmentation id to process the match with (see process_match())
+    Returns:
+        experiences (dict): experiences[team] is the list of experience tuples for team (see process_match())
+    """
+    if augment_id is None:
+        augment_id = random.randrange(DEFAULT_DRAFT.num_augmentations) if augment_data else 0
+    action_queue = build_action_queue(match, augment_id=augment_id)
+    return _replay_action_queue(match, action_queue, [DraftState.BLUE_TEAM, DraftState.RED_TEAM])
 
-    # Set up draft state
-    draft = DraftState(team)
+def _replay_action_queue(match, action_queue, teams):
+    """
+    Replays the submissions in action_queue through a DraftState for each team perspective in teams and collects the experiences for each.
+    Returns:
+        experiences (dict): experiences[team] is the list of experience tuples for team
+    """
+    # Set up draft states
+    drafts = {team:DraftState(team) for team in teams}
+    experiences = {team:[] for team in teams}
+    # Memories which have been started (s, a) but are still waiting for their ending state s'
+    open_memories = {team:None for team in teams}
 
-    finish_memory = False
     while action_queue:
         # Get next pick from deque
         submission = action_queue.popleft()
         (submitting_team, pick, position) = submission
 
-        # There are two conditions under which we want to finalize a memory:
-        # 1. Non-designated team has finished submitting picks for this phase (ie next submission belongs to the designated team)
-        # 2. Draft is complete (no further picks in the draft)
-        if submitting_team == team:
-            if finish_memory:
-                # This is case 1 to store memory
-                r = get_reward(draft, match, a, a)
-                s_next = deepcopy(draft)
-                memory = (s, a, r, s_next)
-                experiences.append(memory)
-                finish_memory = False
-            # Memory starts when upcoming pick belongs to designated team
-            s = deepcopy(draft)
-            # Store action = (champIndex, pos)
-            a = (pick, position)
-            finish_memory = True
-        else:
-            # Mask positions for pick submissions belonging to the non-designated team
-            if position != -1:
-                position = 0
-
-        draft.update(pick, position)
+        for team in teams:
+            draft = drafts[team]
+            # There are two conditions under which we want to finalize a memory:
+            # 1. Non-designated team has finished submitting picks for this phase (ie next submission belongs to the designated team)
+            # 2. Draft is complete (no further picks in the draft)
+            if submitting_team == team:
+                if open_memories[team]:
+                    # This is case 1 to store memory
+                    (s, a) = open_memories[team]
+                    r = get_reward(draft, match, a, a)
+                    s_next = draft.snapshot()
+                    experiences[team].append((s, a, r, s_next))
+                # Memory starts when upcoming pick belongs to designated team
+                # Store action = (champIndex, pos)
+                open_memories[team] = (draft.snapshot(), (pick, position))
+                draft.update(pick, position)
+            else:
+                # Mask positions for pick submissions belonging to the non-designated team
+                draft.update(pick, 0 if position != -1 else position)
 
     # Once the queue is empty, store last memory. This is case 2 above.
     # There is always an outstanding memory at the completion of the draft.
     # RED_TEAM always gets last pick. Therefore:
     #   if team = BLUE_TEAM -> There is an outstanding memory from last RED_TEAM submission
     #   if team = RED_TEAM -> Memory is open from just before our last submission
-    if(draft.evaluate() == DraftState.DRAFT_COMPLETE):
-        assert finish_memory == True
-        r = get_reward(draft, match, a, a)
-        s_next = deepcopy(draft)
-        memory = (s, a, r, s_next)
-        experiences.append(memory)
+    for team in teams:
+        draft = drafts[team]
+        if(draft.evaluate() == DraftState.DRAFT_COMPLETE):
+            assert open_memories[team]
+            (s, a) = open_memories[team]
+            r = get_reward(draft, match, a, a)
+            s_next = draft.snapshot()
+            experiences[team].append((s, a, r, s_next))
+        else:
+            print("Week {} match_id {} {} vs {}".format(match["week"], match["id"], match["blue_team"],match["red_team"]))
+            draft.display()
+            print("Error code {}".format(draft.evaluate()))
+            print("Number of experiences {}".format(len(experiences[team])))
+            for experience in experiences[team]:
+                _,a,_,_ = experience
+                print(a)
+            print("")#raise
+
+    return experiences
+
+def process_matches(matches, teams, augment_data=True, augment_ids=None, context=None):
+    """
+    Array-native version of process_match(). Breaks each match into the same experiences that process_match() produces, but
+    builds them directly as numPy arrays without replaying the matches through DraftState objects. Experiences with NULL actions
+    (usually missing bans) are dropped since they cannot be submitted by the learner. Matches which do not replay into a complete,
+    valid draft are skipped.
+
+    Args:
+        matches (dict or list(dict)): match dictionary or list of match dictionaries with pick and ban data
+        teams (int or list(int)): team perspective used to process each match (DraftState.BLUE_TEAM or DraftState.RED_TEAM).
+            A single team is used for every match.
+        augment_data (optional) (bool): flag controlling the randomized ordering of interchangeable submissions. If set each match
+            is processed with a uniformly sampled augmentation (see Draft.augment_table)
+        augment_ids (optional) (int or list(int)): augmentation id to process each match with. Overrides augment_data.
+        context (optional) (DraftContext): context describing the draft. Defaults to the context used by DraftState(team).
+    Returns:
+        experiences (dict): dictionary of arrays with one row per experience (s, a, r, s'):
+            "match_ids" -> id of the match the experience came from
+            "augment_ids" -> augmentation id the match was processed with
+            "teams" -> team perspective of the experience
+            "steps", "next_steps" -> number of submissions (including NULL bans) made in s and s'
+            "states", "next_states" -> sparse encodings of s and s' (see DraftState.format_sparse_state())
+            "actions" -> action id of a
+            "rewards" -> reward obtained from submitting a (see get_reward())
+            "terminal" -> True if s' is a completed draft
+            "valid_actions" -> valid action mask for s
+        DraftStateBatch.from_encodings() rebuilds s or s' from (teams, states, steps) for dense inputs or valid action masks.
+    """
+    if isinstance(matches, dict):
+        matches = [matches]
+    if context is None:
+        context = DraftContext.get(get_champion_ids(), DEFAULT_DRAFT.draft_type, 5)
+    draft = context.draft
+    num_matches = len(matches)
+    n = draft.num_submissions
+    teams = np.broadcast_to(np.asarray(teams, dtype=np.int64), (num_matches,))
+
+    if augment_ids is not None:
+        augment_ids = np.broadcast_to(np.asarray(augment_ids, dtype=np.int64), (num_matches,))
+    elif(augment_data):
+        augment_ids = np.random.randint(draft.num_augmentations, size=num_matches)
     else:
-        print("Week {} match_id {} {} vs {}".format(match["week"], match["id"], match["blue_team"],match["red_team"]))
-        draft.display()
-        print("Error code {}".format(draft.evaluate()))
-        print("Number of experiences {}".format(len(experiences)))
-        for experience in experiences:
-            _,a,_,_ = experience
-            print(a)
-        print("")#raise
+        augment_ids = np.zeros(num_matches, dtype=np.int64)
+
+    (champion_ids, positions, complete) = _submission_arrays(matches, draft)
+    if np.any(augment_ids):
+        rows = np.arange(num_matches)[:,None]
+        order = draft.augment_table[augment_ids]
+        champion_ids = champion_ids[rows, order]
+        positions = positions[rows, order]
+
+    # Positions of picks made by the opposing team are masked
+    is_ally = draft.team_table[None,:n] == teams[:,None]
+    is_pick = np.broadcast_to(draft.phase_table[None,:n] == Draft.PICK, is_ally.shape)
+    positions = np.where(is_pick & ~is_ally, 0, positions)
+    indices = context.get_state_indices(champion_ids)
+    is_null = champion_ids == -1
+
+    # Drafts are valid if every submission is to a known champion in a legal position, no champion is submitted more than once and
+    # each of our positions is filled exactly once. Only bans may be NULL.
+    steps = np.arange(n)
+    valid = complete & np.all(((indices >= 0) | (is_null & ~is_pick)) & (positions >= -1) & (positions <= context.num_positions), axis=1)
+    valid &= np.all((positions > 0) | ~(is_ally & is_pick), axis=1)
+    unique_indices = np.sort(np.where(indices >= 0, indices, -1-steps), axis=1)
+    valid &= np.all(np.diff(unique_indices, axis=1) != 0, axis=1)
+    unique_positions = np.sort(np.where(is_ally & is_pick, positions, -1-steps), axis=1)
+    valid &= np.all(np.diff(unique_positions, axis=1) != 0, axis=1)
+    num_ally_picks = np.sum(is_ally & is_pick, axis=1)
+    valid &= (num_ally_picks == context.num_positions) & (draft.NUM_PICKS-num_ally_picks == context.num_positions)
+    if not np.all(valid):
+        print("Skipping {} match(es) which do not produce a complete draft: {}".format(np.sum(~valid), [matches[m]["id"] for m in np.nonzero(~valid)[0]]))
+
+    # Flattened state cell of each submission and the sparse encoding of the draft after each number of submissions
+    pos_indices = context.pos_to_pos_index_table[np.clip(positions+1, 0, context.num_columns-1)]
+    cells = np.where(indices >= 0, indices*context.num_columns + pos_indices, context.pad_index)
+    prefixes = np.where(steps[None,None,:] < np.arange(n+1)[None,:,None], cells[:,None,:], context.pad_index)
+    # NULL bans leave no cell, so move padding to the end of each encoding
+    order = np.argsort(prefixes == context.pad_index, axis=2, kind="mergesort")
+    prefixes = prefixes[np.arange(num_matches)[:,None,None], np.arange(n+1)[None,:,None], order]
+    prefixes = prefixes[:, :, :context.sparse_state_size].astype(np.int32)
+
+    # Each of our submissions starts an experience which ends just before our next submission (or at the end of the draft)
+    ally_steps = np.where(is_ally, steps, n)
+    following = np.concatenate([ally_steps[:,1:], np.full((num_matches,1), n)], axis=1)
+    next_ally_steps = np.minimum.accumulate(following[:,::-1], axis=1)[:,::-1]
 
+    (match_rows, exp_steps) = np.nonzero(valid[:,None] & is_ally & ~is_null)
+    exp_teams = teams[match_rows]
+    next_steps = next_ally_steps[match_rows, exp_steps]
+    terminal = next_steps == n
+
+    # Observed submissions are always valid and correct, so only completing the draft changes the reward
+    status = np.where(terminal, DraftState.DRAFT_COMPLETE, 0)
+    rewards = get_rewards(status, exp_teams, get_winning_teams(matches)[match_rows], np.ones(len(match_rows), dtype=bool))
+
+    states = prefixes[match_rows, exp_steps]
+    (champ_ids, draft_type, num_positions) = context.key
+    start_states = DraftStateBatch.from_encodings(exp_teams, states, exp_steps, champ_ids, num_positions, draft)
+
+    experiences = {}
+    experiences["match_ids"] = np.array([match["id"] for match in matches])[match_rows]
+    experiences["augment_ids"] = augment_ids[match_rows]
+    experiences["teams"] = exp_teams
+    experiences["steps"] = exp_steps
+    experiences["states"] = states
+    experiences["actions"] = context.encode_actions(champion_ids[match_rows, exp_steps], positions[match_rows, exp_steps])
+    experiences["rewards"] = rewards
+    experiences["next_steps"] = next_steps
+    experiences["next_states"] = prefixes[match_rows, next_steps]
+    experiences["terminal"] = terminal
+    experiences["valid_actions"] = start_states.valid_action_masks()
     return experiences
 
-def build_action_queue(match):
+def process_matches_parallel(matches, teams, augment_data=True, augment_ids=None, num_workers=None, chunk_size=256, context=None):
     """
-    Builds queue of champion picks or bans (depending on mode) in selection order. If mode = 'ban' this produces a queue of tuples
+    Parallel version of process_matches(). The matches are split into chunks of chunk_size which are processed by a pool of
+    worker processes. Workers return their experiences as numPy arrays so only compact array buffers (rather than pickled DraftStates)
+    are sent back to the parent process. Augmentation ids are sampled in the parent so that seeding np.random gives reproducible results.
+    Args:
+        matches (list(dict)): list of match dictionaries
+        teams (int or list(int)): team perspective to process each match from
+        augment_data, augment_ids, context: as in process_matches()
+        num_workers (optional) (int): number of worker processes. Defaults to the number of cpus.
+        chunk_size (optional) (int): number of matches processed by a worker at a time
+    Returns:
+        experiences (dict): dictionary of experience arrays in the same format (and order) as process_matches()
+    """
+    num_matches = len(matches)
+    teams = np.broadcast_to(np.asarray(teams, dtype=np.int64), (num_matches,))
+    if augment_ids is None:
+        draft = DEFAULT_DRAFT if context is None else context.draft
+        augment_ids = np.random.randint(draft.num_augmentations, size=num_matches) if augment_data else 0
+    augment_ids = np.broadcast_to(np.asarray(augment_ids, dtype=np.int64), (num_matches,))
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+
+    jobs = [(matches[k:k+chunk_size], teams[k:k+chunk_size], augment_ids[k:k+chunk_size], context) for k in range(0, num_matches, chunk_size)]
+    if num_workers <= 1 or len(jobs) <= 1:
+        results = [_process_chunk(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(min(num_workers, len(jobs))) as pool:
+            results = pool.map(_process_chunk, jobs)
+    if not results:
+        return process_matches([], teams, augment_ids=augment_ids, context=context)
+    experiences = concatenate_experiences(results)
+    num_actions = results[0]["num_actions"][0]
+    experiences["valid_actions"] = np.unpackbits(experiences["valid_actions"], axis=1)[:,:num_actions].astype(bool)
+    del experiences["num_actions"]
+    return experiences
+
+def _process_chunk(job):
+    """
+    Worker for process_matches_parallel(). Valid action masks make up most of the result, so they are returned bit-packed.
+    """
+    (matches, teams, augment_ids, context) = job
+    experiences = process_matches(matches, teams, augment_ids=augment_ids, context=context)
+    experiences["num_actions"] = np.array([experiences["valid_actions"].shape[1]])
+    experiences["valid_actions"] = np.packbits(experiences["valid_actions"], axis=1)
+    return experiences
+
+def concatenate_experiences(experiences):
+    """
+    Concatenates a list of experience dictionaries (as produced by process_matches()) into a single dictionary.
+    """
+    return {key:np.concatenate([exp[key] for exp in experiences]) for key in experiences[0]}
+
+def _submission_arrays(matches, draft):
+    """
+    Collects the submissions of each match into (num_matches, num_submissions) arrays in selection order (see build_action_queue()).
+    Returns:
+        champion_ids (array(int)): submitted champion ids. NULL submissions are given as -1.
+        positions (array(int)): submitted positions (-1 for bans)
+        complete (array(bool)): False for matches that are missing submissions
+    """
+    num_matches = len(matches)
+    n = draft.num_submissions
+    max_bans = max(draft.ban_index_table.max()+1, 1)
+    max_picks = max(draft.pick_index_table.max()+1, 1)
+    ban_cids = np.full((num_matches, 2, max_bans), -2, dtype=np.int64)
+    pick_cids = np.full((num_matches, 2, max_picks), -2, dtype=np.int64)
+    pick_positions = np.full((num_matches, 2, max_picks), -1, dtype=np.int64)
+    sides = {DraftState.BLUE_TEAM:"blue", DraftState.RED_TEAM:"red"}
+    for (m, match) in enumerate(matches):
+        for (team, side) in sides.items():
+            bans = match[side]["bans"][:max_bans]
+            picks = match[side]["picks"][:max_picks]
+            ban_cids[m, team, :len(bans)] = [-1 if ban[0] is None else ban[0] for ban in bans]
+            pick_cids[m, team, :len(picks)] = [-1 if pick[0] is None else pick[0] for pick in picks]
+            pick_positions[m, team, :len(picks)] = [pick[1] for pick in picks]
+
+    step_teams = draft.team_table[:n]
+    is_ban = draft.phase_table[:n] == Draft.BAN
+    ban_index = np.maximum(draft.ban_index_table[:n], 0)
+    pick_index = np.maximum(draft.pick_index_table[:n], 0)
+    champion_ids = np.where(is_ban, ban_cids[:, step_teams, ban_index], pick_cids[:, step_teams, pick_index])
+    positions = np.where(is_ban, -1, pick_positions[:, step_teams, pick_index])
+    complete = np.all(champion_ids != -2, axis=1)
+    return (champion_ids, positions, complete)
+
+def expand_augmentations(matches, augment_ids=None, draft=None):
+    """
+    Expands each match into its augmented submission sequences by gathering the match's submissions through Draft.augment_table.
+    Args:
+        matches (dict or list(dict)): match dictionary or list of match dictionaries
+        augment_ids (optional) (array(int)): augmentation ids to expand each match into. Defaults to every augmentation of the draft.
+        draft (optional) (Draft): draft structure the matches were drafted under. Defaults to Draft("default").
+    Returns:
+        (champion_ids, positions) (tuple of arrays): (num_matches, num_augment_ids, num_submissions) arrays where row [m,a] is the submission
+            sequence of match m under augmentation augment_ids[a]. NULL submissions are given as -1 and bans have position -1.
+    """
+    if isinstance(matches, dict):
+        matches = [matches]
+    if draft is None:
+        draft = DEFAULT_DRAFT
+    if augment_ids is None:
+        augment_ids = np.arange(draft.num_augmentations)
+    orders = draft.augment_table[np.asarray(augment_ids, dtype=np.int64)]
+    (champion_ids, positions, complete) = _submission_arrays(matches, draft)
+    return (champion_ids[:, orders], positions[:, orders])
+
+def build_action_queue(match, draft=None, augment_id=0):
+    """
+    Builds queue of champion picks and bans in selection order by walking the compiled schedule tables of the draft structure.
     Args:
         match (dict): dictonary structure of match data to be parsed
+        draft (Draft): draft structure the match was drafted under. Defaults to Draft("default").
+        augment_id (int): augmentation id used to reorder interchangeable submissions (see Draft.augment_table). 0 is the original order.
     Returns:
         action_queue (deque(tuple)): deque of pick tuples of the form (side_id, champion_id, position_id).
             action_queue is produced in selection order.
     """
-    winner = match["winner"]
+    if draft is None:
+        draft = DEFAULT_DRAFT
+    sides = {DraftState.BLUE_TEAM:"blue", DraftState.RED_TEAM:"red"}
     action_queue = deque()
-    phases = {0:{"phase_type":"bans", "pick_order":["blue", "red", "blue", "red", "blue", "red"]}, # phase 1 bans
-              1:{"phase_type":"picks", "pick_order":["blue", "red", "red", "blue", "blue", "red"]}, # phase 1 picks
-              2:{"phase_type":"bans", "pick_order":["red", "blue", "red", "blue"]}, # phase 2 bans
-              3:{"phase_type":"picks","pick_order":["red", "blue", "blue", "red"]}} # phase 2 picks
-    ban_index = 0
-    pick_index = 0
-    completed_actions = 0
-    for phase in range(4):
-        phase_type = phases[phase]["phase_type"]
-        pick_order = phases[phase]["pick_order"]
-
-        num_actions = len(pick_order)
-        for pick_num in range(num_actions):
-            side = pick_order[pick_num]
-            if side == "blue":
-                side_id = DraftState.BLUE_TEAM
-            else:
-                side_id = DraftState.RED_TEAM
-            if phase_type == "bans":
-                position_id = -1
-                index = ban_index
-                ban_index += pick_num%2 # Order matters here. index needs to be updated *after* use
-            else:
-                position_id = match[side][phase_type][pick_index][1]
-                index = pick_index
-                pick_index += pick_num%2 # Order matters here. index needs to be updated *after* use
-            action = (side_id, match[side][phase_type][index][0], position_id)
-            action_queue.append(action)
-            completed_actions += 1
-
-    if(completed_actions != 20):
-        print("Found a match with missing actions!")
-        print("num_actions = {}".format(num_actions))
-        print(json.dumps(match, indent=2, sort_keys=True))
+    for step in draft.augment_table[augment_id].tolist() if augment_id else range(draft.num_submissions):
+        side_id = int(draft.team_table[step])
+        side = sides[side_id]
+        if draft.phase_table[step] == Draft.BAN:
+            champion_id = match[side]["bans"][draft.ban_index_table[step]][0]
+            position_id = -1
+        else:
+            (champion_id, position_id) = match[side]["picks"][draft.pick_index_table[step]][:2]
+        action_queue.append((side_id, champion_id, position_id))
     return action_queue
 
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+"""
+Vectorized evaluation metrics for model predictions. Each function operates on a whole (num_predictions, num_actions) matrix of predicted
+values (eg. Q-values or action probabilities) along with the submitted action for each prediction, rather than one prediction at a time.
+"""
+import numpy as np
+
+def submitted_values(values, actions):
+    """
+    Returns the predicted value of each submitted action.
+    Args:
+        values (array(float)): (n, num_actions) predicted value of each action
+        actions (array(int)): (n,) submitted action for each prediction
+    Returns:
+        (n,) array of values[i, actions[i]]
+    """
+    values = np.asarray(values)
+    return values[np.arange(len(values)), np.asarray(actions, dtype=np.int64)]
+
+def action_ranks(values, actions):
+    """
+    Computes the rank of each submitted action among the predicted values, where rank 0 is the highest valued action. The rank is the number
+    of actions valued strictly higher than the submitted action, so ties are resolved in favour of the submitted action.
+    Args:
+        values (array(float)): (n, num_actions) predicted value of each action
+        actions (array(int)): (n,) submitted action for each prediction
+    Returns:
+        ranks (array(int)): (n,) rank of each submitted action
+    """
+    values = np.asarray(values)
+    return np.count_nonzero(values > submitted_values(values, actions)[:,None], axis=1)
+
+def top_k_accuracy(ranks, k):
+    """
+    Returns the fraction of submitted actions ranked within the top k predictions (k = 1 gives the top-1 accuracy).
+    """
+    ranks = np.asarray(ranks)
+    return np.count_nonzero(ranks < k)/len(ranks) if len(ranks) else 0.
+
+def normalized_q_errors(values, actions):
+    """
+    Computes the error of each submitted action's predicted value relative to the highest predicted value
+        err[i] = |max_a Q[i,a] - Q[i,actions[i]]|/|max_a Q[i,a]|
+    Args:
+        values (array(float)): (n, num_actions) predicted value of each action
+        actions (array(int)): (n,) submitted action for each prediction
+    Returns:
+        errors (array(float)): (n,) normalized error of each submitted action
+    """
+    values = np.asarray(values)
+    top = values.max(axis=1)
+    return np.abs(top-submitted_values(values, actions))/np.abs(top)
+
+def top_k_actions(values, k):
+    """
+    Returns the k highest valued actions of each prediction in descending order of value.
+    Args:
+        values (array(float)): (n, num_actions) predicted value of each action
+        k (int): number of actions returned
+    Returns:
+        actions (array(int)): (n, k) top actions for each prediction
+    """
+    values = np.asarray(values)
+    k = min(k, values.shape[1])
+    rows = np.arange(len(values))[:,None]
+    top = np.argpartition(-values, k-1, axis=1)[:,:k]
+    order = np.argsort(-values[rows, top], axis=1, kind="mergesort")
+    return top[rows, order]
+
+def rank_metrics(values, actions, k=5):
+    """
+    Computes the ranking metrics of a batch of predictions.
+    Args:
+        values (array(float)): (n, num_actions) predicted value of each action
+        actions (array(int)): (n,) submitted action for each prediction
+        k (int): rank tolerance for the top-k accuracy
+    Returns:
+        metrics (dict): dictionary containing
+            "ranks": rank of each submitted action (see action_ranks())
+            "top1": fraction of submitted actions ranked first
+            "topk": fraction of submitted actions ranked within the top k
+            "errors": normalized error of each submitted action (see normalized_q_errors())
+    """
+    ranks = action_ranks(values, actions)
+    return {"ranks":ranks,
+            "top1":top_k_accuracy(ranks, 1),
+            "topk":top_k_accuracy(ranks, k),
+            "errors":normalized_q_errors(values, actions)}
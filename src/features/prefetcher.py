@@ -0,0 +1,111 @@
+import time
+import queue
+import threading
+
+class Prefetcher():
+    """
+    Prefetcher prepares minibatches on a background thread so that they are ready to feed by the time the training loop asks for them.
+    Batches are pulled from source and held in a bounded queue of depth batches. The background thread blocks once the queue is full,
+    so at most depth batches are prepared ahead of the training loop. Exceptions raised while preparing a batch are re-raised when
+    that batch is requested.
+
+    The Prefetcher also records how often the training loop had to wait for a batch (a stall) and for how long, see get_stats().
+    Args:
+        source (iterable): iterable yielding prepared batches (eg. iter(sample_fn, None) for an endless stream of sampled batches)
+        depth (int): maximum number of batches held in the queue
+    """
+    _DONE = object()
+
+    def __init__(self, source, depth = 2):
+        self.depth = depth
+        self.num_batches = 0
+        self.num_stalls = 0
+        self.stall_time = 0.
+
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(iter(source),), daemon=True)
+        self._thread.start()
+
+    def _run(self, source):
+        try:
+            for batch in source:
+                if not self._put(batch):
+                    return
+            self._put(Prefetcher._DONE)
+        except Exception as error:
+            self._put(_PrefetchError(error))
+
+    def _put(self, item):
+        """
+        Adds item to the queue, waiting for space. Returns False if the Prefetcher was closed while waiting.
+        """
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.get()
+
+    def get(self):
+        """
+        Returns the next prepared batch, waiting for it to be prepared if the queue is empty. Raises StopIteration once source is exhausted.
+        """
+        stalled = self._queue.empty()
+        t0 = time.time()
+        item = self._queue.get()
+        if item is Prefetcher._DONE:
+            self._queue.put(item)
+            raise StopIteration
+        if isinstance(item, _PrefetchError):
+            raise item.error
+        self.num_batches += 1
+        if stalled:
+            self.num_stalls += 1
+            self.stall_time += time.time()-t0
+        return item
+
+    def close(self):
+        """
+        Stops the background thread and discards any prepared batches.
+        """
+        self._stop.set()
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def get_stats(self):
+        """
+        Returns a dictionary of prefetching statistics:
+            batches: number of batches returned
+            stalls: number of batches the training loop had to wait for
+            stall_rate: fraction of batches the training loop had to wait for
+            stall_time: total time (in seconds) spent waiting for batches
+        """
+        return {"batches":self.num_batches,
+                "stalls":self.num_stalls,
+                "stall_rate":self.num_stalls/self.num_batches if self.num_batches else 0.,
+                "stall_time":self.stall_time}
+
+class _PrefetchError():
+    """
+    Wraps an exception raised on the background thread so that it can be passed through the queue.
+    """
+    def __init__(self, error):
+        self.error = error
@@ -17,24 +17,27 @@ def get_reward(state, match, submitted_action, actual_action):
         3) state is complete, valid but the submission was made by the losing team -> reward = +2.5
         3) state is valid, but incomplete  -> reward = 0
     """
-    status = state.evaluate()
-    if(status in ds.invalid_states):
-        return -10.
-
-    reward = 0.
     winner = get_winning_team(match)
-    if(status == ds.DRAFT_COMPLETE and winner is not None):
-        if(state.team == winner):
-            reward += 5.
-        else:
-            reward += 2.5
-
-    if(submitted_action == actual_action):
-        reward += 0.5
-    else:
-        reward += -0.5
+    winner = -1 if winner is None else winner
+    return float(get_rewards([state.evaluate()], [state.team], [winner], [submitted_action == actual_action])[0])
 
-    return reward
+def get_rewards(status, teams, winners, correct):
+    """
+    Vectorized version of get_reward() for a batch of draft states. Both get_reward() and match_processing.process_matches() use this
+    so that the reward table is only defined here.
+    Args:
+        status (array(int)): state code of each draft state (see DraftState.evaluate())
+        teams (array(int)): team each draft state is drafted for
+        winners (array(int)): winning team of the match each draft state came from, or -1 if the winner is unknown (see get_winning_teams())
+        correct (array(bool)): flags if the action submitted to reach each state was the action submitted in observation
+    Returns:
+        rewards (array(float)): reward earned for each draft state
+    """
+    status = np.asarray(status)
+    winners = np.asarray(winners)
+    completion_reward = np.where(np.asarray(teams) == winners, 5., 2.5)*((status == ds.DRAFT_COMPLETE) & (winners >= 0))
+    rewards = completion_reward + np.where(correct, 0.5, -0.5)
+    return np.where(np.isin(status, ds.invalid_states), -10., rewards)
 
 def get_winning_team(match):
     """
@@ -53,3 +56,10 @@ def get_winning_team(match):
     elif match["winner"]==1:
         return ds.RED_TEAM
     return None
+
+def get_winning_teams(matches):
+    """
+    Returns an array holding the winning team of each match (see get_winning_team()), with -1 for matches without a recorded winner.
+    """
+    winners = [get_winning_team(match) for match in matches]
+    return np.array([-1 if winner is None else winner for winner in winners], dtype=np.int64)
@@ -0,0 +1,174 @@
+import numpy as np
+from .draft import Draft
+
+def patch_code(patch):
+    """
+    Converts a patch id string (eg. "8.13") into an integer code (eg. 813) which orders patches chronologically. Unknown patches give 0.
+    """
+    try:
+        (major, minor) = str(patch).split(".")[:2]
+        return 100*int(major) + int(minor)
+    except (ValueError, TypeError):
+        return 0
+
+class UniformSampler():
+    """
+    UniformSampler draws experiences uniformly from an ExperienceBuffer. This is the default sampling used by ExperienceBuffer.sample().
+    Samplers are attached to a buffer by passing them to the buffer's constructor. The buffer then calls update() with the rows
+    written by each store, and sample() to draw the rows of each sample.
+    Samplers which keep an index of the buffer's rows (stateful = True) must each be attached to a single buffer.
+    """
+    stateful = False
+
+    def update(self, buf, rows):
+        """
+        Notifies the sampler that the given rows of buf have been (over)written.
+        """
+        return None
+
+    def sample(self, buf, sample_size):
+        """
+        Returns sample_size rows drawn from buf.
+        """
+        return np.random.randint(buf.get_buffer_size(), size=sample_size)
+
+class StratifiedSampler(UniformSampler):
+    """
+    StratifiedSampler draws minibatches with a fixed share of experiences from each stratum of the draft and can favour experiences from recent patches.
+    Experiences are grouped into strata by the draft step their starting state was at (strata = "step", one stratum per submission)
+    or by the phase of the draft it was in (strata = "phase", one stratum per ban or pick phase, eg. ban phase 1 = stratum 0).
+    Each minibatch draws from stratum s with probability weights[s] (normalized over the strata currently held in the buffer) rather than
+    in proportion to how many of its experiences the buffer happens to hold.
+
+    Within a stratum, an experience from a patch which is k patches older than the most recent patch in the buffer is weighted by recency_decay^k.
+    Patches are given as patch codes (see patch_code()) stored with each experience.
+
+    The rows of each (stratum, patch) cell are kept in index arrays which are updated as the buffer is written, so drawing a minibatch
+    costs O(sample_size) plus a small cost per cell, independent of the size of the buffer. The sampler is bound to the first buffer
+    it is used with and raises ValueError if used with any other buffer, so each buffer needs its own StratifiedSampler.
+    Args:
+        strata (string): "step", "phase" or None (a single stratum)
+        weights (list(float)): relative sampling weight of each stratum. If None strata are drawn in proportion to their size.
+        recency_decay (float): weight multiplier per patch of age (0 < recency_decay <= 1). If None patches are not weighted.
+        draft (Draft): draft structure used to map steps to phases. Defaults to the default draft.
+    """
+    stateful = True
+
+    def __init__(self, strata = "phase", weights = None, recency_decay = None, draft = None):
+        if strata not in ("step", "phase", None):
+            raise ValueError("Unknown strata {}".format(strata))
+        if draft is None:
+            draft = Draft("default")
+        self.strata = strata
+        self.weights = None if weights is None else np.asarray(weights, dtype=float)
+        self.recency_decay = recency_decay
+
+        phases = draft.phase_table[:draft.num_submissions]
+        self.phase_index_table = np.concatenate([[0], np.cumsum(phases[1:] != phases[:-1])]).astype(np.int64)
+        if strata == "step":
+            self.num_strata = draft.num_submissions
+        elif strata == "phase":
+            self.num_strata = int(self.phase_index_table[-1])+1 if draft.num_submissions else 1
+        else:
+            self.num_strata = 1
+        if self.weights is not None and len(self.weights) != self.num_strata:
+            raise ValueError("Expected {} stratum weights, got {}".format(self.num_strata, len(self.weights)))
+
+        self._buffer = None
+
+    def get_strata(self, steps):
+        """
+        Returns the stratum of each experience given the draft step of its starting state.
+        """
+        steps = np.clip(np.asarray(steps, dtype=np.int64), 0, len(self.phase_index_table)-1)
+        if self.strata == "step":
+            return steps
+        if self.strata == "phase":
+            return self.phase_index_table[steps]
+        return np.zeros_like(steps)
+
+    def _bind(self, buf):
+        """
+        Sets up empty index arrays for buf and indexes the experiences it already holds.
+        """
+        if self._buffer is not None:
+            raise ValueError("StratifiedSampler is already bound to another buffer, each buffer needs its own sampler")
+        self._buffer = buf
+        self._cell_of_row = np.full(buf.buffer_size, -1, dtype=np.int64)
+        self._slot_of_row = np.zeros(buf.buffer_size, dtype=np.int64)
+        # Cell c holds the experiences of stratum _cell_strata[c] from patch _cell_patches[c]. Its rows are _members[c][:_sizes[c]].
+        self._cell_ids = {}
+        self._cell_strata = []
+        self._cell_patches = []
+        self._members = []
+        self._sizes = []
+        if buf.get_buffer_size():
+            self.update(buf, np.arange(buf.get_buffer_size()))
+
+    def _get_cell(self, stratum, patch):
+        cell = self._cell_ids.get((stratum, patch))
+        if cell is None:
+            cell = len(self._members)
+            self._cell_ids[(stratum, patch)] = cell
+            self._cell_strata.append(stratum)
+            self._cell_patches.append(patch)
+            self._members.append(np.zeros(16, dtype=np.int64))
+            self._sizes.append(0)
+        return cell
+
+    def update(self, buf, rows):
+        if self._buffer is not buf:
+            # _bind() indexes every row held by buf, which includes the rows just written
+            self._bind(buf)
+            return None
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        strata = self.get_strata(buf.buffer["steps"][rows]).tolist()
+        patches = buf.buffer["patches"][rows].tolist()
+        for (row, stratum, patch) in zip(rows.tolist(), strata, patches):
+            # Remove the row from its old cell by moving the cell's last member into its slot
+            old_cell = self._cell_of_row[row]
+            if old_cell >= 0:
+                slot = self._slot_of_row[row]
+                last = self._sizes[old_cell]-1
+                moved = self._members[old_cell][last]
+                self._members[old_cell][slot] = moved
+                self._slot_of_row[moved] = slot
+                self._sizes[old_cell] = last
+            cell = self._get_cell(stratum, patch)
+            size = self._sizes[cell]
+            if size == len(self._members[cell]):
+                self._members[cell] = np.concatenate([self._members[cell], np.zeros(size, dtype=np.int64)])
+            self._members[cell][size] = row
+            self._cell_of_row[row] = cell
+            self._slot_of_row[row] = size
+            self._sizes[cell] = size+1
+        return None
+
+    def get_cell_probabilities(self):
+        """
+        Returns the probability of drawing an experience from each cell.
+        """
+        sizes = np.array(self._sizes, dtype=float)
+        strata = np.array(self._cell_strata, dtype=np.int64)
+        cell_weights = sizes.copy()
+        if self.recency_decay is not None:
+            patches = np.array(self._cell_patches, dtype=np.int64)
+            present = np.unique(patches[sizes > 0])
+            age = len(present)-1-np.searchsorted(present, patches)
+            cell_weights *= self.recency_decay**np.maximum(age, 0)
+
+        stratum_sizes = np.bincount(strata, weights=sizes, minlength=self.num_strata)
+        if self.weights is None:
+            stratum_probs = stratum_sizes
+        else:
+            stratum_probs = np.where(stratum_sizes > 0, self.weights, 0.)
+        stratum_probs = stratum_probs/stratum_probs.sum()
+        stratum_weights = np.bincount(strata, weights=cell_weights, minlength=self.num_strata)
+        return np.where(cell_weights > 0, cell_weights/np.where(stratum_weights > 0, stratum_weights, 1.)[strata]*stratum_probs[strata], 0.)
+
+    def sample(self, buf, sample_size):
+        if self._buffer is not buf:
+            self._bind(buf)
+        counts = np.random.multinomial(sample_size, self.get_cell_probabilities())
+        rows = [self._members[cell][np.random.randint(self._sizes[cell], size=counts[cell])] for cell in np.nonzero(counts)[0]]
+        return np.random.permutation(np.concatenate(rows))
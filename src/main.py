@@ -8,6 +8,8 @@ import time
 from features.draftstate import DraftState
 import data.champion_info as cinfo
 import features.match_processing as mp
+from features.experience_cache import ExperienceCache
+from features.samplers import StratifiedSampler
 from data.match_pool import test_train_split
 import data.database_ops as dbo
 
@@ -29,6 +31,8 @@ LIST_PATH = None#"../data/test_train_split.txt"
 LIST_SAVE_PATH = "../data/test_train_split.txt"
 PATH_TO_DB = "../data/competitiveMatchData.db"
 MODEL_DIR = "../models/"
+EXPERIENCE_CACHE_DIR = None#"../data/experience_cache/"
+REPLAY_PATH = None#"../data/replay.buf" # Persistent (memory-mapped) DDQN replay buffer
 N_TRAIN = 173
 N_VAL = 20
 PATCHES = None
@@ -67,10 +71,21 @@ input_size = state.format_state().shape
 output_size = state.num_actions
 filter_size = (1024,1024)
 regularization_coeff = 7.5e-5#1.5e-4
+input_mode = "dense" # "sparse" feeds padded submission indices through an equivalent embedding input layer
 path_to_model = None#"model_predictions/spring_2018/week_3/model_E{}.ckpt".format(30)#None
 load_path = None#"tmp/ddqn_model_E45.ckpt"
 
 # Training parameters
+experience_cache = ExperienceCache(EXPERIENCE_CACHE_DIR) if EXPERIENCE_CACHE_DIR else None
+num_workers = 1 # Number of processes used to turn matches into experiences
+prioritized_replay = False # Sample DDQN replay in proportion to TD error
+compressed_replay = False # Store DDQN replay as compressed submission sequences
+prefetch_depth = 0 # Number of minibatches prepared ahead of time on a background thread (0 = disabled)
+def replay_sampler():
+    # Each trainer's buffer needs its own sampler. eg. StratifiedSampler("phase", weights=[2,1,2,1], recency_decay=0.8) to stratify minibatches by draft phase and favour recent patches
+    return None
+target_cache_size = 0 # Number of target network Q vectors cached between target network updates (0 = disabled)
+shuffle_window = None # If set, supervised training streams experiences (shuffled within a window of this many) instead of buffering them
 batch_size = 16#32
 buffer_size = 4096#2048
 n_epoch = 45
@@ -85,15 +100,15 @@ for i in range(1):
     tf.reset_default_graph()
     name = "softmax"
     out_path = "{}{}_model_E{}.ckpt".format(MODEL_DIR, name, n_epoch)
-    softnet = softmax.SoftmaxNetwork(name, out_path, input_size, output_size, filter_size, learning_rate, regularization_coeff)
-    trainer = SoftmaxTrainer(softnet, n_epoch, training_matches, validation_matches, batch_size, load_path=None)
+    softnet = softmax.SoftmaxNetwork(name, out_path, input_size, output_size, filter_size, learning_rate, regularization_coeff, input_mode=input_mode)
+    trainer = SoftmaxTrainer(softnet, n_epoch, training_matches, validation_matches, batch_size, load_path=None, experience_cache=experience_cache, num_workers=num_workers, shuffle_window=shuffle_window, prefetch_depth=prefetch_depth, sampler=replay_sampler())
     summaries = trainer.train()
 
     tf.reset_default_graph()
     name = "ddqn"
     out_path = "{}{}_model_E{}.ckpt".format(MODEL_DIR, name, n_epoch)
-    ddqn = qNetwork.Qnetwork(name, out_path, input_size, output_size, filter_size, learning_rate, regularization_coeff, discount_factor)
-    trainer = DDQNTrainer(ddqn, n_epoch, training_matches, validation_matches, batch_size, buffer_size, load_path)
+    ddqn = qNetwork.Qnetwork(name, out_path, input_size, output_size, filter_size, learning_rate, regularization_coeff, discount_factor, input_mode=input_mode)
+    trainer = DDQNTrainer(ddqn, n_epoch, training_matches, validation_matches, batch_size, buffer_size, load_path, experience_cache=experience_cache, num_workers=num_workers, prioritized_replay=prioritized_replay, replay_path=REPLAY_PATH, prefetch_depth=prefetch_depth, compressed_replay=compressed_replay, sampler=replay_sampler(), target_cache_size=target_cache_size)
     summaries = trainer.train()
 
     print("Learning complete!")
@@ -121,13 +136,8 @@ team = DraftState.RED_TEAM if match["winner"]==1 else DraftState.BLUE_TEAM
 experiences = mp.process_match(match,team)
 count = 0
 # x labels for q val plots
-xticks = []
-xtick_locs = []
-for a in range(state.num_actions):
-    cid,pos = state.format_action(a)
-    if cid not in xticks:
-        xticks.append(cid)
-        xtick_locs.append(a)
+(action_cids, _) = state.decode_actions(np.arange(state.num_actions))
+(xticks, xtick_locs) = np.unique(action_cids, return_index=True)
 xtick_labels = [cinfo.champion_name_from_id(cid)[:6] for cid in xticks]
 
 tf.reset_default_graph()
@@ -136,19 +146,23 @@ tf.reset_default_graph()
 path_to_model = "../models/softmax_model_E{}".format(45)#"tmp/ddqn_model_E45"#"tmp/model_E{}".format(n_epoch)
 model = SoftmaxInferenceModel(name="infer", path=path_to_model)
 
-for exp in experiences:
-    state,act,rew,next_state = exp
-    cid,pos = act
-    if cid == None:
-        continue
+# Skip null actions and predict for all remaining states at once
+experiences = [exp for exp in experiences if exp[1][0] is not None]
+states = [exp[0] for exp in experiences]
+(cids, positions) = zip(*[exp[1] for exp in experiences])
+form_acts = state.encode_actions(cids, positions)
+pred_acts = model.predict_action(states)
+pred_Qs = model.predict(states)
+(p_cids, p_positions) = state.decode_actions(pred_acts)
+
+for n in range(len(experiences)):
+    cid,pos = cids[n],positions[n]
     count += 1
-    form_act = state.get_action(cid,pos)
-    pred_act = model.predict_action([state])
-    pred_act = pred_act[0]
-    pred_Q = model.predict([state])
-    pred_Q = pred_Q[0,:]
+    form_act = form_acts[n]
+    pred_act = pred_acts[n]
+    pred_Q = pred_Qs[n,:]
 
-    p_cid,p_pos = state.format_action(pred_act)
+    p_cid,p_pos = p_cids[n],p_positions[n]
     actual = (cinfo.champion_name_from_id(cid),pos,pred_Q[form_act])
     pred = (cinfo.champion_name_from_id(p_cid),p_pos,pred_Q[pred_act])
     print("pred:{}, actual:{}".format(pred,actual))
@@ -3,6 +3,7 @@ import match_processing as mp
 import champion_info as cinfo
 import draft_db_ops as dbo
 from draftstate import DraftState
+import features.metrics as metrics
 from models.inference_model import QNetInferenceModel, SoftmaxInferenceModel
 
 import json
@@ -89,6 +90,23 @@ position_distributions = {"phase_1":[0,0,0,0,0], "phase_2":[0,0,0,0,0]}
 actual_pos_distributions = {"phase_1":[0,0,0,0,0], "phase_2":[0,0,0,0,0]}
 augmentable_picks = {DraftState.BLUE_TEAM:[0,1,4,6,8], DraftState.RED_TEAM:[0,1,3,6]}
 targets = [10,10,10,9,8,7,6,6,6,5]
+
+# Every state shares the same action space, so decode all actions (and look up their champion names) once
+template_state = DraftState(DraftState.BLUE_TEAM)
+action_ids = np.arange(template_state.num_actions)
+(action_cids, action_positions) = template_state.decode_actions(action_ids)
+action_names = [cinfo.champion_name_from_id(cid) for cid in action_cids]
+
+def describe_actions(q_values, act_ids):
+    """
+    Returns a DataFrame describing the given actions (champion, position, Q-value, rank and normalized Q-error) for printing.
+    """
+    act_ids = np.asarray(act_ids)
+    q_rows = np.tile(q_values, (len(act_ids), 1))
+    df = pd.DataFrame({'act_id':act_ids, 'cname':[action_names[a] for a in act_ids], 'pos':action_positions[act_ids], 'Q(s,a)':q_values[act_ids],
+                       'rank':metrics.action_ranks(q_rows, act_ids), 'error':metrics.normalized_q_errors(q_rows, act_ids)},
+                      columns=['act_id','cname','pos','Q(s,a)','rank','error'])
+    return df
 for match in matches:
 #    if(specific_team):
 #        team = DraftState.RED_TEAM if match["red_team"]==specific_team else DraftState.BLUE_TEAM
@@ -113,40 +131,30 @@ for match in matches:
 
             predicted_q_values = model.predict([state])
             predicted_q_values = predicted_q_values[0,:]
-            submitted_action_id = state.get_action(*act)
-
-            data = [(a,*state.format_action(a),predicted_q_values[a]) for a in range(len(predicted_q_values))]
-            data = [(a,cinfo.champion_name_from_id(cid),pos,Q) for (a,cid,pos,Q) in data]
-            df = pd.DataFrame(data, columns=['act_id','cname','pos','Q(s,a)'])
+            submitted_action_id = state.encode_actions([cid],[pos])[0]
 
-            df.sort_values('Q(s,a)',ascending=False,inplace=True)
-            df.reset_index(drop=True,inplace=True)
+            stats = metrics.rank_metrics(predicted_q_values[None,:], [submitted_action_id], k)
+            rank = stats["ranks"][0]
+            err = stats["errors"][0]
+            top_actions = metrics.top_k_actions(predicted_q_values[None,:], k)[0]
 
-            df['rank'] = df.index
-            df['error'] = abs(df['Q(s,a)'][0] - df['Q(s,a)'])/abs(df['Q(s,a)'][0])
-
-            submitted_row = df[df['act_id']==submitted_action_id]
             print(" Submitted action:")
-            print(submitted_row)
-
-            rank = submitted_row['rank'].iloc[0]
-            err = submitted_row['error'].iloc[0]
+            print(describe_actions(predicted_q_values, [submitted_action_id]))
 
             # For picks submitted back-to-back look ahead to next action to see if it was possibly recommended
             if (rank >= k and pick_count in augmentable_picks[team]):#if False:
                 _,next_action,_,_ = experiences[pick_count+1]
                 cid,_ = next_action
                 if(cid):
-                    next_action_id = state.get_action(*next_action)
-                    next_row = df[df['act_id']==next_action_id]
-                    next_rank = next_row['rank'].iloc[0]
+                    next_action_id = state.encode_actions(*zip(next_action))[0]
+                    next_rank = metrics.action_ranks(predicted_q_values[None,:], [next_action_id])[0]
                     if(next_rank < k):
                         result = state.update(*next_action)
                         new_exp = (state, act, rew, None)
                         experiences[pick_count+1] = new_exp
                         rank = next_rank
                         print(" AUGMENTED ACTION:")
-                        print(next_row)
+                        print(describe_actions(predicted_q_values, [next_action_id]))
 
             t = targets[pick_count]
             # Norms measuring all submissions
@@ -200,12 +208,12 @@ for match in matches:
 
             if(rank >= t):
                 print(" Top predictions:")
-                print(df.head()) # Print top 5 choices for network
+                print(describe_actions(predicted_q_values, top_actions)) # Print top k choices for network
             #df.to_pickle("{}/match{}_pick{}.pkl".format(out_dir,count,pick_count))
 
             # Position distribution for picks
             if(pos > 0):
-                top_pos = df.head()["pos"].values.tolist()
+                top_pos = action_positions[top_actions].tolist()
                 if(pick_count <=5):
                     actual_pos_distributions["phase_1"][pos-1] += 1
                     for pos in top_pos:
@@ -1,5 +1,6 @@
 import tensorflow as tf
 from . import base_model
+from features.draftstatebatch import DraftStateBatch
 
 class QNetInferenceModel(base_model.BaseModel):
     def __init__(self, name, path):
@@ -18,19 +19,22 @@ class QNetInferenceModel(base_model.BaseModel):
             ops_dict["prediction"] = tf.get_default_graph().get_tensor_by_name("online/prediction:0")
             ops_dict["input"] = tf.get_default_graph().get_tensor_by_name("online/inputs:0")
             ops_dict["valid_actions"] = tf.get_default_graph().get_tensor_by_name("online/valid_actions:0")
+        # Models trained with input_mode = "sparse" take integer submission indices as input
+        self.input_mode = "sparse" if ops_dict["input"].dtype == tf.int32 else "dense"
         return ops_dict
 
     def predict(self, states):
         """
         Feeds state into model and returns current predicted Q-values.
         Args:
-            states (list of DraftStates): states to predict from
+            states (list of DraftStates or DraftStateBatch): states to predict from
         Returns:
             predicted_Q (numpy array): model estimates of Q-values for actions from input states.
               predicted_Q[k,:] holds Q-values for state states[k]
         """
-        inputs = [state.format_state() for state in states]
-        valid_actions = [state.get_valid_actions() for state in states]
+        batch = DraftStateBatch.from_states(states)
+        inputs = batch.format_inputs(self.input_mode)
+        valid_actions = batch.valid_action_masks()
 
         feed_dict = {self.ops_dict["input"]:inputs,
                      self.ops_dict["valid_actions"]:valid_actions}
@@ -41,12 +45,13 @@ class QNetInferenceModel(base_model.BaseModel):
         """
         Feeds state into model and return recommended action to take from input state based on estimated Q-values.
         Args:
-            state (list of DraftStates): states to predict from
+            states (list of DraftStates or DraftStateBatch): states to predict from
         Returns:
             predicted_action (numpy array): array of integer representations of actions recommended by model.
         """
-        inputs = [state.format_state() for state in states]
-        valid_actions = [state.get_valid_actions() for state in states]
+        batch = DraftStateBatch.from_states(states)
+        inputs = batch.format_inputs(self.input_mode)
+        valid_actions = batch.valid_action_masks()
 
         feed_dict = {self.ops_dict["input"]:inputs,
                      self.ops_dict["valid_actions"]:valid_actions}
@@ -71,19 +76,22 @@ class SoftmaxInferenceModel(base_model.BaseModel):
             ops_dict["prediction"] = tf.get_default_graph().get_tensor_by_name("softmax/predictions:0")
             ops_dict["input"] = tf.get_default_graph().get_tensor_by_name("softmax/inputs:0")
             ops_dict["valid_actions"] = tf.get_default_graph().get_tensor_by_name("softmax/valid_actions:0")
+        # Models trained with input_mode = "sparse" take integer submission indices as input
+        self.input_mode = "sparse" if ops_dict["input"].dtype == tf.int32 else "dense"
         return ops_dict
 
     def predict(self, states):
         """
         Feeds state into model and returns current predicted probabilities.
         Args:
-            states (list of DraftStates): states to predict from
+            states (list of DraftStates or DraftStateBatch): states to predict from
         Returns:
             probabilities (numpy array): model estimates of probabilities for actions from input states.
               probabilities[k,:] holds Q-values for state states[k]
         """
-        inputs = [state.format_state() for state in states]
-        valid_actions = [state.get_valid_actions() for state in states]
+        batch = DraftStateBatch.from_states(states)
+        inputs = batch.format_inputs(self.input_mode)
+        valid_actions = batch.valid_action_masks()
 
         feed_dict = {self.ops_dict["input"]:inputs,
                      self.ops_dict["valid_actions"]:valid_actions}
@@ -94,12 +102,13 @@ class SoftmaxInferenceModel(base_model.BaseModel):
         """
         Feeds state into model and return recommended action to take from input state based on estimated Q-values.
         Args:
-            state (list of DraftStates): states to predict from
+            states (list of DraftStates or DraftStateBatch): states to predict from
         Returns:
             predicted_action (numpy array): array of integer representations of actions recommended by model.
         """
-        inputs = [state.format_state() for state in states]
-        valid_actions = [state.get_valid_actions() for state in states]
+        batch = DraftStateBatch.from_states(states)
+        inputs = batch.format_inputs(self.input_mode)
+        valid_actions = batch.valid_action_masks()
 
         feed_dict = {self.ops_dict["input"]:inputs,
                      self.ops_dict["valid_actions"]:valid_actions}
@@ -2,6 +2,7 @@ import tensorflow as tf
 import numpy as np
 
 from . import base_model
+from .sparse_input import embedding_dense
 
 class Qnetwork(base_model.BaseModel):
     """
@@ -14,6 +15,8 @@ class Qnetwork(base_model.BaseModel):
         learning_rate (float): network's willingness to change current weights given new example
         regularization (float): strength of weights regularization term in loss function
         discount_factor (float): factor by which future reward after next action is taken are discounted
+        input_mode (string): format of network inputs. "dense" (default) takes flattened state matrices (DraftState.format_state()),
+            "sparse" takes padded lists of submission indices (DraftState.format_sparse_state()).
         tau (float): Hyperparameter used in updating target network (if used)
              Some notable values:
               tau = 1.e-3 -> used in original paper
@@ -23,6 +26,7 @@ class Qnetwork(base_model.BaseModel):
     A Q-network class which is responsible for holding and updating the weights and biases used in predicing Q-values for a given state. This Q-network will consist of
     the following layers:
     1) Input- a DraftState state s (an array of bool) representing the current state reshaped into an [n_batch, *input_shape] tensor.
+        If input_mode = "sparse" the state is instead given as an [n_batch, n_submissions] tensor of indices into the flattened state.
     2) Two layers of relu-activated hidden fc layers with dropout
     3) Output- linearly activated estimations for Q-values Q(s,a) for each of the output_shape actions a available.
 
@@ -31,12 +35,17 @@ class Qnetwork(base_model.BaseModel):
     def name(self):
         return self._name
 
+    @property
+    def input_mode(self):
+        return self._input_mode
+
     @property
     def discount_factor(self):
         return self._discount_factor
 
-    def __init__(self, name, path, input_shape, output_shape, filter_sizes=(512,512), learning_rate=1.e-5, regularization_coeff=1.e-4, discount_factor=0.9, tau=1.0):
+    def __init__(self, name, path, input_shape, output_shape, filter_sizes=(512,512), learning_rate=1.e-5, regularization_coeff=1.e-4, discount_factor=0.9, tau=1.0, input_mode="dense"):
         super().__init__(name=name, path=path)
+        self._input_mode = input_mode
         self._input_shape = input_shape
         self._output_shape = output_shape
         self._filter_sizes = filter_sizes
@@ -56,6 +65,7 @@ class Qnetwork(base_model.BaseModel):
             self.target_ops = self.build_model(name = self.target_name)
             self.target_ops["target_init"] = self.create_target_initialization_ops(self.target_name, self.online_name)
             self.target_ops["target_update"] = self.create_target_update_ops(self.target_name, self.online_name, tau=self._tau)
+            self.fused_ops = self.create_double_q_target_ops(self.target_name, self.online_name)
         with self._graph.as_default():
             self.online_ops["init"] = tf.global_variables_initializer()
         self.init_saver()
@@ -79,34 +89,13 @@ class Qnetwork(base_model.BaseModel):
                 # Incoming state matrices are of size input_size = (nChampions, nPos+2)
                 # 'None' here means the input tensor will flex with the number of training
                 # examples (aka batch size).
-                ops_dict["input"] = tf.placeholder(tf.float32, (None,)+self._input_shape, name="inputs")
                 ops_dict["dropout_keep_prob"] = tf.placeholder_with_default(1.0,shape=())
 
-                # Fully connected (FC) layers:
-                fc0 = tf.layers.dense(
-                    ops_dict["input"],
-                    self._filter_sizes[0],
-                    activation=tf.nn.relu,
-                    bias_initializer=tf.constant_initializer(0.1),
-                    name="fc_0")
-                dropout0 = tf.nn.dropout(fc0, ops_dict["dropout_keep_prob"])
-
-                fc1 = tf.layers.dense(
-                    dropout0,
-                    self._filter_sizes[1],
-                    activation=tf.nn.relu,
-                    bias_initializer=tf.constant_initializer(0.1),
-                    name="fc_1")
-                dropout1 = tf.nn.dropout(fc1, ops_dict["dropout_keep_prob"])
-
-                # FC output layer
-                ops_dict["outQ"] = tf.layers.dense(
-                    dropout1,
-                    self._output_shape,
-                    activation=None,
-                    bias_initializer=tf.constant_initializer(0.1),
-                    kernel_regularizer=tf.contrib.layers.l2_regularizer(scale=self._regularization_coeff),
-                    name="q_vals")
+                if(self._input_mode == "sparse"):
+                    ops_dict["input"] = tf.placeholder(tf.int32, (None, None), name="inputs")
+                else:
+                    ops_dict["input"] = tf.placeholder(tf.float32, (None,)+self._input_shape, name="inputs")
+                ops_dict["outQ"] = self.build_q_values(ops_dict["input"], ops_dict["dropout_keep_prob"])
 
                 # Placeholder for valid actions filter
                 ops_dict["valid_actions"] = tf.placeholder(tf.bool, shape=ops_dict["outQ"].shape, name="valid_actions")
@@ -146,16 +135,135 @@ class Qnetwork(base_model.BaseModel):
                 # Special notes: this is more efficient than indexing into the flattened version of outQ (which I have seen before)
                 # because the gather operation is applied to outQ directly. Apparently this propagates the gradient more efficiently
                 # under specific sparsity conditions (which tf.Variables like outQ satisfy)
+                ops_dict["estimated_Q"] = estimatedQ
+
+                # TD error of each example, used to update priorities when sampling from a prioritized replay buffer
+                ops_dict["td_error"] = tf.subtract(ops_dict["target"], estimatedQ, name="td_error")
+                # Importance sampling weights correct for the bias introduced by prioritized sampling. Defaults to uniform weights.
+                ops_dict["weights"] = tf.placeholder_with_default(tf.ones_like(ops_dict["actions"], dtype=tf.float32), shape=[None], name="is_weights")
 
-                # Simple sum-of-squares loss (error) function. Note that biases do not
+                # Simple (weighted) sum-of-squares loss (error) function. Note that biases do not
                 # need to be regularized since they are (generally) not subject to overfitting.
-                ops_dict["loss"] = tf.reduce_mean(0.5*tf.square(ops_dict["target"]-estimatedQ), name="loss")
+                ops_dict["loss"] = tf.reduce_mean(ops_dict["weights"]*0.5*tf.square(ops_dict["td_error"]), name="loss")
 
                 ops_dict["trainer"] = tf.train.AdamOptimizer(learning_rate = ops_dict["learning_rate"])
                 ops_dict["update"] = ops_dict["trainer"].minimize(ops_dict["loss"], name="update")
 
         return ops_dict
 
+    def build_q_values(self, inputs, dropout_keep_prob):
+        """
+        Adds the layers of the network, applied to inputs, to the graph. Must be called within the variable scope of the network. Layers are
+        created the first time this is called in a scope and reused (sharing weights) when called again within the scope with reuse=True.
+        Args:
+            inputs (tensor): batch of formatted states (see DraftStateBatch.format_inputs())
+            dropout_keep_prob (tensor): probability of keeping each hidden unit
+        Returns:
+            outQ (tensor): estimated Q-values for each action from each input state
+        """
+        # Fully connected (FC) layers:
+        if(self._input_mode == "sparse"):
+            # Sparse inputs are padded lists of indices into the flattened state matrix. The first layer
+            # sums the kernel rows for each index, which is equivalent to the dense layer below.
+            fc0 = embedding_dense(
+                inputs,
+                int(np.prod(self._input_shape)),
+                self._filter_sizes[0],
+                activation=tf.nn.relu,
+                bias_initializer=tf.constant_initializer(0.1),
+                name="fc_0")
+        else:
+            fc0 = tf.layers.dense(
+                inputs,
+                self._filter_sizes[0],
+                activation=tf.nn.relu,
+                bias_initializer=tf.constant_initializer(0.1),
+                name="fc_0")
+        dropout0 = tf.nn.dropout(fc0, dropout_keep_prob)
+
+        fc1 = tf.layers.dense(
+            dropout0,
+            self._filter_sizes[1],
+            activation=tf.nn.relu,
+            bias_initializer=tf.constant_initializer(0.1),
+            name="fc_1")
+        dropout1 = tf.nn.dropout(fc1, dropout_keep_prob)
+
+        # FC output layer
+        outQ = tf.layers.dense(
+            dropout1,
+            self._output_shape,
+            activation=None,
+            bias_initializer=tf.constant_initializer(0.1),
+            kernel_regularizer=tf.contrib.layers.l2_regularizer(scale=self._regularization_coeff),
+            name="q_vals")
+        return outQ
+
+    def create_double_q_target_ops(self, target_scope, online_scope):
+        """
+        Adds operations to the graph which compute double DQN targets
+            targetQ[i] = r[i] + gamma*Q_target(s'[i], argmax_a Q_online(s'[i],a))
+        for a batch of experiences in a single session run, where the max is taken over the valid actions from s'[i] and the second term
+        is dropped for experiences ending in a terminal state. The online and target networks are applied to the ending states by reusing
+        their weights, so the targets can also be computed in the same run as an update of the online network (see "update" below).
+        Args:
+            target_scope (str): name of scope that target network occupies
+            online_scope (str): name of scope that online network occupies
+        Returns:
+            ops_dict (dict): dictionary of operations and placeholders:
+                "rewards": reward r[i] for each experience
+                "next_input": formatted non-terminal ending states s'[i] (see DraftStateBatch.format_inputs())
+                "next_valid_actions": valid action mask for each non-terminal ending state
+                "non_terminal": index into the batch of the experience each non-terminal ending state belongs to
+                "target_next_input": (optional) ending states to evaluate with the target network. Defaults to "next_input"
+                "cached_target_Q": (optional) precomputed target network Q vectors for the ending states not included in "target_next_input"
+                "target_order": (optional) index of each ending state's target Q vector in the rows of "target_next_Q" followed by the rows of "cached_target_Q"
+                "target_next_Q": target network Q vectors of the "target_next_input" states
+                "target": target Q value for each experience
+                "td_error", "loss", "update": as the corresponding online network ops, with "target" in place of the target placeholder.
+                    The online network's input, actions, weights and dropout_keep_prob placeholders must also be fed.
+        """
+        ops_dict = {}
+        online_ops = self.online_ops
+        with self._graph.as_default():
+            with tf.variable_scope("double_q_target"):
+                ops_dict["rewards"] = tf.placeholder(tf.float32, shape=[None], name="rewards")
+                if(self._input_mode == "sparse"):
+                    ops_dict["next_input"] = tf.placeholder(tf.int32, (None, None), name="next_inputs")
+                else:
+                    ops_dict["next_input"] = tf.placeholder(tf.float32, (None,)+self._input_shape, name="next_inputs")
+                ops_dict["next_valid_actions"] = tf.placeholder(tf.bool, shape=(None, self._output_shape), name="next_valid_actions")
+                ops_dict["non_terminal"] = tf.placeholder(tf.int32, shape=[None], name="non_terminal")
+                # By default every ending state is evaluated by the target network. Target Q vectors which are already known
+                # (see TargetQCache) can instead be fed to "cached_target_Q", with only the remaining states fed to "target_next_input".
+                ops_dict["target_next_input"] = tf.placeholder_with_default(ops_dict["next_input"], shape=ops_dict["next_input"].shape, name="target_next_inputs")
+                ops_dict["cached_target_Q"] = tf.placeholder_with_default(tf.zeros((0, self._output_shape), dtype=tf.float32), shape=(None, self._output_shape), name="cached_target_Q")
+                ops_dict["target_order"] = tf.placeholder_with_default(tf.range(tf.shape(ops_dict["next_input"])[0]), shape=[None], name="target_order")
+
+            with tf.variable_scope(online_scope, reuse=True):
+                online_next_Q = self.build_q_values(ops_dict["next_input"], 1.0)
+            with tf.variable_scope(target_scope, reuse=True):
+                ops_dict["target_next_Q"] = self.build_q_values(ops_dict["target_next_input"], 1.0)
+            target_next_Q = tf.gather(tf.concat([ops_dict["target_next_Q"], ops_dict["cached_target_Q"]], axis=0), ops_dict["target_order"])
+
+            with tf.variable_scope("double_q_target"):
+                # Action is chosen by online network, but the target network is used to evaluate this policy.
+                valid_next_Q = tf.where(ops_dict["next_valid_actions"], online_next_Q, tf.scalar_mul(-np.inf,tf.ones_like(online_next_Q)))
+                next_actions = tf.cast(tf.argmax(valid_next_Q, axis=1), tf.int32)
+                ind = tf.stack([tf.range(tf.shape(next_actions)[0]), next_actions], axis=1)
+                next_Q = tf.gather_nd(target_next_Q, ind)
+                # Scatter the discounted values of the non-terminal ending states back into the batch
+                future_Q = tf.scatter_nd(tf.expand_dims(ops_dict["non_terminal"], axis=1), next_Q, tf.shape(ops_dict["rewards"]))
+                ops_dict["target"] = tf.stop_gradient(ops_dict["rewards"] + self._discount_factor*future_Q, name="target_Q")
+
+                ops_dict["td_error"] = tf.subtract(ops_dict["target"], online_ops["estimated_Q"], name="td_error")
+                ops_dict["loss"] = tf.reduce_mean(online_ops["weights"]*0.5*tf.square(ops_dict["td_error"]), name="loss")
+                # Reusing the online network's optimizer shares its state (eg. Adam moments) with the online "update" op. Only the
+                # online network is trained, the target network is updated from it by target_ops["target_update"].
+                online_params = tf.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES, scope=online_scope)
+                ops_dict["update"] = online_ops["trainer"].minimize(ops_dict["loss"], var_list=online_params, name="update")
+        return ops_dict
+
     def create_target_update_ops(self, target_scope, online_scope, tau=1e-3, name="target_update"):
         """
         Adds operations to graph which are used to update the target network after after a training batch is sent
@@ -2,6 +2,7 @@ import tensorflow as tf
 import numpy as np
 
 from . import base_model
+from .sparse_input import embedding_dense
 
 class SoftmaxNetwork(base_model.BaseModel):
     """
@@ -11,10 +12,13 @@ class SoftmaxNetwork(base_model.BaseModel):
         filter_sizes (tuple of 2 ints): number of filters in each of the two hidden layers. Defaults to (16,32).
         learning_rate (float): network's willingness to change current weights given new example
         regularization (float): strength of weights regularization term in loss function
+        input_mode (string): format of network inputs. "dense" (default) takes flattened state matrices (DraftState.format_state()),
+            "sparse" takes padded lists of submission indices (DraftState.format_sparse_state()).
 
     A simple softmax network class which is responsible for holding and updating the weights and biases used in predicing actions for given state. This network will consist of
     the following layers:
     1) Input- a DraftState state s (an array of bool) representing the current state reshaped into an [n_batch, *input_shape] tensor.
+        If input_mode = "sparse" the state is instead given as an [n_batch, n_submissions] tensor of indices into the flattened state.
     2-4) Two layers of relu-activated hidden fc layers
     4) Output- softmax-obtained probability of action submission for output_shape actions available.
 
@@ -23,8 +27,13 @@ class SoftmaxNetwork(base_model.BaseModel):
     def name(self):
         return self._name
 
-    def __init__(self, name, path, input_shape, output_shape, filter_sizes = (512,512), learning_rate=1.e-3, regularization_coeff = 0.01):
+    @property
+    def input_mode(self):
+        return self._input_mode
+
+    def __init__(self, name, path, input_shape, output_shape, filter_sizes = (512,512), learning_rate=1.e-3, regularization_coeff = 0.01, input_mode="dense"):
         super().__init__(name=name, path=path)
+        self._input_mode = input_mode
         self._input_shape = input_shape
         self._output_shape = output_shape
         self._learning_rate = learning_rate
@@ -58,16 +67,28 @@ class SoftmaxNetwork(base_model.BaseModel):
                 # Incoming state matrices are of size input_size = (nChampions, nPos+2)
                 # 'None' here means the input tensor will flex with the number of training
                 # examples (aka batch size).
-                ops_dict["input"] = tf.placeholder(tf.float32, (None,)+self._input_shape, name="inputs")
                 ops_dict["dropout_keep_prob"] = tf.placeholder_with_default(1.0,shape=())
 
                 # Fully connected (FC) layers:
-                fc0 = tf.layers.dense(
-                    ops_dict["input"],
-                    self._filter_sizes[0],
-                    activation=tf.nn.relu,
-                    bias_initializer=tf.constant_initializer(0.1),
-                    name="fc_0")
+                if(self._input_mode == "sparse"):
+                    # Sparse inputs are padded lists of indices into the flattened state matrix. The first layer
+                    # sums the kernel rows for each index, which is equivalent to the dense layer below.
+                    ops_dict["input"] = tf.placeholder(tf.int32, (None, None), name="inputs")
+                    fc0 = embedding_dense(
+                        ops_dict["input"],
+                        int(np.prod(self._input_shape)),
+                        self._filter_sizes[0],
+                        activation=tf.nn.relu,
+                        bias_initializer=tf.constant_initializer(0.1),
+                        name="fc_0")
+                else:
+                    ops_dict["input"] = tf.placeholder(tf.float32, (None,)+self._input_shape, name="inputs")
+                    fc0 = tf.layers.dense(
+                        ops_dict["input"],
+                        self._filter_sizes[0],
+                        activation=tf.nn.relu,
+                        bias_initializer=tf.constant_initializer(0.1),
+                        name="fc_0")
                 dropout0 = tf.nn.dropout(fc0, ops_dict["dropout_keep_prob"])
 
                 fc1 = tf.layers.dense(
@@ -0,0 +1,50 @@
+import tensorflow as tf
+
+def embedding_dense(ids, input_size, units, activation=None, bias_initializer=tf.zeros_initializer(), name=None):
+    """
+    Fully connected layer for 0/1 inputs which are given as padded lists of the indices of their non-zero entries
+    (see DraftState.format_sparse_state()). Rather than multiplying the mostly zero input vector by the kernel, the rows of
+    the kernel corresponding to each index are looked up and summed. This is mathematically equivalent to
+        tf.layers.dense(x, units, activation, bias_initializer=bias_initializer, name=name)
+    where x is the dense 0/1 vector with ones at each index. Indices >= input_size are treated as padding and contribute nothing.
+
+    The layer creates its variables with the same names and shapes as tf.layers.dense (name/kernel and name/bias) so
+    checkpoints are interchangeable between dense and sparse input models.
+    Args:
+        ids (tensor): int32 tensor of shape [n_batch, n_ids] holding padded input indices
+        input_size (int): length of the equivalent dense input vector
+        units (int): number of output units
+        activation (function): activation function applied to the output (None for linear activation)
+        bias_initializer (initializer): initializer for the bias
+        name (str): name of the layer
+    Returns:
+        outputs (tensor): tensor of shape [n_batch, units]
+    """
+    with tf.variable_scope(name, default_name="embedding_dense"):
+        kernel = tf.get_variable("kernel", shape=(input_size, units), initializer=tf.glorot_uniform_initializer())
+        bias = tf.get_variable("bias", shape=(units,), initializer=bias_initializer)
+
+        # Padding indices are clipped into range and then masked out of the sum. Gathering from the kernel directly (rather than
+        # from a zero-padded copy of it) keeps the gradient with respect to the kernel sparse.
+        mask = tf.cast(tf.less(ids, input_size), tf.float32)
+        rows = tf.gather(kernel, tf.minimum(ids, input_size-1))
+        outputs = tf.reduce_sum(rows*tf.expand_dims(mask, axis=2), axis=1) + bias
+        if activation is not None:
+            outputs = activation(outputs)
+    return outputs
+
+def convert_dense_checkpoint(model, dense_path, out_path):
+    """
+    Converts a checkpoint saved by a model built with input_mode = "dense" into a checkpoint for model, which should be an otherwise
+    identical model built with input_mode = "sparse". Since embedding_dense() creates the same variables as the dense input layer it replaces,
+    the dense weights are restored directly and then saved alongside the sparse model's graph definition. The resulting checkpoint can be loaded
+    with the inference models.
+    Args:
+        model (Qnetwork or SoftmaxNetwork): sparse input model
+        dense_path (str): path to existing dense input checkpoint
+        out_path (str): path to save converted checkpoint to
+    Returns:
+        None
+    """
+    model.load(dense_path)
+    model.save(out_path)
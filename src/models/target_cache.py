@@ -0,0 +1,107 @@
+from collections import OrderedDict
+
+import numpy as np
+
+class TargetQCache():
+    """
+    TargetQCache holds the target network's Q vectors for recently evaluated states, keyed by state hash (see DraftState.zobrist_hash()).
+    The target network only changes when it is updated from the online network, so between updates the same states sampled from replay
+    do not need to be evaluated again. The cache must be invalidated whenever the target network is updated.
+
+    Q vectors are held in a preallocated (max_size, num_actions) array. Once full, the least recently used entry is evicted to make room
+    for each new entry. Since distinct states can share a 64-bit hash, each entry also keeps a verification key for its state (eg. the
+    sparse state encoding, see DraftStateBatch.format_sparse_states()) and a lookup only hits if the key matches as well.
+    Args:
+        max_size (int): maximum number of Q vectors held
+        num_actions (int): length of each Q vector
+    """
+    def __init__(self, max_size, num_actions):
+        self.max_size = max_size
+        self.num_actions = num_actions
+        self.values = np.zeros((max_size, num_actions), dtype=np.float32)
+        # Maps state hash -> (row of values, verification key), ordered from least to most recently used
+        self._slots = OrderedDict()
+        self._free = list(range(max_size))
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def lookup(self, hashes, keys):
+        """
+        Looks up the cached Q vector for each state.
+        Args:
+            hashes (array(uint64)): hash of each state
+            keys (array): (len(hashes), key_size) verification key of each state
+        Returns:
+            (hits, values) (tuple): hits (array(bool)) flags the states found in the cache and values holds the Q vector of each hit (in order)
+        """
+        hashes = np.asarray(hashes).tolist()
+        slots = []
+        hits = np.zeros(len(hashes), dtype=bool)
+        for (n, state_hash) in enumerate(hashes):
+            entry = self._slots.get(state_hash)
+            if entry is None:
+                continue
+            (slot, key) = entry
+            if key != keys[n].tobytes():
+                # Another state with the same hash is cached
+                self.collisions += 1
+                continue
+            self._slots.move_to_end(state_hash)
+            slots.append(slot)
+            hits[n] = True
+        self.hits += len(slots)
+        self.misses += len(hashes)-len(slots)
+        return (hits, self.values[slots])
+
+    def insert(self, hashes, keys, values):
+        """
+        Adds the Q vector of each state to the cache, evicting the least recently used entries if the cache is full. A cached state
+        with the same hash as an inserted state is replaced.
+        Args:
+            hashes (array(uint64)): hash of each state
+            keys (array): (len(hashes), key_size) verification key of each state
+            values (array(float)): (len(hashes), num_actions) array of Q vectors
+        Returns:
+            None
+        """
+        if self.max_size <= 0:
+            return None
+        for (state_hash, key, value) in zip(np.asarray(hashes).tolist(), keys, values):
+            entry = self._slots.get(state_hash)
+            if entry is None:
+                if self._free:
+                    slot = self._free.pop()
+                else:
+                    (_, (slot, _)) = self._slots.popitem(last=False)
+            else:
+                slot = entry[0]
+                self._slots.move_to_end(state_hash)
+            self._slots[state_hash] = (slot, key.tobytes())
+            self.values[slot] = value
+        return None
+
+    def invalidate(self):
+        """
+        Empties the cache. Must be called whenever the target network changes.
+        """
+        self._slots.clear()
+        self._free = list(range(self.max_size))
+        self.invalidations += 1
+
+    def get_hit_rate(self):
+        """
+        Returns the fraction of lookups which were found in the cache.
+        """
+        total = self.hits+self.misses
+        return self.hits/total if total else 0.
+
+    def get_stats(self):
+        """
+        Returns a dictionary of cache statistics (hits, misses, hit_rate, size, collisions and invalidations).
+        """
+        return {"hits":self.hits, "misses":self.misses, "hit_rate":self.get_hit_rate(), "size":len(self), "collisions":self.collisions, "invalidations":self.invalidations}
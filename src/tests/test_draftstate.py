@@ -0,0 +1,128 @@
+import numpy as np
+from data.champion_info import get_champion_ids
+from features.draft import Draft
+from features.draftstate import DraftState
+
+def submit_draft(state, champ_ids, num_submissions=None):
+    """
+    Submits the first num_submissions (default all) submissions of a default draft to state, using a different champion for each submission.
+    Our team picks positions 1-5 in order.
+    """
+    ally_picks = 0
+    structure = Draft.default_draft[:num_submissions]
+    for (n, (team, phase)) in enumerate(structure):
+        if(phase == Draft.BAN):
+            position = -1
+        elif(team == state.team):
+            ally_picks += 1
+            position = ally_picks
+        else:
+            position = 0
+        assert state.update(champ_ids[n], position)
+    return state
+
+def test_evaluate():
+    """
+    evaluate() returns 0 for an incomplete draft, DRAFT_COMPLETE for a complete one and the matching code for each kind of invalid draft.
+    """
+    champ_ids = get_champion_ids()
+    for team in [DraftState.BLUE_TEAM, DraftState.RED_TEAM]:
+        assert DraftState(team).evaluate() == 0
+        assert submit_draft(DraftState(team), champ_ids, 9).evaluate() == 0
+        assert submit_draft(DraftState(team), champ_ids).evaluate() == DraftState.DRAFT_COMPLETE
+
+    state = DraftState(DraftState.BLUE_TEAM)
+    state.update(champ_ids[0], -1)
+    state.update(champ_ids[0], -1)
+    assert state.evaluate() == DraftState.DUPLICATE_SUBMISSION
+
+    state = submit_draft(DraftState(DraftState.BLUE_TEAM), champ_ids, 6)
+    state.update(champ_ids[7], 1)
+    state.update(champ_ids[7], 0)
+    assert state.evaluate() == DraftState.DUPLICATE_SUBMISSION
+
+    # NULL bans are not duplicates
+    state = DraftState(DraftState.BLUE_TEAM)
+    state.update(None, -1)
+    state.update(None, -1)
+    assert state.evaluate() == 0
+
+    state = submit_draft(DraftState(DraftState.BLUE_TEAM), champ_ids, 6)
+    state.update(champ_ids[0], 1)
+    assert state.evaluate() == DraftState.BAN_AND_SUBMISSION
+
+    state = submit_draft(DraftState(DraftState.BLUE_TEAM), champ_ids, 6)
+    state.update(champ_ids[6], 1)
+    state.update(champ_ids[7], 0)
+    state.update(champ_ids[8], 0)
+    state.update(champ_ids[9], 1)
+    assert state.evaluate() == DraftState.DUPLICATE_ROLE
+
+    # Pick submitted during the ban phase
+    state = DraftState(DraftState.BLUE_TEAM)
+    state.update(champ_ids[0], 1)
+    assert state.evaluate() == DraftState.INVALID_SUBMISSION
+
+def test_format_state():
+    """
+    format_state() flattens the (num_champions, num_positions+2) state matrix, marking the cell of each submitted champion's row
+    in the column of its position.
+    """
+    champ_ids = get_champion_ids()
+    state = submit_draft(DraftState(DraftState.BLUE_TEAM), champ_ids, 8)
+    formatted = state.format_state()
+    assert formatted.shape == (state.num_champions*(state.num_positions+2),)
+    cells = formatted.reshape(state.num_champions, state.num_positions+2)
+    expected = np.zeros_like(cells)
+    for (n, position) in enumerate([-1]*6+[1,0]):
+        expected[state.get_state_index(champ_ids[n]), state.get_position_index(position)] = True
+    assert np.array_equal(cells, expected)
+
+def test_get_valid_actions():
+    """
+    get_valid_actions() allows bans of the remaining champions during a ban phase and picks of the remaining champions into our
+    unfilled positions during a pick phase. Complete or invalid drafts have no valid actions.
+    """
+    champ_ids = get_champion_ids()
+    state = DraftState(DraftState.BLUE_TEAM)
+    num_columns = state.num_positions+1
+    mask = state.get_valid_actions().reshape(state.num_champions, num_columns)
+    assert np.all(mask[:,0]) and not np.any(mask[:,1:])
+
+    state = submit_draft(state, champ_ids, 7)
+    mask = state.get_valid_actions().reshape(state.num_champions, num_columns)
+    # Position 1 has been filled by our first pick and the first seven champions have been submitted
+    submitted = np.zeros(state.num_champions, dtype=bool)
+    submitted[[state.get_state_index(cid) for cid in champ_ids[:7]]] = True
+    assert not np.any(mask[:,:2])
+    assert not np.any(mask[submitted])
+    assert np.all(mask[~submitted,2:])
+    assert np.array_equal(np.nonzero(mask.reshape(-1))[0], state.get_valid_actions(form="list")[0])
+
+    state = submit_draft(DraftState(DraftState.BLUE_TEAM), champ_ids)
+    assert state.get_valid_actions().shape == (state.num_actions,)
+    assert not np.any(state.get_valid_actions())
+    assert len(state.get_valid_actions(form="list")) == 0
+
+    state = DraftState(DraftState.BLUE_TEAM)
+    state.update(champ_ids[0], 1)
+    assert not np.any(state.get_valid_actions())
+
+def test_update():
+    """
+    update() records legal and illegal submissions alike, but rejects unknown champions and positions.
+    """
+    champ_ids = get_champion_ids()
+    state = DraftState(DraftState.RED_TEAM)
+    assert state.update(None, -1)
+    assert state.update(champ_ids[0], -1)
+    assert state.update(champ_ids[1], 0)
+    assert state.update(champ_ids[2], 3)
+    assert state.bans == [None, champ_ids[0]]
+    assert state.picks == [champ_ids[1], champ_ids[2]]
+    assert state.selected_pos == [0, 3]
+    assert not state.update(champ_ids[3], -2)
+    assert not state.update(champ_ids[3], state.num_positions+1)
+    assert not state.update(max(champ_ids)+1, -1)
+    assert state.bans == [None, champ_ids[0]]
+    assert state.picks == [champ_ids[1], champ_ids[2]]
@@ -0,0 +1,92 @@
+import numpy as np
+from data.champion_info import get_champion_ids
+from features.draft import Draft
+from features.draftstate import DraftState
+from features.draftstatebatch import DraftStateBatch
+
+def random_submissions(rng, teams, illegal_rate=0.05):
+    """
+    Generates a random submission for each step of a default draft drafted by each of teams, as (champion_ids, positions) arrays
+    of shape (len(teams), num_steps). Submissions follow the draft order, except that with probability illegal_rate a random champion
+    is submitted to a random position. Some bans are NULL bans (None).
+    """
+    champ_ids = np.array(get_champion_ids())
+    num_drafts = len(teams)
+    num_steps = len(Draft.default_draft)
+    champion_ids = np.empty((num_drafts, num_steps), dtype=object)
+    positions = np.zeros((num_drafts, num_steps), dtype=np.int64)
+    for n in range(num_drafts):
+        order = rng.permutation(champ_ids)
+        ally_positions = rng.permutation(5)+1
+        ally_picks = 0
+        for (step, (team, phase)) in enumerate(Draft.default_draft):
+            champion_ids[n, step] = int(order[step])
+            if(phase == Draft.BAN):
+                positions[n, step] = -1
+                if(rng.rand() < 0.1):
+                    champion_ids[n, step] = None
+            elif(team == teams[n]):
+                positions[n, step] = ally_positions[ally_picks]
+                ally_picks += 1
+            if(rng.rand() < illegal_rate):
+                champion_ids[n, step] = int(rng.choice(champ_ids))
+                positions[n, step] = rng.randint(-1, 6)
+    return (champion_ids, positions)
+
+def assert_batch_matches(batch, states):
+    assert np.array_equal(batch.evaluate(), [state.evaluate() for state in states])
+    assert np.array_equal(batch.valid_action_masks(), [state.get_valid_actions() for state in states])
+    valid = batch.evaluate() == 0
+    if np.any(valid):
+        assert np.array_equal(batch.take(np.nonzero(valid)[0]).format_states(), [state.format_state() for (state, ok) in zip(states, valid) if ok])
+        assert np.array_equal(batch.take(np.nonzero(valid)[0]).format_secondary_inputs(), [state.format_secondary_inputs() for (state, ok) in zip(states, valid) if ok])
+
+def test_batch_matches_draftstates():
+    """
+    Updating a DraftStateBatch gives the same states as updating each DraftState, and from_states() stacks DraftStates into the same batch.
+    """
+    rng = np.random.RandomState(0)
+    num_drafts = 40
+    teams = np.arange(num_drafts) % 2
+    (champion_ids, positions) = random_submissions(rng, teams)
+    states = [DraftState(team) for team in teams]
+    batch = DraftStateBatch(teams)
+    for step in range(champion_ids.shape[1]):
+        success = batch.update(champion_ids[:,step], positions[:,step])
+        assert np.array_equal(success, [state.update(cid, pos) for (state, cid, pos) in zip(states, champion_ids[:,step], positions[:,step])])
+        assert_batch_matches(batch, states)
+        assert_batch_matches(DraftStateBatch.from_states(states), states)
+    assert np.any(batch.evaluate() == DraftState.DRAFT_COMPLETE)
+    assert np.any(np.isin(batch.evaluate(), DraftState.invalid_states))
+
+def test_encoding_round_trip():
+    """
+    from_encodings() rebuilds the drafts encoded by format_sparse_states() (or DraftState.format_sparse_state()) along with their submission
+    counts, including drafts with NULL bans, and the rebuilt drafts continue to update like the originals.
+    """
+    rng = np.random.RandomState(1)
+    num_drafts = 40
+    teams = np.arange(num_drafts) % 2
+    (champion_ids, positions) = random_submissions(rng, teams, illegal_rate=0.)
+    states = [DraftState(team) for team in teams]
+    batch = DraftStateBatch(teams)
+    for step in range(champion_ids.shape[1]-1):
+        batch.update(champion_ids[:,step], positions[:,step])
+        for (state, cid, pos) in zip(states, champion_ids[:,step], positions[:,step]):
+            state.update(cid, pos)
+        steps = batch.num_bans+batch.num_picks
+        # DraftState lists its submissions in the order they were made, so its encoding may differ from the batch's sorted encoding
+        from_states = DraftStateBatch.from_encodings(teams, [state.format_sparse_state() for state in states], steps)
+        rebuilt = DraftStateBatch.from_encodings(teams, batch.format_sparse_states(), steps)
+        for decoded in [from_states, rebuilt]:
+            for attr in ["state", "column_counts", "num_bans", "num_picks", "hashes"]:
+                assert np.array_equal(getattr(decoded, attr), getattr(batch, attr))
+            assert np.array_equal(decoded.evaluate(), batch.evaluate())
+            assert np.array_equal(decoded.valid_action_masks(), batch.valid_action_masks())
+
+        rebuilt.update(champion_ids[:,step+1], positions[:,step+1])
+        after = batch.take(np.arange(num_drafts))
+        after.update(champion_ids[:,step+1], positions[:,step+1])
+        assert np.array_equal(rebuilt.state, after.state)
+        assert np.array_equal(rebuilt.hashes, after.hashes)
+        assert np.array_equal(rebuilt.evaluate(), after.evaluate())
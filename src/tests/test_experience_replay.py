@@ -0,0 +1,30 @@
+import numpy as np
+from data.champion_info import get_champion_ids
+from features.draftstate import DraftState
+from features.draftstatebatch import DraftStateBatch
+from features.experience_replay import ExperienceBuffer
+
+def test_store_invalid_experience():
+    """
+    Experiences ending in an illegal submission (as made by the learner) are stored as terminal and decode back to invalid states.
+    """
+    champ_ids = get_champion_ids()
+    state = DraftState(DraftState.BLUE_TEAM)
+    state.update(champ_ids[0], -1)
+    # Picking a champion during the ban phase and banning an already banned champion are both illegal
+    experiences = [(state, (champ_ids[1], 1), -10., state.with_submission(champ_ids[1], 1)),
+                   (state, (champ_ids[0], -1), -10., state.with_submission(champ_ids[0], -1))]
+    for (_, _, _, next_state) in experiences:
+        assert next_state.evaluate() in DraftState.invalid_states
+
+    for compressed in [False, True]:
+        buf = ExperienceBuffer(10, compressed=compressed)
+        buf.store(experiences)
+        stored = buf.get_experiences()
+        assert buf.get_buffer_size() == len(experiences)
+        assert np.all(stored["terminal"])
+        assert np.all(stored["rewards"] == -10.)
+        next_states = DraftStateBatch.from_encodings(stored["teams"], stored["next_states"], stored["next_steps"])
+        assert np.all(np.isin(next_states.evaluate(), DraftState.invalid_states))
+        start_states = DraftStateBatch.from_encodings(stored["teams"], stored["states"], stored["steps"])
+        assert np.all(start_states.evaluate() == state.evaluate())
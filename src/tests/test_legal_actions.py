@@ -0,0 +1,34 @@
+import numpy as np
+from data.champion_info import get_champion_ids
+from features.draftstate import DraftState
+
+def test_iter_legal_actions():
+    """
+    iter_legal_actions() generates the actions of get_valid_actions() (in the requested order) along with the submission each describes.
+    """
+    rng = np.random.RandomState(0)
+    for team in [DraftState.BLUE_TEAM, DraftState.RED_TEAM]:
+        state = DraftState(team)
+        while(state.evaluate() == 0):
+            valid = np.flatnonzero(state.get_valid_actions())
+            legal = list(state.iter_legal_actions())
+            assert [action for (action, _, _) in legal] == valid.tolist()
+            for (action, champion_id, position) in legal[::50]:
+                assert state.format_action(action) == (champion_id, position)
+                assert state.is_submission_legal(champion_id, position)
+
+            values = rng.rand(state.num_actions)
+            ordered = [action for (action, _, _) in state.iter_legal_actions(np.argsort(-values))]
+            assert ordered == valid[np.argsort(-values[valid])].tolist()
+            # Ids outside of the action space are skipped
+            assert [action for (action, _, _) in state.iter_legal_actions([-1, valid[0], state.num_actions])] == [valid[0]]
+
+            (champion_id, position) = state.format_action(rng.choice(valid))
+            state.update(champion_id, position)
+        # Enemy picks are never valid actions, so the random walk ends in an invalid (or complete) draft
+        assert list(state.iter_legal_actions()) == []
+
+    champ_ids = get_champion_ids()
+    state = DraftState(DraftState.BLUE_TEAM)
+    state.update(champ_ids[0], 1)
+    assert list(state.iter_legal_actions()) == []
@@ -0,0 +1,74 @@
+import numpy as np
+import data.database_ops as dbo
+import features.match_processing as mp
+from features.draftstate import DraftState
+from features.draftstatebatch import DraftStateBatch
+
+PATH_TO_DB = "../data/competitiveMatchData.db"
+
+def test_process_matches():
+    """
+    process_matches() produces the experiences of process_match() (without NULL actions) as arrays.
+    """
+    matches = dbo.get_matches_by_id(list(range(1,51)), PATH_TO_DB)
+    for team in [DraftState.BLUE_TEAM, DraftState.RED_TEAM]:
+        experiences = mp.process_matches(matches, team, augment_data=False)
+        expected = [(match["id"], exp) for match in matches for exp in mp.process_match(match, team, augment_data=False) if exp[1][0] is not None]
+        assert len(experiences["actions"]) == len(expected)
+        assert np.all(experiences["teams"] == team)
+        for (n, (match_id, (state, action, reward, next_state))) in enumerate(expected):
+            assert experiences["match_ids"][n] == match_id
+            assert experiences["actions"][n] == state.get_action(*action)
+            assert experiences["rewards"][n] == reward
+            assert experiences["terminal"][n] == (next_state.evaluate() == DraftState.DRAFT_COMPLETE)
+            assert np.array_equal(experiences["valid_actions"][n], state.get_valid_actions())
+
+        for (prefix, index) in [("", 0), ("next_", 3)]:
+            decoded = DraftStateBatch.from_encodings(experiences["teams"], experiences[prefix+"states"], experiences[prefix+"steps"])
+            reference = DraftStateBatch.from_states([exp[index] for (_, exp) in expected])
+            assert np.array_equal(decoded.state, reference.state)
+            assert np.array_equal(decoded.num_bans, reference.num_bans)
+            assert np.array_equal(decoded.evaluate(), reference.evaluate())
+
+def test_augmentations():
+    """
+    Each augmentation id reorders the interchangeable submissions of a match without changing the completed draft, and process_match()
+    and process_matches() agree on the experiences of a given id.
+    """
+    matches = dbo.get_matches_by_id(list(range(1,6)), PATH_TO_DB)
+    draft = DraftState(DraftState.BLUE_TEAM).draft_structure
+    augment_ids = np.arange(0, draft.num_augmentations, 37)
+    (champion_ids, positions) = mp.expand_augmentations(matches, augment_ids)
+    for (match, match_champion_ids) in zip(matches, champion_ids):
+        # Every augmentation submits the same champions
+        assert np.all(np.sort(match_champion_ids, axis=1) == np.sort(match_champion_ids[0]))
+        for team in [DraftState.BLUE_TEAM, DraftState.RED_TEAM]:
+            final_states = []
+            for augment_id in augment_ids[:4]:
+                experiences = mp.process_match(match, team, augment_id=augment_id)
+                final_states.append(experiences[-1][3].format_state())
+                arrays = mp.process_matches(match, team, augment_ids=augment_id)
+                expected = [exp for exp in experiences if exp[1][0] is not None]
+                assert np.array_equal(arrays["actions"], [state.get_action(*action) for (state, action, _, _) in expected])
+                assert np.array_equal(arrays["rewards"], [reward for (_, _, reward, _) in expected])
+            assert all(np.array_equal(state, final_states[0]) for state in final_states)
+
+def assert_same_experiences(experiences, expected):
+    assert len(experiences) == len(expected)
+    for ((state, action, reward, next_state), (ref_state, ref_action, ref_reward, ref_next_state)) in zip(experiences, expected):
+        assert action == ref_action and reward == ref_reward
+        assert np.array_equal(state.format_state(), ref_state.format_state())
+        assert np.array_equal(next_state.format_state(), ref_next_state.format_state())
+
+def test_process_match_both_sides():
+    """
+    process_match_both_sides() gives each team the experiences process_match() gives it for the same augmentation id.
+    """
+    matches = dbo.get_matches_by_id(list(range(1,11)), PATH_TO_DB)
+    rng = np.random.RandomState(0)
+    draft = DraftState(DraftState.BLUE_TEAM).draft_structure
+    for match in matches:
+        augment_id = rng.randint(draft.num_augmentations)
+        experiences = mp.process_match_both_sides(match, augment_id=augment_id)
+        for team in [DraftState.BLUE_TEAM, DraftState.RED_TEAM]:
+            assert_same_experiences(experiences[team], mp.process_match(match, team, augment_id=augment_id))
@@ -0,0 +1,39 @@
+import numpy as np
+import features.metrics as metrics
+
+def test_rank_metrics():
+    """
+    rank_metrics() agrees with ranking each prediction separately by sorting its values.
+    """
+    rng = np.random.RandomState(0)
+    values = rng.randn(200, 30)
+    # Ties are ranked in favour of the submitted action
+    values[:20,:5] = 1.
+    actions = rng.randint(30, size=200)
+    actions[:10] = 0
+    result = metrics.rank_metrics(values, actions, k=5)
+
+    ranks = []
+    errors = []
+    for (row, action) in zip(values, actions):
+        ranks.append(len([value for value in row if value > row[action]]))
+        errors.append(abs(row.max()-row[action])/abs(row.max()))
+    assert np.array_equal(result["ranks"], ranks)
+    assert np.allclose(result["errors"], errors)
+    assert np.isclose(result["top1"], np.mean(np.array(ranks) < 1))
+    assert np.isclose(result["topk"], np.mean(np.array(ranks) < 5))
+    assert metrics.top_k_accuracy([], 5) == 0.
+
+def test_top_k_actions():
+    """
+    top_k_actions() returns the k highest valued actions of each prediction in descending order of value.
+    """
+    rng = np.random.RandomState(1)
+    values = rng.randn(50, 30)
+    values[0] = 0.
+    top = metrics.top_k_actions(values, 5)
+    assert top.shape == (50, 5)
+    for (row, row_top) in zip(values[1:], top[1:]):
+        assert np.array_equal(row_top, np.argsort(-row)[:5])
+    assert len(np.unique(top[0])) == 5
+    assert metrics.top_k_actions(values, 40).shape == (50, 30)
@@ -0,0 +1,90 @@
+import numpy as np
+from models.qNetwork import Qnetwork
+
+def reference_targets(net, rewards, next_states, next_masks, terminal):
+    """
+    Computes double DQN targets one experience at a time, using the online network to choose each next action and the target network to evaluate it.
+    """
+    targets = np.zeros(len(rewards), dtype=np.float32)
+    for i in range(len(rewards)):
+        targets[i] = rewards[i]
+        if(terminal[i]):
+            continue
+        action = net.sess.run(net.online_ops["prediction"], feed_dict={net.online_ops["input"]:next_states[i:i+1], net.online_ops["valid_actions"]:next_masks[i:i+1]})[0]
+        target_Q = net.sess.run(net.target_ops["outQ"], feed_dict={net.target_ops["input"]:next_states[i:i+1]})[0]
+        targets[i] += net.discount_factor*target_Q[action]
+    return targets
+
+def make_batch(net, rng, batch_size=16):
+    states = rng.rand(batch_size, 12).astype(np.float32)
+    next_states = rng.rand(batch_size, 12).astype(np.float32)
+    actions = rng.randint(5, size=batch_size).astype(np.int32)
+    rewards = rng.randn(batch_size).astype(np.float32)
+    terminal = rng.rand(batch_size) < 0.3
+    # Mask out the unmasked best action of the online network so the masks change the chosen next action
+    online_Q = net.sess.run(net.online_ops["outQ"], feed_dict={net.online_ops["input"]:next_states})
+    next_masks = rng.rand(batch_size, 5) < 0.7
+    next_masks[np.arange(batch_size), online_Q.argmax(axis=1)] = False
+    next_masks[np.arange(batch_size), rng.randint(5, size=batch_size)] = True
+    return (states, actions, rewards, next_states, next_masks, terminal)
+
+def test_fused_double_q_targets():
+    """
+    The fused double DQN targets and TD errors match the targets computed one experience at a time, with or without cached target Q vectors.
+    """
+    rng = np.random.RandomState(0)
+    net = Qnetwork("test", "/tmp/test_qnetwork", (12,), 5, filter_sizes=(8,8))
+    # The target network is deliberately left uninitialized from the online network, so the two networks differ
+    net.sess.run(net.online_ops["init"])
+    (states, actions, rewards, next_states, next_masks, terminal) = make_batch(net, rng)
+    non_terminal = np.flatnonzero(~terminal).astype(np.int32)
+    expected = reference_targets(net, rewards, next_states, next_masks, terminal)
+    estimated_Q = net.sess.run(net.online_ops["estimated_Q"], feed_dict={net.online_ops["input"]:states, net.online_ops["actions"]:actions})
+
+    ops = net.fused_ops
+    feed_dict = {net.online_ops["input"]:states,
+                 net.online_ops["actions"]:actions,
+                 ops["rewards"]:rewards,
+                 ops["next_input"]:next_states[non_terminal],
+                 ops["next_valid_actions"]:next_masks[non_terminal],
+                 ops["non_terminal"]:non_terminal}
+    (target, td_error) = net.sess.run([ops["target"], ops["td_error"]], feed_dict=feed_dict)
+    assert np.allclose(target, expected, atol=1e-5)
+    assert np.allclose(td_error, expected-estimated_Q, atol=1e-5)
+    assert np.all(target[terminal] == rewards[terminal])
+
+    # Feed the target Q vectors of every other ending state as cached values
+    target_Q = net.sess.run(net.target_ops["outQ"], feed_dict={net.target_ops["input"]:next_states[non_terminal]})
+    cached = np.arange(len(non_terminal)) % 2 == 0
+    order = np.zeros(len(non_terminal), dtype=np.int32)
+    order[~cached] = np.arange(np.count_nonzero(~cached))
+    order[cached] = np.count_nonzero(~cached)+np.arange(np.count_nonzero(cached))
+    feed_dict[ops["target_next_input"]] = next_states[non_terminal][~cached]
+    feed_dict[ops["cached_target_Q"]] = target_Q[cached]
+    feed_dict[ops["target_order"]] = order
+    (target, td_error) = net.sess.run([ops["target"], ops["td_error"]], feed_dict=feed_dict)
+    assert np.allclose(target, expected, atol=1e-5)
+    assert np.allclose(td_error, expected-estimated_Q, atol=1e-5)
+
+def test_fused_update_trains_online_network_only():
+    """
+    Running the fused "update" op changes the online network's weights but leaves the target network's weights untouched.
+    """
+    rng = np.random.RandomState(1)
+    net = Qnetwork("test", "/tmp/test_qnetwork", (12,), 5, filter_sizes=(8,8), learning_rate=1.e-2)
+    net.sess.run(net.online_ops["init"])
+    net.sess.run(net.target_ops["target_init"])
+    (states, actions, rewards, next_states, next_masks, terminal) = make_batch(net, rng)
+    non_terminal = np.flatnonzero(~terminal).astype(np.int32)
+    ops = net.fused_ops
+    feed_dict = {net.online_ops["input"]:states,
+                 net.online_ops["actions"]:actions,
+                 ops["rewards"]:rewards,
+                 ops["next_input"]:next_states[non_terminal],
+                 ops["next_valid_actions"]:next_masks[non_terminal],
+                 ops["non_terminal"]:non_terminal}
+    before_online = net.sess.run(net.online_ops["outQ"], feed_dict={net.online_ops["input"]:states})
+    before_target = net.sess.run(net.target_ops["outQ"], feed_dict={net.target_ops["input"]:states})
+    net.sess.run(ops["update"], feed_dict=feed_dict)
+    assert not np.allclose(net.sess.run(net.online_ops["outQ"], feed_dict={net.online_ops["input"]:states}), before_online)
+    assert np.array_equal(net.sess.run(net.target_ops["outQ"], feed_dict={net.target_ops["input"]:states}), before_target)
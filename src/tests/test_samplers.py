@@ -0,0 +1,68 @@
+import numpy as np
+import data.database_ops as dbo
+import features.match_processing as mp
+from features.draftstate import DraftState
+from features.experience_replay import ExperienceBuffer
+from features.samplers import StratifiedSampler, patch_code
+
+PATH_TO_DB = "../data/competitiveMatchData.db"
+
+def load_experiences(match_ids):
+    matches = dbo.get_matches_by_id(match_ids, PATH_TO_DB)
+    return mp.process_matches(matches, DraftState.BLUE_TEAM, augment_data=False)
+
+def test_stratum_weights():
+    """
+    StratifiedSampler draws each stratum with its weight's share of every sample, and draws uniformly within a stratum,
+    including after the buffer has started overwriting old experiences.
+    """
+    np.random.seed(0)
+    sampler = StratifiedSampler("phase", weights=[4,3,2,1])
+    buf = ExperienceBuffer(300, sampler=sampler)
+    experiences = load_experiences(list(range(1,41)))
+    assert len(experiences["actions"]) > buf.buffer_size
+    buf.store(experiences, patch="8.13")
+
+    num_samples = 40000
+    sample = buf.sample(num_samples)
+    strata = sampler.get_strata(sample["steps"])
+    assert np.allclose(np.bincount(strata, minlength=4)/num_samples, [0.4,0.3,0.2,0.1], atol=0.01)
+
+    # Within a stratum every step is drawn in proportion to the number of experiences the buffer holds from it
+    held_strata = sampler.get_strata(buf.get_experiences()["steps"])
+    held_steps = buf.get_experiences()["steps"]
+    for stratum in range(4):
+        steps = np.unique(held_steps[held_strata == stratum])
+        held = np.array([np.count_nonzero(held_steps == step) for step in steps], dtype=float)
+        drawn = np.array([np.count_nonzero(sample["steps"] == step) for step in steps], dtype=float)
+        assert np.allclose(drawn/drawn.sum(), held/held.sum(), atol=0.02)
+
+def test_recency_decay():
+    """
+    Experiences from a patch k patches older than the newest patch in the buffer are weighted by recency_decay^k.
+    """
+    np.random.seed(1)
+    sampler = StratifiedSampler(None, recency_decay=0.5)
+    buf = ExperienceBuffer(2000, sampler=sampler)
+    experiences = load_experiences(list(range(1,11)))
+    for patch in ["8.12", "8.13", "8.14"]:
+        buf.store(experiences, patch=patch)
+    sample = buf.sample(40000)
+    counts = np.array([np.count_nonzero(sample["patches"] == patch_code(patch)) for patch in ["8.12", "8.13", "8.14"]], dtype=float)
+    assert np.allclose(counts/counts.sum(), np.array([1.,2.,4.])/7., atol=0.01)
+
+def test_sampler_is_bound_to_one_buffer():
+    """
+    A StratifiedSampler can only be used with the first buffer it samples for.
+    """
+    experiences = load_experiences([1])
+    sampler = StratifiedSampler()
+    first = ExperienceBuffer(100, sampler=sampler)
+    first.store(experiences)
+    second = ExperienceBuffer(100, sampler=sampler)
+    try:
+        second.store(experiences)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Sharing a StratifiedSampler between buffers should raise ValueError")
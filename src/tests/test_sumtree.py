@@ -0,0 +1,44 @@
+import numpy as np
+from data.champion_info import get_champion_ids
+from features.draftstate import DraftState
+from features.experience_replay import PrioritizedExperienceBuffer, SumTree
+
+def test_sumtree_find():
+    """
+    SumTree.find() locates the same leaves as a search over the cumulative sum of the leaf values.
+    """
+    rng = np.random.RandomState(0)
+    for capacity in [1, 5, 8, 37]:
+        tree = SumTree(capacity)
+        values = rng.rand(capacity)
+        tree.update(np.arange(capacity), values)
+        # Repeated leaves keep the last value given
+        tree.update([0, 0], [5., values[0]])
+        assert np.isclose(tree.total(), values.sum())
+        assert np.array_equal(tree.get(np.arange(capacity)), values)
+        queries = rng.rand(100)*values.sum()
+        assert np.array_equal(tree.find(queries), np.searchsorted(np.cumsum(values), queries, side="right"))
+
+def test_prioritized_sampling():
+    """
+    Experiences are sampled in proportion to their priorities, new experiences get the largest priority seen so far, and
+    importance sampling weights are inversely proportional to the sampling probabilities.
+    """
+    np.random.seed(0)
+    champ_ids = get_champion_ids()
+    state = DraftState(DraftState.BLUE_TEAM)
+    experiences = [(state, (cid, -1), 0., state.with_submission(cid, -1)) for cid in champ_ids[:4]]
+    buf = PrioritizedExperienceBuffer(8, alpha=1., beta=1., epsilon=0.)
+    buf.store(experiences)
+    td_errors = np.array([1., 2., 3., 4.])
+    buf.update_priorities(np.arange(4), td_errors)
+    assert buf.max_priority == 4.
+
+    num_samples = 20000
+    sample = buf.sample(num_samples)
+    frequencies = np.bincount(sample["rows"], minlength=4)/num_samples
+    assert np.allclose(frequencies, td_errors/td_errors.sum(), atol=0.01)
+    assert np.allclose(sample["weights"], td_errors.min()/td_errors[sample["rows"]])
+
+    buf.store(experiences[:1])
+    assert buf.tree.get([4])[0] == 4.
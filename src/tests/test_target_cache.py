@@ -0,0 +1,99 @@
+import numpy as np
+from data.champion_info import get_champion_ids
+from features.draftstate import DraftState
+from features.draftstatebatch import DraftStateBatch
+from models.qNetwork import Qnetwork
+from models.target_cache import TargetQCache
+from trainer import DDQNTrainer
+
+def make_keys(hashes):
+    return np.asarray(hashes, dtype=np.int64)[:,None]
+
+def test_lru_eviction():
+    """
+    Once full, the cache evicts the least recently used entry, where lookups count as uses.
+    """
+    cache = TargetQCache(3, 2)
+    hashes = np.array([1,2,3], dtype=np.uint64)
+    cache.insert(hashes, make_keys(hashes), np.arange(6, dtype=np.float32).reshape(3,2))
+    # Use state 1 so state 2 becomes the least recently used
+    (hits, values) = cache.lookup(hashes[:1], make_keys(hashes[:1]))
+    assert np.all(hits) and np.array_equal(values, [[0.,1.]])
+    new_hashes = np.array([4], dtype=np.uint64)
+    cache.insert(new_hashes, make_keys(new_hashes), np.array([[6.,7.]], dtype=np.float32))
+    assert len(cache) == 3
+    query = np.array([1,2,3,4], dtype=np.uint64)
+    (hits, values) = cache.lookup(query, make_keys(query))
+    assert np.array_equal(hits, [True, False, True, True])
+    assert np.array_equal(values, [[0.,1.],[4.,5.],[6.,7.]])
+
+def test_hit_rate():
+    """
+    Hits and misses are counted per looked up state.
+    """
+    cache = TargetQCache(4, 1)
+    hashes = np.array([5,6], dtype=np.uint64)
+    cache.insert(hashes, make_keys(hashes), np.zeros((2,1), dtype=np.float32))
+    query = np.array([5,6,7,8], dtype=np.uint64)
+    cache.lookup(query, make_keys(query))
+    cache.lookup(query[:1], make_keys(query[:1]))
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"]) == (3, 2)
+    assert np.isclose(cache.get_hit_rate(), 0.6)
+
+def test_hash_collision():
+    """
+    A state sharing its hash with a cached state but with a different key is a miss, not the cached state's Q vector.
+    """
+    cache = TargetQCache(4, 1)
+    hashes = np.array([9], dtype=np.uint64)
+    cache.insert(hashes, np.array([[1,2]]), np.array([[3.]], dtype=np.float32))
+    (hits, values) = cache.lookup(hashes, np.array([[1,3]]))
+    assert not np.any(hits) and len(values) == 0
+    assert cache.get_stats()["collisions"] == 1
+    (hits, values) = cache.lookup(hashes, np.array([[1,2]]))
+    assert np.all(hits) and np.array_equal(values, [[3.]])
+
+def make_end_states(num_states, rng):
+    champ_ids = get_champion_ids()
+    states = []
+    for n in range(num_states):
+        state = DraftState(n % 2)
+        for _ in range(n % 9):
+            (cid, pos) = state.format_action(rng.choice(np.flatnonzero(state.get_valid_actions())))
+            state.update(cid, pos)
+        states.append(state)
+    return DraftStateBatch.from_states(states)
+
+def test_cached_targets_and_invalidation():
+    """
+    Targets computed with cached target Q vectors match the uncached targets, and updating the target network empties the cache.
+    """
+    rng = np.random.RandomState(0)
+    state = DraftState(DraftState.BLUE_TEAM)
+    net = Qnetwork("test", "/tmp/test_target_cache", state.format_state().shape, state.num_actions, filter_sizes=(8,8))
+    trainer = DDQNTrainer(net, 1, [], [], 4, 64, target_cache_size=8)
+    net.sess.run(net.online_ops["init"])
+    trainer.update_target_network("target_init")
+    end_states = make_end_states(6, rng)
+    rewards = rng.randn(6).astype(np.float32)
+    next_states = trainer.format_next_states(end_states)
+    expected = trainer.compute_targets(next_states, rewards)
+
+    fused_ops = net.fused_ops
+    for hit_count in [0, 6]:
+        (misses, cache_feed) = trainer.cached_target_feed_dict(next_states)
+        assert len(misses) == 6-hit_count
+        feed_dict = trainer.target_feed_dict(next_states, rewards)
+        feed_dict.update(cache_feed)
+        (targets, target_Q) = net.sess.run([fused_ops["target"], fused_ops["target_next_Q"]], feed_dict=feed_dict)
+        assert np.allclose(targets, expected, atol=1e-5)
+        (_, _, _, hashes, keys) = next_states
+        trainer.target_cache.insert(hashes[misses], keys[misses], target_Q)
+    assert len(trainer.target_cache) == 6
+
+    trainer.update_target_network("target_update")
+    assert len(trainer.target_cache) == 0
+    assert trainer.target_cache.get_stats()["invalidations"] == 2
+    (misses, _) = trainer.cached_target_feed_dict(next_states)
+    assert len(misses) == 6
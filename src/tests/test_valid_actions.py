@@ -0,0 +1,20 @@
+import numpy as np
+from data.champion_info import get_champion_ids
+from features.draftstate import DraftState
+
+def test_get_valid_actions_is_a_copy():
+    """
+    The mask returned by get_valid_actions() is not changed by later submissions and can be modified by the caller,
+    while the valid_actions view tracks the current state.
+    """
+    champ_ids = get_champion_ids()
+    state = DraftState(DraftState.BLUE_TEAM)
+    mask = state.get_valid_actions()
+    view = state.valid_actions
+    before = mask.copy()
+    state.update(champ_ids[0], -1)
+    assert np.array_equal(mask, before)
+    assert not np.array_equal(view, before)
+    assert np.array_equal(view, state.get_valid_actions())
+    mask[:] = False
+    assert np.any(state.get_valid_actions())
@@ -1,4 +1,19 @@
-from features.draftstate import DraftState
+import importlib
+import os
 
 def run():
-    print("HELLO")
+    """
+    Runs each test_* function of the test_*.py modules in this directory.
+    """
+    test_dir = os.path.dirname(os.path.abspath(__file__))
+    num_tests = 0
+    for filename in sorted(os.listdir(test_dir)):
+        if(not filename.startswith("test_") or not filename.endswith(".py")):
+            continue
+        module = importlib.import_module("tests.{}".format(filename[:-3]))
+        for name in sorted(dir(module)):
+            test = getattr(module, name)
+            if(name.startswith("test_") and callable(test)):
+                test()
+                num_tests += 1
+    print("All {} tests passed".format(num_tests))
@@ -1,20 +1,79 @@
 import time
 import random
-from copy import deepcopy
 
 import tensorflow as tf
-import pandas as pd
 import numpy as np
 
 import data.match_pool as pool
 
 from features.draftstate import DraftState
+from features.draftstatebatch import DraftStateBatch
 import features.experience_replay as er
 import features.match_processing as mp
+import features.experience_pipeline as pipeline
+from features.prefetcher import Prefetcher
+from features.samplers import patch_code
+import features.metrics as metrics
 from features.rewards import get_reward
+from models.target_cache import TargetQCache
 
 class BaseTrainer():
-    pass
+    experience_cache = None
+    num_workers = 1
+    prefetch_depth = 0
+    _prefetcher = None
+    prefetch_stats = None
+
+    def start_prefetching(self, source):
+        """
+        Starts preparing batches from source on a background thread, holding up to prefetch_depth batches ready to feed.
+        Returns the Prefetcher, or None if prefetching is disabled (prefetch_depth = 0).
+        """
+        if(self.prefetch_depth > 0):
+            self._prefetcher = Prefetcher(source, self.prefetch_depth)
+        return self._prefetcher
+
+    def stop_prefetching(self):
+        """
+        Stops the current Prefetcher (if any) and reports how often training stalled waiting for a batch.
+        """
+        if(self._prefetcher is None):
+            return None
+        self._prefetcher.close()
+        self.prefetch_stats = self._prefetcher.get_stats()
+        self._prefetcher = None
+        print("  prefetch: {stalls}/{batches} batches stalled ({stall_rate:.2%}), {stall_time:.2f}s waiting".format(**self.prefetch_stats))
+        return self.prefetch_stats
+
+    def process_matches(self, matches, teams=None, augment=True):
+        """
+        Processes matches into arrays of experiences (see match_processing.process_matches()) with each match given a uniformly sampled
+        augmentation. If the trainer has an experience cache the experiences are read from (and added to) the cache instead, with each
+        augmentation drawn from a fixed set of augmentations for the match (see ExperienceCache.sample_augment_ids()). Seeding np.random
+        makes the sampled augmentations, and so the cache entries used, reproducible between runs. Matches are processed by a pool of
+        num_workers processes if num_workers > 1.
+        Args:
+            matches (list(dict)): list of matches to process
+            teams (int or list(int)): team perspective to process each match from. If None each match is processed from both perspectives.
+            augment (bool): flag to augment the matches. Validation uses the unaugmented matches (augment_id = 0).
+        Returns:
+            experiences (dict): dictionary of experience arrays
+        """
+        if teams is None:
+            # Keep both perspectives of a match next to each other so they are processed by the same worker
+            teams = np.tile(self.teams, len(matches))
+            matches = [match for match in matches for team in self.teams]
+        if not augment:
+            augment_ids = np.zeros(len(matches), dtype=np.int64)
+        elif self.experience_cache is not None:
+            augment_ids = self.experience_cache.sample_augment_ids(matches)
+        else:
+            augment_ids = np.random.randint(mp.DEFAULT_DRAFT.num_augmentations, size=len(matches))
+        if self.experience_cache is not None:
+            return self.experience_cache.get(matches, teams, augment_ids, num_workers=self.num_workers)
+        if self.num_workers > 1:
+            return mp.process_matches_parallel(matches, teams, augment_ids=augment_ids, num_workers=self.num_workers)
+        return mp.process_matches(matches, teams, augment_ids=augment_ids)
 
 class DDQNTrainer(BaseTrainer):
     """
@@ -27,8 +86,19 @@ class DDQNTrainer(BaseTrainer):
         batch_size (int): size of each training set sampled from the replay buffer which will be used to update Qnet at a time
         buffer_size (int): size of replay buffer used
         load_path (string): path to reload existing model
+        experience_cache (ExperienceCache): optional on-disk cache of processed experiences
+        num_workers (int): number of processes used to process matches into experiences
+        prioritized_replay (bool): flag to sample from the replay buffer in proportion to each experience's TD error rather than uniformly
+        replay_path (string): path to a memory-mapped replay buffer file. If given the replay buffer persists between runs and
+            can be shared with other processes (see experience_replay.MappedExperienceBuffer)
+        prefetch_depth (int): number of minibatches sampled and formatted ahead of time on a background thread. 0 disables prefetching.
+        compressed_replay (bool): flag to store replay experiences as compressed submission sequences, allowing roughly 3x as many experiences in the same memory
+        sampler (UniformSampler): sampler used to draw minibatches from replay, eg. samplers.StratifiedSampler to stratify by draft phase
+            and favour recent patches. Not supported with prioritized replay, and stateful samplers are not supported with replay_path.
+            A StratifiedSampler must not be shared with another trainer.
+        target_cache_size (int): number of target network Q vectors cached between target network updates (see TargetQCache). 0 disables caching.
     """
-    def __init__(self, q_network, n_epoch, training_data, validation_data, batch_size, buffer_size, load_path=None):
+    def __init__(self, q_network, n_epoch, training_data, validation_data, batch_size, buffer_size, load_path=None, experience_cache=None, num_workers=1, prioritized_replay=False, replay_path=None, prefetch_depth=0, compressed_replay=False, sampler=None, target_cache_size=0):
         num_episodes = len(training_data)
         print("***")
         print("Beginning training..")
@@ -36,6 +106,9 @@ class DDQNTrainer(BaseTrainer):
         print("  num_episodes: {}".format(num_episodes))
         print("  batch_size: {}".format(batch_size))
         print("  buffer_size: {}".format(buffer_size))
+        print("  prioritized_replay: {}".format(prioritized_replay))
+        print("  compressed_replay: {}".format(compressed_replay))
+        print("  target_cache_size: {}".format(target_cache_size))
         print("***")
 
         self.ddq_net = q_network
@@ -45,8 +118,23 @@ class DDQNTrainer(BaseTrainer):
         self.batch_size = batch_size
         self.buffer_size = buffer_size
         self.load_path = load_path
-
-        self.replay = er.ExperienceBuffer(self.buffer_size)
+        self.experience_cache = experience_cache
+        self.num_workers = num_workers
+        self.prefetch_depth = prefetch_depth
+
+        self.prioritized_replay = prioritized_replay
+        if(self.prioritized_replay and replay_path):
+            raise ValueError("Prioritized replay is not supported with a memory-mapped replay buffer")
+        if(self.prioritized_replay and sampler):
+            raise ValueError("Prioritized replay is not supported with a replay sampler")
+        if(self.prioritized_replay):
+            self.replay = er.PrioritizedExperienceBuffer(self.buffer_size, compressed=compressed_replay)
+        elif(replay_path):
+            self.replay = er.MappedExperienceBuffer(replay_path, self.buffer_size, compressed=compressed_replay, sampler=sampler)
+            print("Opened replay buffer {} holding {} experiences".format(replay_path, self.replay.get_buffer_size()))
+        else:
+            self.replay = er.ExperienceBuffer(self.buffer_size, compressed=compressed_replay, sampler=sampler)
+        self.target_cache = TargetQCache(target_cache_size, self.ddq_net._output_shape) if target_cache_size else None
         self.step_count = 0
         self.epoch_count = 0
 
@@ -76,6 +164,9 @@ class DDQNTrainer(BaseTrainer):
         self.epsilon = 0.5 # Initial probability of letting the learner submit its own action
         self.eps_decay_rate = 1./(25*20*len(self.training_data)) # Rate at which epsilon decays per submission
 
+        # Importance sampling correction used with prioritized replay is annealed from initial_beta to 1 by the final epoch
+        initial_beta = self.replay.beta if self.prioritized_replay else None
+
         lr_decay_freq = 10 # Decay learning rate after a set number of epochs
         min_learning_rate = 1.e-8 # Minimum learning rate allowed to decay to
 
@@ -90,7 +181,7 @@ class DDQNTrainer(BaseTrainer):
             print("\nCheckpoint loaded from {}".format(self.load_path))
 
         # Initialize target network
-        self.ddq_net.sess.run(self.ddq_net.target_ops["target_init"])
+        self.update_target_network("target_init")
 
         for self.epoch_count in range(self.n_epoch):
             t0 = time.time()
@@ -100,8 +191,13 @@ class DDQNTrainer(BaseTrainer):
                 learning_rate = 0.5*learning_rate
                 self.ddq_net.sess.run(self.ddq_net.online_ops["learning_rate"].assign(learning_rate))
 
+            if(self.prioritized_replay):
+                self.replay.beta = initial_beta + (1.-initial_beta)*self.epoch_count/max(1, self.n_epoch-1)
+
             # Run single epoch of training
             loss, train_acc, val_acc = self.train_epoch()
+            if(isinstance(self.replay, er.MappedExperienceBuffer)):
+                self.replay.flush()
             dt = time.time()-t0
 
             print(" Finished epoch {:2}/{}: lr: {:.4e}, dt {:.2f}, loss {:.6f}, train {:.6f}, val {:.6f}".format(self.epoch_count+1, self.n_epoch, learning_rate, dt, loss, train_acc, val_acc), flush=True)
@@ -142,9 +238,10 @@ class DDQNTrainer(BaseTrainer):
 
         shuffled_matches = random.sample(data, len(data))
         for match in shuffled_matches:
+            # Process match into individual experiences for both teams in a single pass
+            match_experiences = mp.process_match_both_sides(match)
             for team in self.teams:
-                # Process match into individual experiences
-                experiences = mp.process_match(match, team)
+                experiences = match_experiences[team]
                 for pick_id, experience in enumerate(experiences):
                     # Some experiences include NULL submissions (usually missing bans)
                     # The learner isn't allowed to submit NULL picks so skip adding these
@@ -155,13 +252,13 @@ class DDQNTrainer(BaseTrainer):
                         null_actions += 1
                         continue
                     # Store original experience
-                    self.replay.store([experience])
+                    self.replay.store([experience], patch=match["patch"])
                     self.step_count += 1
 
                     # Give model feedback on current estimations
                     if(self.step_count > self.observations):
                         # Let the network predict the next action
-                        feed_dict = {self.ddq_net.online_ops["input"]:[state.format_state()],
+                        feed_dict = {self.ddq_net.online_ops["input"]:DraftStateBatch.from_states([state]).format_inputs(self.ddq_net.input_mode),
                                      self.ddq_net.online_ops["valid_actions"]:[state.get_valid_actions()]}
                         q_vals = self.ddq_net.sess.run(self.ddq_net.online_ops["valid_outQ"], feed_dict=feed_dict)
                         sorted_actions = q_vals[0,:].argsort()[::-1]
@@ -173,15 +270,14 @@ class DDQNTrainer(BaseTrainer):
                             # Use model's top prediction
                             pred_act = [sorted_actions[0]]
 
-                        for action in pred_act:
-                            (cid,pos) = state.format_action(action)
+                        (pred_cids, pred_positions) = state.decode_actions(pred_act)
+                        for (cid,pos) in zip(pred_cids.tolist(), pred_positions.tolist()):
                             if((cid,pos)!=actual):
-                                pred_state = deepcopy(state)
-                                pred_state.update(cid,pos)
+                                pred_state = state.with_submission(cid,pos)
                                 r = get_reward(pred_state, blank_match, (cid,pos), actual)
                                 new_experience = (state, (cid,pos), r, pred_state)
 
-                                self.replay.store([new_experience])
+                                self.replay.store([new_experience], patch=match["patch"])
                                 learner_submitted_actions += 1
 
                     if(self.epsilon > 0.1):
@@ -190,64 +286,162 @@ class DDQNTrainer(BaseTrainer):
 
                     # Use minibatch sample to update online network
                     if(self.step_count > self.pre_training_steps):
+                        if(self.prefetch_depth and self._prefetcher is None):
+                            self.start_prefetching(iter(self.sample_batch, None))
                         self.train_step()
 
                     if(self.step_count % self.target_update_frequency == 0):
                         # After the online network has been updated, update target network
-                        _ = self.ddq_net.sess.run(self.ddq_net.target_ops["target_update"])
+                        self.update_target_network("target_update")
+
+        self.stop_prefetching()
+        if(self.target_cache is not None):
+            stats = self.target_cache.get_stats()
+            print("  target Q cache: {} hits, {} misses (hit rate {:.3f}), {} collisions, {} invalidations".format(stats["hits"], stats["misses"], stats["hit_rate"], stats["collisions"], stats["invalidations"]))
 
         # Get training loss, training_acc, and val_acc to return
         loss, train_acc = self.validate_model(self.training_data)
         _, val_acc = self.validate_model(self.validation_data)
         return (loss, train_acc, val_acc)
 
-    def train_step(self):
+    def sample_batch(self):
         """
-        Training logic for a single mini-batch update sampled from replay
+        Samples a training minibatch from replay and formats it for the network. This is run on the prefetching thread when prefetching is enabled.
+        Returns:
+            batch (dict): dictionary holding the network inputs, submitted actions, rewards and formatted next states (see format_next_states())
+                of each experience, along with its replay row and importance sampling weight when using prioritized replay
         """
-        # Sample training batch from replay
         training_batch = self.replay.sample(self.batch_size)
+        start_states = DraftStateBatch.from_encodings(training_batch["teams"], training_batch["states"], training_batch["steps"])
+        end_states = DraftStateBatch.from_encodings(training_batch["teams"], training_batch["next_states"], training_batch["next_steps"])
+        batch = {"inputs":start_states.format_inputs(self.ddq_net.input_mode),
+                 "actions":training_batch["actions"],
+                 "rewards":training_batch["rewards"],
+                 "next_states":self.format_next_states(end_states)}
+        if(self.prioritized_replay):
+            batch["rows"] = training_batch["rows"]
+            batch["weights"] = training_batch["weights"]
+        return batch
 
-        # Calculate target Q values for each example:
+    def train_step(self):
+        """
+        Training logic for a single mini-batch update sampled from replay
+        """
+        # Sample training batch from replay (or take the next prefetched batch)
+        batch = self._prefetcher.get() if self._prefetcher else self.sample_batch()
+        rewards = batch["rewards"]
+        if(self.dampen_states):
+            # To dampen states (usually done after major patches or when the meta shifts)
+            # we replace winning rewards with 0.
+            rewards = np.zeros_like(rewards)
+
+        # Target Q values for each example are calculated as:
         # For non-terminal states, targetQ is estimated according to
         #   targetQ = r + gamma*Q'(s',max_a Q(s',a))
         # where Q' denotes the target network.
         # For terminating states the target is computed as
         #   targetQ = r
-        updates = []
-        for exp in training_batch:
-            start,_,reward,end = exp
-            if(self.dampen_states):
-                # To dampen states (usually done after major patches or when the meta shifts)
-                # we replace winning rewards with 0.
-                reward = 0.
-            state_code = end.evaluate()
-            if(state_code==DraftState.DRAFT_COMPLETE or state_code in DraftState.invalid_states):
-                # Action moves to terminal state
-                updates.append(reward)
-            else:
-                # Follwing double DQN paper (https://arxiv.org/abs/1509.06461).
-                #  Action is chosen by online network, but the target network is used to evaluate this policy.
-                # Each row in predicted_Q gives estimated Q(s',a) values for all possible actions for the input state s'.
-                feed_dict = {self.ddq_net.online_ops["input"]:[end.format_state()],
-                             self.ddq_net.online_ops["valid_actions"]:[end.get_valid_actions()]}
-                predicted_action = self.ddq_net.sess.run(self.ddq_net.online_ops["prediction"], feed_dict=feed_dict)[0]
-
-                feed_dict = {self.ddq_net.target_ops["input"]:[end.format_state()]}
-                predicted_Q = self.ddq_net.sess.run(self.ddq_net.target_ops["outQ"], feed_dict=feed_dict)
-
-                updates.append(reward + self.ddq_net.discount_factor*predicted_Q[0,predicted_action])
-
-        # Update online net using target Q
-        # Experience replay stores action = (champion_id, position) pairs
-        # these need to be converted into the corresponding index of the input vector to the Qnet
-        actions = np.array([start.get_action(*exp[1]) for exp in training_batch])
-        targetQ = np.array(updates)
-        feed_dict = {self.ddq_net.online_ops["input"]:np.stack([exp[0].format_state() for exp in training_batch],axis=0),
-                     self.ddq_net.online_ops["actions"]:actions,
-                     self.ddq_net.online_ops["target"]:targetQ,
-                     self.ddq_net.online_ops["dropout_keep_prob"]:0.5}
-        _ = self.ddq_net.sess.run(self.ddq_net.online_ops["update"],feed_dict=feed_dict)
+        # The targets are computed and used to update the online net in a single session run (see Qnetwork.create_double_q_target_ops())
+        feed_dict = self.target_feed_dict(batch["next_states"], rewards)
+        feed_dict.update({self.ddq_net.online_ops["input"]:batch["inputs"],
+                          self.ddq_net.online_ops["actions"]:batch["actions"],
+                          self.ddq_net.online_ops["dropout_keep_prob"]:0.5})
+        fetches = [self.ddq_net.fused_ops["update"]]
+        if(self.prioritized_replay):
+            # Weight the loss by importance sampling weights and update priorities with the new TD errors
+            feed_dict[self.ddq_net.online_ops["weights"]] = batch["weights"]
+            fetches.append(self.ddq_net.fused_ops["td_error"])
+        if(self.target_cache is not None):
+            # Target Q vectors of previously seen next states are fed from the cache, the rest are computed and added to it
+            (misses, cache_feed) = self.cached_target_feed_dict(batch["next_states"])
+            feed_dict.update(cache_feed)
+            fetches.append(self.ddq_net.fused_ops["target_next_Q"])
+        results = self.ddq_net.sess.run(fetches,feed_dict=feed_dict)
+        if(self.target_cache is not None):
+            (_, _, _, hashes, keys) = batch["next_states"]
+            self.target_cache.insert(hashes[misses], keys[misses], results[-1])
+        if(self.prioritized_replay):
+            self.replay.update_priorities(batch["rows"], results[1])
+
+    def format_next_states(self, end_states):
+        """
+        Formats the states reached by a batch of experiences for target evaluation. Actions moving to terminal states have target = reward,
+        so only the non-terminal states need to be evaluated.
+        Args:
+            end_states (DraftStateBatch): states reached after taking each action
+        Returns:
+            next_states (tuple): (non_terminal, inputs, valid_actions, hashes, keys) giving the index of each non-terminal state in the batch
+                along with its network inputs, valid action mask, hash and sparse encoding (used to verify target cache hits, None without a target cache)
+        """
+        state_codes = end_states.evaluate()
+        terminal = (state_codes==DraftState.DRAFT_COMPLETE) | np.isin(state_codes, DraftState.invalid_states)
+        non_terminal = np.nonzero(~terminal)[0]
+        next_states = end_states.take(non_terminal)
+        inputs = next_states.format_inputs(self.ddq_net.input_mode)
+        keys = None
+        if(self.target_cache is not None):
+            keys = inputs if self.ddq_net.input_mode == "sparse" else next_states.format_sparse_states()
+        return (non_terminal, inputs, next_states.valid_action_masks(), next_states.hashes, keys)
+
+    def compute_targets(self, next_states, rewards):
+        """
+        Computes target Q values for a batch of experiences.
+        Args:
+            next_states (tuple): formatted states reached after taking each action (see format_next_states())
+            rewards (numpy array): reward obtained for each action
+        Returns:
+            targets (numpy array): target Q value for each experience
+        """
+        if(len(next_states[0]) == 0):
+            return np.array(rewards, dtype=float)
+        return self.ddq_net.sess.run(self.ddq_net.fused_ops["target"], feed_dict=self.target_feed_dict(next_states, rewards))
+
+    def target_feed_dict(self, next_states, rewards):
+        """
+        Returns a feed dict for the fused double DQN target ops (see Qnetwork.create_double_q_target_ops()).
+        Follwing double DQN paper (https://arxiv.org/abs/1509.06461) the action from each next state is chosen by the online network,
+        but the target network is used to evaluate this policy.
+        Args:
+            next_states (tuple): formatted states reached after taking each action (see format_next_states())
+            rewards (numpy array): reward obtained for each action
+        Returns:
+            feed_dict (dict)
+        """
+        (non_terminal, next_inputs, next_valid_actions, _, _) = next_states
+        return {self.ddq_net.fused_ops["rewards"]:rewards,
+                self.ddq_net.fused_ops["next_input"]:next_inputs,
+                self.ddq_net.fused_ops["next_valid_actions"]:next_valid_actions,
+                self.ddq_net.fused_ops["non_terminal"]:non_terminal}
+
+    def cached_target_feed_dict(self, next_states):
+        """
+        Looks up the target network Q vectors of next_states in the target cache and returns the additional feeds for the fused target ops
+        so that only the states missing from the cache are evaluated by the target network.
+        Args:
+            next_states (tuple): formatted states reached after taking each action (see format_next_states())
+        Returns:
+            (misses, feed_dict) (tuple): misses gives the index (into next_states) of each state fed to "target_next_input",
+                in the order their Q vectors are returned by "target_next_Q"
+        """
+        (_, next_inputs, _, hashes, keys) = next_states
+        (hits, cached_Q) = self.target_cache.lookup(hashes, keys)
+        misses = np.nonzero(~hits)[0]
+        # Q vectors are gathered from the computed rows followed by the cached rows
+        order = np.empty(len(hashes), dtype=np.int32)
+        order[misses] = np.arange(len(misses))
+        order[hits] = len(misses)+np.arange(len(cached_Q))
+        feed_dict = {self.ddq_net.fused_ops["target_next_input"]:next_inputs[misses],
+                     self.ddq_net.fused_ops["cached_target_Q"]:cached_Q,
+                     self.ddq_net.fused_ops["target_order"]:order}
+        return (misses, feed_dict)
+
+    def update_target_network(self, op_name="target_update"):
+        """
+        Runs the given target network update op (either "target_update" or "target_init") and invalidates the target Q cache.
+        """
+        _ = self.ddq_net.sess.run(self.ddq_net.target_ops[op_name])
+        if(self.target_cache is not None):
+            self.target_cache.invalidate()
 
     def validate_model(self, data):
         """
@@ -257,70 +451,52 @@ class DDQNTrainer(BaseTrainer):
         Returns:
             stats (tuple(float)): list of statistical measures of performance. stats = (loss,acc)
         """
-        buf = []
-        for match in data:
-            # Loss is only computed for winning side of drafts
-            team = DraftState.RED_TEAM if match["winner"]==1 else DraftState.BLUE_TEAM
-            # Process match into individual experiences
-            experiences = mp.process_match(match, team)
-            for exp in experiences:
-                _,act,_,_ = exp
-                (cid,pos) = act
-                if cid is None:
-                    # Skip null actions such as missing/skipped bans
-                    continue
-                buf.append(exp)
-
-        n_exp = len(buf)
-        targets = []
-        for exp in buf:
-            start,_,reward,end = exp
-            state_code = end.evaluate()
-            if(state_code==DraftState.DRAFT_COMPLETE or state_code in DraftState.invalid_states):
-                # Action moves to terminal state
-                targets.append(reward)
-            else:
-                feed_dict = {self.ddq_net.online_ops["input"]:[end.format_state()],
-                             self.ddq_net.online_ops["valid_actions"]:[end.get_valid_actions()]}
-                predicted_action = self.ddq_net.sess.run(self.ddq_net.online_ops["prediction"], feed_dict=feed_dict)[0]
-
-                feed_dict = {self.ddq_net.target_ops["input"]:[end.format_state()]}
-                predicted_Q = self.ddq_net.sess.run(self.ddq_net.target_ops["outQ"], feed_dict=feed_dict)
-
-                targets.append(reward + self.ddq_net.discount_factor*predicted_Q[0,predicted_action])
-
-        actions = np.array([start.get_action(*exp[1]) for exp in buf])
-        targets = np.array(targets)
-
-        feed_dict = {self.ddq_net.online_ops["input"]:np.stack([exp[0].format_state() for exp in buf],axis=0),
-                     self.ddq_net.online_ops["actions"]:actions,
-                     self.ddq_net.online_ops["target"]:targets,
-                     self.ddq_net.online_ops["valid_actions"]:np.stack([exp[0].get_valid_actions() for exp in buf],axis=0)}
-
-        loss, pred_q = self.ddq_net.sess.run([self.ddq_net.online_ops["loss"], self.ddq_net.online_ops["valid_outQ"]],feed_dict=feed_dict)
-
-        accurate_predictions = 0
+        # Loss is only computed for winning side of drafts
+        teams = [DraftState.RED_TEAM if match["winner"]==1 else DraftState.BLUE_TEAM for match in data]
+        # Process matches into arrays of experiences (null actions such as missing/skipped bans are skipped)
+        experiences = self.process_matches(data, teams, augment=False)
+        start_states = DraftStateBatch.from_encodings(experiences["teams"], experiences["states"], experiences["steps"])
+        end_states = DraftStateBatch.from_encodings(experiences["teams"], experiences["next_states"], experiences["next_steps"])
+        actions = experiences["actions"]
+
+        # Targets, loss and Q values are all computed in a single session run
+        feed_dict = self.target_feed_dict(self.format_next_states(end_states), experiences["rewards"])
+        feed_dict.update({self.ddq_net.online_ops["input"]:start_states.format_inputs(self.ddq_net.input_mode),
+                          self.ddq_net.online_ops["actions"]:actions,
+                          self.ddq_net.online_ops["valid_actions"]:experiences["valid_actions"]})
+
+        loss, pred_q = self.ddq_net.sess.run([self.ddq_net.fused_ops["loss"], self.ddq_net.online_ops["valid_outQ"]],feed_dict=feed_dict)
+
         rank_tolerance = 5
-        for n in range(n_exp):
-            state,act,_,_ = buf[n]
-            submitted_action_id = state.get_action(*act)
-
-            data = [(a,pred_q[n,a]) for a in range(pred_q.shape[1])]
-            df = pd.DataFrame(data, columns=['act_id','Q'])
-            df.sort_values('Q',ascending=False,inplace=True)
-            df.reset_index(drop=True,inplace=True)
-            df['rank'] = df.index
-            submitted_row = df[df['act_id']==submitted_action_id]
-            rank = submitted_row['rank'].iloc[0]
-            if rank < rank_tolerance:
-                accurate_predictions += 1
-
-        accuracy = accurate_predictions/n_exp
+        accuracy = metrics.top_k_accuracy(metrics.action_ranks(pred_q, actions), rank_tolerance)
         return (loss, accuracy)
 
 class SoftmaxTrainer(BaseTrainer):
-    def __init__(self, network, n_epoch, training_data, validation_data, batch_size, load_path=None):
-        num_episodes = len(training_data)
+    """
+    Trainer class for softmax (supervised) networks.
+    Args:
+        network (SoftmaxNetwork): network to be trained
+        n_epochs (int): number of times to iterate through given data
+        training_data (list(match) or function): list of matches to be trained on. If shuffle_window is set this may instead be a function
+            returning a fresh iterable of matches each time it is called (eg. lambda: dbo.iter_matches_by_id(ids, path_to_db))
+        validation_data (list(match)): list of matches to validate model against
+        batch_size (int): size of each training minibatch
+        load_path (string): path to reload existing model
+        experience_cache (ExperienceCache): optional on-disk cache of processed experiences
+        num_workers (int): number of processes used to process matches into experiences
+        shuffle_window (int): if set, training experiences are streamed through the pipeline in features/experience_pipeline.py
+            (shuffled within a window of this many experiences) rather than held in a buffer, so memory use does not grow with the training set
+        prefetch_depth (int): number of minibatches formatted ahead of time on a background thread. 0 disables prefetching.
+        sampler (UniformSampler): sampler used to draw minibatches from the training buffer, eg. samplers.StratifiedSampler to stratify by
+            draft phase and favour recent patches. Not used when streaming. A StratifiedSampler must not be shared with another trainer.
+    """
+    # Approximate number of experiences produced by a single match (both perspectives)
+    EXPERIENCES_PER_MATCH = 20
+    # Number of experiences evaluated at a time when computing streamed training statistics
+    EVAL_BATCH_SIZE = 1024
+
+    def __init__(self, network, n_epoch, training_data, validation_data, batch_size, load_path=None, experience_cache=None, num_workers=1, shuffle_window=None, prefetch_depth=0, sampler=None):
+        num_episodes = "streamed" if callable(training_data) else len(training_data)
         print("***")
         print("Beginning training..")
         print("  train_epochs: {}".format(n_epoch))
@@ -334,40 +510,58 @@ class SoftmaxTrainer(BaseTrainer):
         self.validation_data = validation_data
         self.batch_size = batch_size
         self.load_path = load_path
+        self.experience_cache = experience_cache
+        self.num_workers = num_workers
+        self.shuffle_window = shuffle_window
+        self.prefetch_depth = prefetch_depth
 
         self.step_count = 0
         self.epoch_count = 0
 
         self.teams = [DraftState.BLUE_TEAM, DraftState.RED_TEAM]
 
-        self._buffer = er.ExperienceBuffer(max_buffer_size=20*len(training_data))
-        self._val_buffer = er.ExperienceBuffer(max_buffer_size=20*len(validation_data))
+        self._buffer = None
+        if not self.shuffle_window:
+            self._buffer = er.ExperienceBuffer(max_buffer_size=SoftmaxTrainer.EXPERIENCES_PER_MATCH*len(training_data), sampler=sampler)
+            self.fill_buffer(training_data, self._buffer)
+        self._val_buffer = er.ExperienceBuffer(max_buffer_size=SoftmaxTrainer.EXPERIENCES_PER_MATCH*len(validation_data))
+        self.fill_buffer(validation_data, self._val_buffer, augment=False)
 
-        self.fill_buffer(training_data, self._buffer)
-        self.fill_buffer(validation_data, self._val_buffer)
-
-    def fill_buffer(self, data, buf):
-        for match in data:
-            for team in self.teams:
-                experiences = mp.process_match(match, team)
-                # remove null actions (usually missing bans)
-                for exp in experiences:
-                    _,act,_,_ = exp
-                    cid,pos = act
-                    if(cid):
-                        buf.store([exp])
+    def fill_buffer(self, data, buf, augment=True):
+        # null actions (usually missing bans) are removed by process_matches
+        experiences = self.process_matches(data, augment=augment)
+        patches = {match["id"]:patch_code(match["patch"]) for match in data}
+        experiences["patches"] = np.array([patches[match_id] for match_id in experiences["match_ids"].tolist()], dtype=np.int16)
+        buf.store(experiences)
 
     def sample_buffer(self, buf, n_samples):
-        experiences = buf.sample(n_samples)
-        states = []
-        actions = []
-        valid_actions = []
-        for (state, action, _, _) in experiences:
-            states.append(state.format_state())
-            valid_actions.append(state.get_valid_actions())
-            actions.append(state.get_action(*action))
+        return self.format_batch(buf.sample(n_samples))
+
+    def format_batch(self, experiences):
+        """
+        Formats a dictionary of experience arrays (see match_processing.process_matches()) into (states, actions, valid_actions) network inputs.
+        Valid actions are rebuilt from the state encodings if they are not included (eg. for experiences sampled from an ExperienceBuffer).
+        """
+        batch = DraftStateBatch.from_encodings(experiences["teams"], experiences["states"], experiences["steps"])
+        valid_actions = experiences["valid_actions"] if "valid_actions" in experiences else batch.valid_action_masks()
+        return (batch.format_inputs(self.model.input_mode), experiences["actions"], valid_actions)
+
+    def iter_training_matches(self):
+        """
+        Returns an iterable over the training matches in shuffled order. Streamed training data is shuffled within a window of matches.
+        """
+        if callable(self.training_data):
+            window = max(1, self.shuffle_window // SoftmaxTrainer.EXPERIENCES_PER_MATCH)
+            return pipeline.shuffle_window(self.training_data(), window)
+        return random.sample(self.training_data, len(self.training_data))
 
-        return (states, actions, valid_actions)
+    def iter_training_batches(self):
+        """
+        Streams shuffled minibatches of training experiences through the experience pipeline.
+        """
+        experiences = pipeline.iter_experiences(self.iter_training_matches(), num_workers=self.num_workers)
+        experiences = pipeline.shuffle_experiences(experiences, self.shuffle_window)
+        return pipeline.iter_batches(experiences, self.batch_size, drop_remainder=True)
 
     def train(self):
         summaries = {}
@@ -413,50 +607,66 @@ class SoftmaxTrainer(BaseTrainer):
         return summaries
 
     def train_epoch(self):
-        n_iter = self._buffer.buffer_size // self.batch_size
-
-        for it in range(n_iter):
-            self.train_step()
-
-        loss, train_acc = self.validate_model(self._buffer)
+        if self.shuffle_window:
+            batches = map(self.format_batch, self.iter_training_batches())
+        else:
+            n_iter = self._buffer.get_buffer_size() // self.batch_size
+            batches = (self.sample_buffer(self._buffer, self.batch_size) for it in range(n_iter))
+        batches = self.start_prefetching(batches) or batches
+        for inputs in batches:
+            self.train_step(inputs)
+        self.stop_prefetching()
+
+        if self.shuffle_window:
+            loss, train_acc = self.validate_stream(self.training_data() if callable(self.training_data) else self.training_data)
+        else:
+            loss, train_acc = self.validate_model(self._buffer)
         _, val_acc = self.validate_model(self._val_buffer)
 
         return (loss, train_acc, val_acc)
 
-    def train_step(self):
-        states, actions, valid_actions = self.sample_buffer(self._buffer, self.batch_size)
+    def train_step(self, inputs=None):
+        """
+        Updates the model with a single minibatch, either the given (states, actions, valid_actions) inputs (see format_batch()) or a sample from the training buffer.
+        """
+        if inputs is None:
+            inputs = self.sample_buffer(self._buffer, self.batch_size)
+        (states, actions, valid_actions) = inputs
 
-        feed_dict = {self.model.ops_dict["input"]:np.stack(states, axis=0),
-                     self.model.ops_dict["valid_actions"]:np.stack(valid_actions, axis=0),
+        feed_dict = {self.model.ops_dict["input"]:states,
+                     self.model.ops_dict["valid_actions"]:valid_actions,
                      self.model.ops_dict["actions"]:actions,
                      self.model.ops_dict["dropout_keep_prob"]:0.5}
         _  = self.model.sess.run(self.model.ops_dict["update"], feed_dict=feed_dict)
 
+    def validate_stream(self, matches):
+        """
+        Computes loss and accuracy over a stream of matches, evaluating EVAL_BATCH_SIZE experiences at a time so that
+        the full set of experiences is never held in memory.
+        """
+        total_loss = 0.
+        total_accurate = 0.
+        count = 0
+        for batch in pipeline.iter_batches(pipeline.iter_experiences(matches, num_workers=self.num_workers), SoftmaxTrainer.EVAL_BATCH_SIZE):
+            n = pipeline.num_experiences(batch)
+            loss, accuracy = self.evaluate(*self.format_batch(batch))
+            total_loss += n*loss
+            total_accurate += n*accuracy
+            count += n
+        return (total_loss/count, total_accurate/count)
+
     def validate_model(self, buf):
-        states, actions, valid_actions = self.sample_buffer(buf, buf.get_buffer_size())
+        return self.evaluate(*self.format_batch(buf.get_experiences()))
 
-        feed_dict = {self.model.ops_dict["input"]:np.stack(states, axis=0),
-                     self.model.ops_dict["valid_actions"]:np.stack(valid_actions, axis=0),
+    def evaluate(self, states, actions, valid_actions):
+        """
+        Computes the model's loss and accuracy (fraction of submitted actions ranked in the model's top 5) for the given inputs.
+        """
+        feed_dict = {self.model.ops_dict["input"]:states,
+                     self.model.ops_dict["valid_actions"]:valid_actions,
                      self.model.ops_dict["actions"]:actions}
         loss, train_probs = self.model.sess.run([self.model.ops_dict["loss"], self.model.ops_dict["probabilities"]], feed_dict=feed_dict)
 
         THRESHOLD = 5
-        accurate_predictions = 0
-        for k in range(len(states)):
-            probabilities = train_probs[k,:]
-            data = [(a, probabilities[a]) for a in range(len(probabilities))]
-            df = pd.DataFrame(data, columns=['act_id','prob'])
-
-            df.sort_values('prob',ascending=False,inplace=True)
-            df.reset_index(drop=True,inplace=True)
-            df['rank'] = df.index
-
-            submitted_action_id = actions[k]
-            submitted_row = df[df['act_id']==submitted_action_id]
-
-            rank = submitted_row['rank'].iloc[0]
-            if(rank < THRESHOLD):
-                accurate_predictions += 1
-
-        accuracy = accurate_predictions/len(states)
+        accuracy = metrics.top_k_accuracy(metrics.action_ranks(train_probs, actions), THRESHOLD)
         return (loss, accuracy)